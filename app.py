@@ -1,19 +1,36 @@
 """Aplicación FastAPI principal con endpoints de autenticación y transacciones.
 
 Cada función incluye comentarios explicando su propósito dentro del flujo 2PC.
+Todos los endpoints son `async`: el camino de `/transfer` espera a los
+participantes sin ocupar hilos y el resto de accesos bloqueantes (BD, reconciliación)
+se delega explícitamente al threadpool.
 """
 
-from fastapi import FastAPI, Depends, HTTPException, status, Header
+from fastapi import FastAPI, Depends, HTTPException, status, Header, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List
+from datetime import datetime
 from models import User, TransactionLog
 from database import init_db, DBSession
-from security import hash_password, verify_password, create_token, decode_token
-from config import get_settings
+from security import hash_password, create_token, decode_token, Principal, principal_cache, password_pool, PasswordPoolBusy
+from config import get_settings, RoutingError
 from transaction import TransactionService
+from participant import Deadline
+from participant_client import clients
+from coordinator_log import coordinator_log
+from reconciler import reconciler
+from health import health_monitor
+from balance_cache import balance_store
+from scheduler import scheduler, SchedulerSaturated
+from idempotency import idempotency_store, fingerprint, transfer_response, IdempotencyConflict, IdempotencyInProgress
+from redelivery import redelivery_queue
+from tx_stats import tx_stats
+import metrics
 import json
-import requests
+import time
 
 settings = get_settings()
 app = FastAPI(title="Distributed 2PC API", version="0.1.0")
@@ -37,25 +54,44 @@ class TransferPayload(BaseModel):
     from_account: int
     to_account: int
 
+class BatchTransferPayload(BaseModel):
+    """Payload para solicitar muchas transferencias en una sola ronda 2PC batch."""
+    transfers: List[TransferPayload]
+
 # ----------------------- Auth Dependencies -----------------------
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Obtiene el usuario autenticado a partir del token JWT o lanza 401."""
+# _load_principal: Busca el usuario del token en BD (se ejecuta en el threadpool).
+def _load_principal(username: str) -> Optional[Principal]:
+    with DBSession(readonly=True) as s:
+        user = s.query(User).filter(User.username == username).first()
+        return Principal(user.id, user.username, user.role) if user else None
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Principal:
+    """Obtiene el usuario autenticado a partir del token JWT o lanza 401.
+
+    Los tokens ya verificados se sirven desde `principal_cache` sin salir del
+    event loop; solo un fallo de caché consulta la BD en el threadpool.
+    """
+    started = time.perf_counter()
     token = credentials.credentials
+    cached = principal_cache.get(token)
+    if cached:
+        metrics.auth_seconds.observe(time.perf_counter() - started, source='cache')
+        return cached
     data = decode_token(token)
     if not data:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    username = data.get('sub')
-    with DBSession() as s:
-        user = s.query(User).filter(User.username == username).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+    principal = await run_in_threadpool(_load_principal, data.get('sub'))
+    if not principal:
+        raise HTTPException(status_code=401, detail="User not found")
+    principal_cache.put(token, principal, data.get('exp'))
+    metrics.auth_seconds.observe(time.perf_counter() - started, source='database')
+    return principal
 
 
 def require_role(role: str):
     """Genera dependencia que valida que el usuario tenga el rol requerido."""
-    def checker(user: User = Depends(get_current_user)):
+    async def checker(user: Principal = Depends(get_current_user)):
         if user.role != role:
             raise HTTPException(status_code=403, detail="Forbidden: insufficient role")
         return user
@@ -64,89 +100,333 @@ def require_role(role: str):
 # ------------------------- Startup Event -------------------------
 @app.on_event("startup")
 def on_startup():
-    """Inicializa la base de datos y crea usuario admin por defecto si falta."""
+    """Inicializa BD (migrando el JSON de participantes de filas antiguas y construyendo los
+    agregados de estadísticas si faltan), pools HTTP y log del coordinador, recupera transacciones
+    inconclusas (y las claves de idempotencia que quedaron en curso), arranca el reconciliador, el monitor de salud y el vigía de la tabla de ruteo y crea usuario admin por defecto si falta."""
     init_db()
+    TransactionService.migrate_participants()
+    tx_stats.ensure_built()
+    clients.start(settings.participants)
+    health_monitor.start(settings.participants)
+    settings.on_routing_reload(clients.start)
+    settings.on_routing_reload(health_monitor.start)
+    settings.start_routing_watcher()
+    password_pool.start()
+    coordinator_log.open()
+    TransactionService.recover()
+    idempotency_store.recover()
     with DBSession() as s:
         admin = s.query(User).filter(User.username == 'admin').first()
         if not admin:
             s.add(User(username='admin', password_hash=hash_password('admin'), role='admin'))
             s.commit()
+    reconciler.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Espera (acotado) la cola de reentrega, detiene reconciliador, vigía de ruteo y monitor de salud y cierra
+    conexiones, pool de hashing y log del coordinador."""
+    await redelivery_queue.stop()
+    reconciler.stop()
+    settings.stop_routing_watcher()
+    health_monitor.stop()
+    clients.close()
+    await clients.aclose()
+    password_pool.shutdown()
+    coordinator_log.close()
 
 # --------------------------- Auth Routes -------------------------
+# _find_user: Consulta un usuario por username (se ejecuta en el threadpool).
+def _find_user(username: str) -> Optional[User]:
+    with DBSession(readonly=True) as s:
+        return s.query(User).filter(User.username == username).first()
+
+# _password_op: Ejecuta una operación bcrypt en el pool de procesos o responde 503 si está saturado
+# (o si se recreó porque un proceso trabajador murió).
+async def _password_op(coro):
+    try:
+        return await coro
+    except PasswordPoolBusy:
+        raise HTTPException(status_code=503, detail="Authentication busy, retry later", headers={"Retry-After": "1"})
+
 @app.post('/auth/register')
-def register(payload: RegisterPayload, admin: User = Depends(require_role('admin'))):
+async def register(payload: RegisterPayload, admin: Principal = Depends(require_role('admin'))):
     """Registra un nuevo usuario (solo accesible para rol admin)."""
-    with DBSession() as s:
-        existing = s.query(User).filter(User.username == payload.username).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Username already exists")
-        u = User(username=payload.username, password_hash=hash_password(payload.password), role=payload.role)
-        s.add(u)
-        s.commit()
-        s.refresh(u)
-        return {"id": u.id, "username": u.username, "role": u.role}
+    if await run_in_threadpool(_find_user, payload.username):
+        raise HTTPException(status_code=400, detail="Username already exists")
+    password_hash = await _password_op(password_pool.hash(payload.password))
+
+    def _insert():
+        with DBSession() as s:
+            existing = s.query(User).filter(User.username == payload.username).first()
+            if existing:
+                raise HTTPException(status_code=400, detail="Username already exists")
+            u = User(username=payload.username, password_hash=password_hash, role=payload.role)
+            s.add(u)
+            s.commit()
+            s.refresh(u)
+            return {"id": u.id, "username": u.username, "role": u.role}
+
+    result = await run_in_threadpool(_insert)
+    principal_cache.invalidate_user(payload.username)
+    return result
 
 @app.post('/auth/login')
-def login(payload: LoginPayload):
-    """Autentica usuario y devuelve token JWT para futuras peticiones."""
-    with DBSession() as s:
-        user = s.query(User).filter(User.username == payload.username).first()
-        if not user or not verify_password(payload.password, user.password_hash):
-            raise HTTPException(status_code=401, detail="Invalid credentials")
-        token = create_token(user.username, user.role)
-        return {"access_token": token, "token_type": "bearer"}
+async def login(payload: LoginPayload):
+    """Autentica usuario y devuelve token JWT para futuras peticiones.
+
+    La verificación bcrypt corre en `password_pool`, fuera del threadpool de FastAPI.
+    """
+    user = await run_in_threadpool(_find_user, payload.username)
+    if not user or not await _password_op(password_pool.verify(payload.password, user.password_hash)):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    token = create_token(user.username, user.role)
+    return {"access_token": token, "token_type": "bearer"}
 
 # ----------------------- Transaction Endpoints -------------------
 @app.post('/transfer')
-def transfer(payload: TransferPayload, user: User = Depends(get_current_user)):
-    """Inicia una transferencia distribuida aplicando protocolo 2PC."""
+async def transfer(payload: TransferPayload, response: Response, user: Principal = Depends(get_current_user),
+                   idempotency_key: Optional[str] = Header(None, alias='Idempotency-Key', max_length=255),
+                   deadline_ms: Optional[int] = Header(None, alias='X-Deadline-Ms', gt=0)):
+    """Inicia una transferencia distribuida aplicando protocolo 2PC (sin bloquear un hilo mientras espera).
+
+    Con `Idempotency-Key` los reintentos del cliente no inician otra ronda 2PC:
+    un duplicado concurrente espera el resultado de la transferencia en curso y
+    uno posterior recibe el resultado registrado (cabecera `Idempotency-Replayed`).
+    Reusar la clave con otro payload responde 422.
+
+    Las transferencias pasan por el planificador por cuenta: las que comparten
+    cuenta se ejecutan una tras otra y, si la cola está llena, se responde 429
+    con `Retry-After`. Con entrega asíncrona las cuentas siguen ocupadas hasta
+    que los participantes confirman la decisión.
+
+    `X-Deadline-Ms` fija el presupuesto de tiempo de la transferencia (por
+    defecto TX_DEADLINE_MS, tope TX_DEADLINE_MAX_MS); corre desde que llega la
+    petición, así que la espera en el planificador también lo consume. Con
+    DECISION_DELIVERY=async la respuesta sale al registrar la decisión y los
+    participantes READY figuran con commit_status PENDING hasta confirmar.
+    """
     if payload.amount <= 0:
         raise HTTPException(status_code=400, detail="Amount must be positive")
-    log = TransactionService.start_transfer(payload.amount, payload.from_account, payload.to_account)
-    return {"tx_id": log.tx_id, "status": log.status, "participants": json.loads(log.participants)}
+    budget = min(deadline_ms / 1000, settings.tx_deadline_max) if deadline_ms else settings.tx_deadline
+    deadline = Deadline(budget)
+
+    async def run(tx_id: Optional[str] = None) -> dict:
+        try:
+            log = await scheduler.submit(
+                (payload.from_account, payload.to_account),
+                lambda: TransactionService.start_transfer(
+                    payload.amount, payload.from_account, payload.to_account, tx_id, deadline
+                ),
+                hold=lambda log: redelivery_queue.task(log.tx_id),
+            )
+        except SchedulerSaturated as e:
+            raise HTTPException(status_code=429, detail=f"Too many pending transfers ({e.reason})",
+                                headers={"Retry-After": str(e.retry_after)})
+        except RoutingError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return transfer_response(log)
+
+    if not idempotency_key:
+        return await run()
+    try:
+        result, replayed = await idempotency_store.execute(
+            str(user.id), idempotency_key, fingerprint(payload.model_dump()), run
+        )
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key already used with a different payload")
+    except IdempotencyInProgress as e:
+        raise HTTPException(status_code=409, detail={"message": "Request with this Idempotency-Key is still in progress",
+                                                     "tx_id": e.tx_id or None}, headers={"Retry-After": "1"})
+    if replayed:
+        response.headers["Idempotency-Replayed"] = "true"
+    return result
+
+@app.post('/transfer/batch')
+async def transfer_batch(payload: BatchTransferPayload, user: Principal = Depends(get_current_user)):
+    """Inicia un lote de transferencias con un PREPARE/COMMIT por participante."""
+    if not payload.transfers:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(payload.transfers) > settings.batch_max_size:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {settings.batch_max_size} transfers")
+    invalid = [i for i, t in enumerate(payload.transfers) if t.amount <= 0]
+    if invalid:
+        raise HTTPException(status_code=400, detail={"message": "Amount must be positive", "indexes": invalid})
+    try:
+        logs = await run_in_threadpool(
+            TransactionService.start_batch, [(t.amount, t.from_account, t.to_account) for t in payload.transfers]
+        )
+    except RoutingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    committed = sum(1 for log in logs if log.status == 'COMMITTED')
+    aborted = sum(1 for log in logs if log.status == 'ABORTED')
+    return {
+        "count": len(logs),
+        "committed": committed,
+        "aborted": aborted,
+        "in_doubt": len(logs) - committed - aborted,
+        "results": [{"tx_id": log.tx_id, "status": log.status, "participants": log.participant_states()} for log in logs],
+    }
+
+# _export_lines: Serializa cada transacción como una línea NDJSON a medida que se lee.
+def _export_lines(status_filter: Optional[str], since: Optional[datetime], until: Optional[datetime]):
+    for r in TransactionService.iter_transactions(settings.export_chunk_size, status_filter, since, until):
+        yield json.dumps({
+            "id": r.id,
+            "tx_id": r.tx_id,
+            "status": r.status,
+            "created_at": r.created_at.isoformat(),
+            "updated_at": r.updated_at.isoformat(),
+            "participants": r.participant_states(),
+        }) + "\n"
+
+@app.get('/transactions/export')
+async def export_tx(status: Optional[str] = None, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                    user: Principal = Depends(get_current_user)):
+    """Exporta el historial completo como NDJSON en streaming (memoria constante)."""
+    return StreamingResponse(_export_lines(status, since, until), media_type="application/x-ndjson")
+
+@app.get('/transactions/participants')
+async def list_participant_outcomes(response: Response, limit: int = 50, cursor: Optional[int] = None,
+                                    participant: Optional[str] = None, prepare_status: Optional[str] = None,
+                                    commit_status: Optional[str] = None, error_class: Optional[str] = None,
+                                    since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                    user: Principal = Depends(get_current_user)):
+    """Lista resultados por participante (p.ej. `?participant=bank_b&prepare_status=UNREACHABLE`).
+
+    Filtra por participante, estado de PREPARE/COMMIT, clase de error y rango
+    de fechas; pagina con `cursor` y la cabecera `X-Next-Cursor` como `/transactions`.
+    """
+    limit = max(1, min(limit, settings.list_max_limit))
+    rows = await run_in_threadpool(TransactionService.list_outcomes, limit, cursor, participant,
+                                   prepare_status, commit_status, error_class, since, until)
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return [{
+        "id": r.id,
+        "tx_id": r.tx_id,
+        "participant": r.participant,
+        "role": r.role,
+        "prepare_status": r.prepare_status,
+        "commit_status": r.commit_status,
+        "error": r.error,
+        "error_class": r.error_class,
+        "created_at": r.created_at,
+    } for r in rows]
+
+@app.get('/transactions/participants/stats')
+async def participant_outcome_stats(participant: Optional[str] = None, since: Optional[datetime] = None,
+                                    until: Optional[datetime] = None, user: Principal = Depends(get_current_user)):
+    """Conteos por participante de estados de PREPARE, de COMMIT y clases de error."""
+    return await run_in_threadpool(TransactionService.outcome_stats, participant, since, until)
+
+@app.get('/transactions/stats')
+async def transaction_stats(buckets: int = 60, user: Principal = Depends(get_current_user)):
+    """Conteos por estado, throughput por bucket de tiempo, tasa de aborto por participante y
+    percentiles de latencia.
+
+    Se sirve de los agregados que se actualizan con cada escritura del log (tiempo
+    constante respecto del tamaño del log); `buckets` se acota a STATS_MAX_BUCKETS.
+    """
+    return await run_in_threadpool(tx_stats.snapshot, max(1, min(buckets, settings.stats_max_buckets)))
 
 @app.get('/transactions/{tx_id}')
-def get_tx(tx_id: str, user: User = Depends(get_current_user)):
-    """Recupera detalle de una transacción específica por su tx_id."""
-    log = TransactionService.get_transaction(tx_id)
+async def get_tx(tx_id: str, user: Principal = Depends(get_current_user)):
+    """Recupera detalle de una transacción específica por su tx_id (con su desglose de tiempos si existe)."""
+    log = await run_in_threadpool(TransactionService.get_transaction, tx_id)
     if not log:
         raise HTTPException(status_code=404, detail="Not found")
-    return {"tx_id": log.tx_id, "status": log.status, "participants": json.loads(log.participants)}
+    return {
+        "tx_id": log.tx_id,
+        "status": log.status,
+        "participants": log.participant_states(),
+        "timings": json.loads(log.timings) if log.timings else None,
+    }
 
 @app.get('/transactions')
-def list_tx(limit: int = 50, user: User = Depends(get_current_user)):
-    """Lista transacciones recientes mostrando estado general."""
-    rows = TransactionService.list_transactions(limit)
-    return [{"tx_id": r.tx_id, "status": r.status} for r in rows]
+async def list_tx(response: Response, limit: int = 50, cursor: Optional[int] = None, status: Optional[str] = None,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None,
+                  user: Principal = Depends(get_current_user)):
+    """Lista transacciones de la más reciente a la más antigua mostrando estado general.
+
+    Filtra opcionalmente por estado y rango de fechas; si hay más filas, la
+    cabecera `X-Next-Cursor` indica el valor de `cursor` para la página siguiente.
+    """
+    limit = max(1, min(limit, settings.list_max_limit))
+    rows = await run_in_threadpool(TransactionService.list_transactions, limit, cursor, status, since, until)
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return [{"id": r.id, "tx_id": r.tx_id, "status": r.status, "created_at": r.created_at} for r in rows]
 
 @app.post('/admin/reconcile')
-def reconcile(admin: User = Depends(require_role('admin'))):
-    """Ejecuta reconciliación para abortar transacciones PREPARED antiguas."""
-    actions = TransactionService.reconcile_stuck()
-    return {"performed": actions}
+async def reconcile(admin: Principal = Depends(require_role('admin'))):
+    """Ejecuta de inmediato una pasada de reconciliación de transacciones PREPARED antiguas."""
+    result = await run_in_threadpool(reconciler.run_once)
+    return {"performed": result.pop('actions'), "pass": result}
+
+@app.get('/admin/routing')
+async def routing_table(admin: Principal = Depends(require_role('admin'))):
+    """Tabla de ruteo cuenta -> participante vigente."""
+    return settings.current_routing().describe()
+
+@app.post('/admin/routing/reload')
+async def reload_routing(admin: Principal = Depends(require_role('admin'))):
+    """Relee el archivo de participantes y su tabla de ruteo sin reiniciar.
+
+    Los participantes nuevos se registran en el monitor de salud y en los pools
+    HTTP (como en la recarga periódica); si el archivo es inválido se conserva la tabla anterior (400).
+    """
+    try:
+        reloaded = await run_in_threadpool(settings.reload_routing, True)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Routing table not reloaded: {e}")
+    return {"reloaded": reloaded, "routing": settings.routing.describe()}
+
+@app.post('/admin/stats/rebuild')
+async def rebuild_stats(admin: Principal = Depends(require_role('admin'))):
+    """Recalcula los agregados de /transactions/stats desde el log de transacciones.
+
+    Recorre `TransactionLog` sobre una instantánea de lectura; las
+    transferencias solo esperan el reemplazo final de los contadores.
+    """
+    scanned = await run_in_threadpool(tx_stats.rebuild)
+    return {"rebuilt_from": scanned}
 
 # -------------------------- Utility ------------------------------
 @app.get('/health')
-def health():
-    """Verificación básica de salud y número de participantes configurados."""
+async def health():
+    """Verificación básica de salud, número de participantes y su último estado conocido.
+
+    El estado de los participantes proviene del monitor en segundo plano; este
+    endpoint no los contacta.
+    """
     return {
         "status": "ok",
-        "participants_configured": len(settings.participants)
+        "participants_configured": len(settings.participants),
+        "participants": health_monitor.snapshot(),
+        "auth_cache": principal_cache.stats(),
+        "password_pool": password_pool.stats(),
+        "coordinator_log": coordinator_log.stats(),
+        "reconciler": reconciler.stats(),
+        "idempotency": idempotency_store.stats(),
+        "scheduler": scheduler.stats(),
+        "redelivery": redelivery_queue.stats(),
     }
 
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Métricas en formato de exposición de Prometheus (latencias por fase, reintentos, resultados, BD)."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 # -------------------------- Balance ------------------------------
 @app.get('/balance/{account_id}')
-def balance(account_id: int, user: User = Depends(get_current_user)):
-    """Consulta de balance (placeholder) intentando alcanzar algún participante.
+async def balance(account_id: int, user: Principal = Depends(get_current_user)):
+    """Consulta de balance a través del caché por niveles (memoria -> BalanceCache -> participantes).
 
-    Regresa advertencia si los servicios aún no implementan endpoint real.
+    Indica la antigüedad del dato y si está vencido (`stale`); los valores
+    vencidos se revalidan en segundo plano.
     """
-    errors = []
-    for p in settings.participants:
-        try:
-            resp = requests.get(f"{p['url']}/health", timeout=settings.request_timeout)
-            if resp.status_code == 200:
-                return {"account_id": account_id, "source": p['name'], "reachable": True, "warning": "Balance endpoint not implemented on participant"}
-        except Exception as e:
-            errors.append({"participant": p['name'], "error": str(e)})
-    raise HTTPException(status_code=503, detail={"message": "No participant reachable", "errors": errors})
+    result = await run_in_threadpool(balance_store.get, account_id)
+    if result is None:
+        raise HTTPException(status_code=503, detail={"message": "Balance unavailable: no cached value and no participant answered"})
+    return result
@@ -0,0 +1,172 @@
+"""Caché de balances por niveles.
+
+Orden de consulta: LRU acotado en memoria -> tabla `BalanceCache` -> participantes
+(`GET /balance/{account_id}`). Las entradas más jóvenes que `fresh_ttl` se
+sirven tal cual; las más viejas se sirven marcadas como `stale` con su edad
+mientras se revalidan en segundo plano (stale-while-revalidate). Si ningún
+participante responde, se devuelve el último valor conocido aunque haya vencido.
+Los participantes marcados como caídos por el monitor de salud no se consultan.
+El caché se alimenta también con los saldos que informan los participantes al
+confirmar transferencias.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlmodel import select
+from config import get_settings
+from database import DBSession
+from models import BalanceCache
+from participant_client import clients
+from health import health_monitor
+
+settings = get_settings()
+
+class BalanceStore:
+    """Caché LRU en memoria respaldado por la tabla BalanceCache."""
+    def __init__(self, max_size: int, fresh_ttl: float, max_stale: float):
+        self.max_size = max_size
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        # account_id -> (balance, source, updated_at epoch)
+        self._entries: "OrderedDict[int, Tuple[float, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing: set = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='balance-refresh')
+
+    # get: Devuelve el balance con su antigüedad, revalidando en segundo plano si está vencido.
+    # Retorna None solo si no hay valor en ningún nivel ni participante que responda.
+    def get(self, account_id: int) -> Optional[Dict]:
+        entry, tier = self._memory_get(account_id), 'memory'
+        if entry is None:
+            entry, tier = self._db_get(account_id), 'database'
+            if entry is not None:
+                self._memory_put(account_id, *entry)
+        age = time.time() - entry[2] if entry else None
+        if entry is None or age >= self.max_stale:
+            fetched = self.refresh(account_id)
+            if fetched is not None:
+                return fetched
+            if entry is None:
+                return None
+        elif age >= self.fresh_ttl:
+            self._schedule_refresh(account_id)
+        return self._view(account_id, entry, tier)
+
+    # refresh: Consulta a los participantes y actualiza ambos niveles. None si nadie respondió.
+    def refresh(self, account_id: int) -> Optional[Dict]:
+        for p in self._sources(account_id):
+            try:
+                resp = clients.get(p['url']).get(f"/balance/{account_id}")
+                if resp.status_code != 200:
+                    continue
+                data = resp.json()
+                if data.get('balance') is None:
+                    continue
+            except Exception:
+                continue
+            self.put(account_id, float(data['balance']), p['name'])
+            return self._view(account_id, self._memory_get(account_id), 'participant')
+        return None
+
+    # put: Registra un balance conocido en memoria; la tabla BalanceCache se
+    # actualiza en segundo plano para no sumar un commit al camino de /transfer.
+    def put(self, account_id: int, balance: float, source: str):
+        now = time.time()
+        self._memory_put(account_id, balance, source, now)
+        self._executor.submit(self._db_put, account_id, balance, source, now)
+
+    # _db_put: Inserta o actualiza la fila de BalanceCache de la cuenta.
+    def _db_put(self, account_id: int, balance: float, source: str, now: float):
+        with DBSession() as s:
+            row = s.exec(select(BalanceCache).where(BalanceCache.account_id == account_id)).first()
+            if row is None:
+                row = BalanceCache(account_id=account_id, last_known_balance=balance, source=source)
+            row.last_known_balance = balance
+            row.source = source
+            row.updated_at = datetime.utcfromtimestamp(now)
+            s.add(row)
+            s.commit()
+
+    # invalidate: Marca como vencidas las cuentas cuyo saldo cambió sin conocerse el nuevo valor.
+    def invalidate(self, account_ids: List[int]):
+        with self._lock:
+            for account_id in account_ids:
+                entry = self._entries.get(account_id)
+                if entry is not None:
+                    self._entries[account_id] = (entry[0], entry[1], 0.0)
+
+    # learn_from_transfer: Actualiza el caché tras una transferencia confirmada.
+    # Usa el saldo que informó cada participante; si no lo informó, invalida la cuenta.
+    def learn_from_transfer(self, participants, from_account: int, to_account: int):
+        known = set()
+        for p in participants:
+            account = from_account if p.role == 'debit' else to_account if p.role == 'credit' else None
+            if account is not None and p.balance is not None:
+                self.put(account, float(p.balance), p.name)
+                known.add(account)
+        self.invalidate([a for a in (from_account, to_account) if a not in known])
+
+    # _sources: Participantes disponibles a consultar: el dueño de la cuenta según la tabla
+    # de ruteo y luego los mirrors (sin ruteo, todos con los mirrors al final).
+    def _sources(self, account_id: int) -> List[Dict[str, str]]:
+        return [p for p in settings.current_routing().sources(account_id) if health_monitor.is_available(p['url'])]
+
+    # _schedule_refresh: Lanza una revalidación en segundo plano (una por cuenta a la vez).
+    def _schedule_refresh(self, account_id: int):
+        with self._lock:
+            if account_id in self._refreshing:
+                return
+            self._refreshing.add(account_id)
+
+        def _run():
+            try:
+                self.refresh(account_id)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(account_id)
+
+        self._executor.submit(_run)
+
+    # _view: Construye la respuesta con antigüedad e indicador stale.
+    def _view(self, account_id: int, entry: Tuple[float, str, float], tier: str) -> Dict:
+        age = max(0.0, time.time() - entry[2])
+        return {
+            "account_id": account_id,
+            "balance": entry[0],
+            "source": entry[1],
+            "tier": tier,
+            "age_seconds": round(age, 3),
+            "stale": age >= self.fresh_ttl,
+        }
+
+    # _memory_get: Lectura del nivel en memoria (actualiza el orden LRU).
+    def _memory_get(self, account_id: int) -> Optional[Tuple[float, str, float]]:
+        with self._lock:
+            entry = self._entries.get(account_id)
+            if entry is not None:
+                self._entries.move_to_end(account_id)
+            return entry
+
+    # _memory_put: Escritura en memoria con desalojo LRU.
+    def _memory_put(self, account_id: int, balance: float, source: str, updated_at: float):
+        with self._lock:
+            self._entries[account_id] = (balance, source, updated_at)
+            self._entries.move_to_end(account_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # _db_get: Lectura del nivel persistente.
+    def _db_get(self, account_id: int) -> Optional[Tuple[float, str, float]]:
+        with DBSession(readonly=True) as s:
+            row = s.exec(select(BalanceCache).where(BalanceCache.account_id == account_id)).first()
+            if row is None:
+                return None
+            updated = (row.updated_at - datetime(1970, 1, 1)).total_seconds()
+            return row.last_known_balance, row.source, updated
+
+# Instancia compartida por /balance y el servicio de transacciones.
+balance_store = BalanceStore(settings.balance_cache_size, settings.balance_fresh_sec, settings.balance_max_stale_sec)
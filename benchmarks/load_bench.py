@@ -0,0 +1,347 @@
+"""Benchmark de carga del coordinador contra participantes simulados.
+
+Levanta N participantes `benchmarks.stub_bank` y el coordinador (`uvicorn
+app:app`) en procesos aparte, con una base de datos y un log del coordinador
+temporales, y genera carga sobre `/transfer`, `/transactions` y `/auth/login`
+con la concurrencia indicada. Reporta throughput y latencias p50/p95/p99 por
+endpoint y por fase 2PC (prepare, decide, commit, rollback), estas últimas
+calculadas con los instantes de llegada/respuesta que registran los
+participantes simulados, además de mensajes por transferencia (según esos
+eventos) y fsyncs del log del coordinador por transferencia (según `/health`).
+Los modos de protocolo se eligen con las variables del coordinador
+(`TPC_ONE_PHASE`, `TPC_READ_ONLY`, `TPC_PRESUMED_ABORT`). Con `--routing hash`
+los participantes son dueños de cuentas (`cuenta % N`) y cada transferencia
+contacta solo a los dueños de sus cuentas en vez de a todos.
+
+La secuencia de peticiones puede grabarse (`--record`) o reproducirse
+(`--replay`) como JSONL, una operación por línea, para comparar corridas con
+exactamente la misma mezcla. Con `--target` se usa un coordinador ya en
+marcha y no se levantan procesos (sin métricas por fase). Las variables de
+entorno del coordinador (p.ej. `DB_TUNING=false`) se heredan del shell.
+
+Uso (desde la raíz del proyecto):
+  python -m benchmarks.load_bench --participants 2 --latency-ms 5 --jitter-ms 2 \\
+      --concurrency 64 --seconds 15 --mix transfer=8,transactions=1,login=1 --json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+ENDPOINTS = {'transfer': '/transfer', 'transactions': '/transactions', 'login': '/auth/login'}
+ROLES = ('debit', 'credit')
+
+# percentiles: Resumen de una lista de latencias en segundos (ms en el resultado).
+def percentiles(samples: List[float], elapsed: Optional[float] = None) -> Dict[str, float]:
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def rank(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    result = {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+        'p50_ms': rank(0.50),
+        'p95_ms': rank(0.95),
+        'p99_ms': rank(0.99),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+    if elapsed:
+        result['throughput_rps'] = round(len(ordered) / elapsed, 1)
+    return result
+
+# parse_mix: Convierte "transfer=8,transactions=1" en pesos por operación.
+def parse_mix(raw: str) -> Dict[str, float]:
+    mix = {}
+    for part in raw.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Operación desconocida en --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+# generate_ops: Secuencia infinita de operaciones aleatorias según la mezcla.
+def generate_ops(mix: Dict[str, float], accounts: int, seed: Optional[int]) -> Iterator[dict]:
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    while True:
+        op = rng.choices(names, weights)[0]
+        if op == 'transfer':
+            src = rng.randint(1, accounts)
+            dst = rng.randint(1, accounts - 1) if accounts > 1 else src
+            if accounts > 1 and dst >= src:
+                dst += 1
+            yield {'op': op, 'amount': round(rng.uniform(1, 100), 2), 'from_account': src, 'to_account': dst}
+        elif op == 'transactions':
+            yield {'op': op, 'limit': 50}
+        else:
+            yield {'op': op}
+
+# load_ops: Lee una mezcla grabada (JSONL, una operación por línea).
+def load_ops(path: Path) -> Iterator[dict]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+# _wait_ready: Espera a que una URL responda 200 en /health.
+def _wait_ready(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"{url} no respondió en {timeout}s")
+
+# start_stack: Lanza participantes simulados y coordinador. Retorna (procesos, url, urls de stubs).
+def start_stack(args, workdir: Path):
+    procs, stub_urls, participants = [], [], []
+    for i in range(args.participants):
+        port = args.base_port + 1 + i
+        if args.routing == 'hash':
+            role = 'owner'
+        else:
+            role = ROLES[i] if i < len(ROLES) else 'mirror'
+        name = f"stub_{i}"
+        cmd = [
+            sys.executable, '-m', 'benchmarks.stub_bank', '--name', name, '--role', role, '--port', str(port),
+            '--latency-ms', str(args.latency_ms), '--jitter-ms', str(args.jitter_ms),
+            '--abort-rate', str(args.abort_rate), '--crash-rate', str(args.crash_rate),
+            '--crash-downtime', str(args.crash_downtime),
+        ]
+        if args.seed is not None:
+            cmd += ['--seed', str(args.seed + i)]
+        procs.append(subprocess.Popen(cmd, cwd=ROOT))
+        url = f"http://127.0.0.1:{port}"
+        stub_urls.append(url)
+        participants.append(f"{name}|{url}|{role}")
+    env = dict(os.environ)
+    env.update({
+        'BANK_PARTICIPANTS': ','.join(participants),
+        'TX_DB_URL': f"sqlite:///{workdir / 'bench.db'}",
+        'COORD_LOG_PATH': str(workdir / 'coordinator.wal'),
+    })
+    if args.routing == 'hash':
+        nodes = [dict(zip(('name', 'url', 'role'), p.split('|'))) for p in participants]
+        routing_file = workdir / 'participants.json'
+        routing_file.write_text(json.dumps({
+            'participants': nodes,
+            'routing': {'hash': [n['name'] for n in nodes]},
+        }), encoding='utf-8')
+        env.pop('BANK_PARTICIPANTS')
+        env['PARTICIPANTS_FILE'] = str(routing_file)
+    procs.append(subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app:app', '--port', str(args.base_port), '--log-level', 'warning'],
+        cwd=ROOT, env=env,
+    ))
+    for url in stub_urls:
+        _wait_ready(url)
+    coordinator = f"http://127.0.0.1:{args.base_port}"
+    _wait_ready(coordinator)
+    return procs, coordinator, stub_urls
+
+# stop_stack: Termina los procesos lanzados.
+def stop_stack(procs: List[subprocess.Popen]):
+    for p in procs:
+        p.terminate()
+    for p in procs:
+        try:
+            p.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+# _execute: Ejecuta una operación y retorna (ok, tx_id, status de la transferencia).
+async def _execute(client: httpx.AsyncClient, op: dict, headers: dict, creds: dict):
+    kind = op['op']
+    if kind == 'transfer':
+        payload = {k: op[k] for k in ('amount', 'from_account', 'to_account')}
+        resp = await client.post(ENDPOINTS[kind], json=payload, headers=headers)
+        body = resp.json() if resp.status_code == 200 else {}
+        return resp.status_code == 200, body.get('tx_id'), body.get('status') or f"HTTP {resp.status_code}"
+    if kind == 'transactions':
+        resp = await client.get(ENDPOINTS[kind], params={'limit': op.get('limit', 50)}, headers=headers)
+        return resp.status_code == 200, None, None
+    resp = await client.post(ENDPOINTS[kind], json=creds)
+    return resp.status_code == 200, None, None
+
+# drive: Ejecuta las operaciones con `concurrency` trabajadores hasta agotar tiempo u operaciones.
+async def drive(target: str, ops: Iterator[dict], args, record) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    creds = {'username': args.username, 'password': args.password}
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    outcomes: Dict[str, int] = defaultdict(int)
+    transfers: Dict[str, tuple] = {}
+    issued = 0
+    async with httpx.AsyncClient(base_url=target, timeout=args.timeout, limits=limits) as client:
+        resp = await client.post(ENDPOINTS['login'], json=creds)
+        resp.raise_for_status()
+        headers = {'Authorization': f"Bearer {resp.json()['access_token']}"}
+        started = time.perf_counter()
+        deadline = started + args.seconds if args.seconds else None
+
+        async def worker():
+            nonlocal issued
+            while True:
+                if deadline and time.perf_counter() >= deadline:
+                    return
+                if args.requests and issued >= args.requests:
+                    return
+                op = next(ops, None)
+                if op is None:
+                    return
+                issued += 1
+                if record:
+                    record.write(json.dumps(op) + '\n')
+                endpoint = ENDPOINTS[op['op']]
+                t0, wall0 = time.perf_counter(), time.time()
+                try:
+                    ok, tx_id, outcome = await _execute(client, op, headers, creds)
+                except httpx.HTTPError as e:
+                    ok, tx_id, outcome = False, None, type(e).__name__
+                elapsed = time.perf_counter() - t0
+                latencies[endpoint].append(elapsed)
+                if not ok:
+                    errors[endpoint] += 1
+                if op['op'] == 'transfer':
+                    outcomes[outcome] += 1
+                    if tx_id:
+                        transfers[tx_id] = (wall0, wall0 + elapsed)
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    endpoints = {}
+    for endpoint, samples in latencies.items():
+        endpoints[endpoint] = percentiles(samples, elapsed)
+        endpoints[endpoint]['errors'] = errors[endpoint]
+    return {
+        'seconds': round(elapsed, 2),
+        'requests': issued,
+        'throughput_rps': round(issued / elapsed, 1) if elapsed else 0.0,
+        'endpoints': endpoints,
+        'outcomes': dict(outcomes),
+        '_transfers': transfers,
+    }
+
+# phase_breakdown: Latencia por fase 2PC a partir de los eventos de los participantes.
+# prepare/commit/rollback: de la primera llegada a la última respuesta de ese mensaje;
+# decide: hueco entre el último voto y el primer COMMIT/ROLLBACK (log del coordinador).
+def phase_breakdown(stub_urls: List[str], transfers: Dict[str, tuple]) -> dict:
+    spans: Dict[str, Dict[str, list]] = defaultdict(lambda: defaultdict(lambda: [float('inf'), 0.0]))
+    crashes, messages = 0, 0
+    for url in stub_urls:
+        data = httpx.get(f"{url}/bench/events", timeout=30).json()
+        crashes += data.get('crashes', 0)
+        for tx_id, kind, recv, done in data['events']:
+            if tx_id not in transfers:
+                continue
+            span = spans[tx_id][kind]
+            span[0], span[1] = min(span[0], recv), max(span[1], done)
+            messages += 1
+    phases: Dict[str, List[float]] = defaultdict(list)
+    for tx_id, kinds in spans.items():
+        for kind, (first, last) in kinds.items():
+            phases[kind].append(last - first)
+        second = kinds.get('commit') or kinds.get('rollback')
+        if 'prepare' in kinds and second:
+            phases['decide'].append(max(0.0, second[0] - kinds['prepare'][1]))
+    result = {kind: percentiles(samples) for kind, samples in phases.items()}
+    per_transfer = round(messages / len(transfers), 2) if transfers else 0.0
+    return {'phases': result, 'participant_crashes': crashes, 'messages_per_transfer': per_transfer}
+
+# _wal_fsyncs: fsyncs realizados por el log del coordinador (None si /health no responde).
+def _wal_fsyncs(target: str) -> Optional[int]:
+    try:
+        return httpx.get(f"{target}/health", timeout=10).json()['coordinator_log']['fsyncs']
+    except (httpx.HTTPError, KeyError, ValueError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--participants', type=int, default=2)
+    parser.add_argument('--latency-ms', type=float, default=5)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--abort-rate', type=float, default=0)
+    parser.add_argument('--crash-rate', type=float, default=0)
+    parser.add_argument('--crash-downtime', type=float, default=1.0)
+    parser.add_argument('--routing', choices=('broadcast', 'hash'), default='broadcast',
+                        help='broadcast: todos los participantes en cada transferencia; hash: solo los dueños')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=None,
+                        help='Duración (por defecto 10; sin límite de tiempo con --requests o --replay)')
+    parser.add_argument('--requests', type=int, default=0, help='Máximo de peticiones (0 = sin límite)')
+    parser.add_argument('--mix', default='transfer=8,transactions=1,login=1')
+    parser.add_argument('--accounts', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--base-port', type=int, default=9300)
+    parser.add_argument('--target', default=None, help='URL de un coordinador ya en marcha (no lanza procesos)')
+    parser.add_argument('--record', type=Path, default=None, help='Graba la secuencia de operaciones en JSONL')
+    parser.add_argument('--replay', type=Path, default=None, help='Reproduce una secuencia grabada en JSONL')
+    parser.add_argument('--json', action='store_true', help='Imprime resultados como JSON')
+    parser.add_argument('--output', type=Path, default=None, help='Escribe los resultados JSON en un archivo')
+    args = parser.parse_args()
+
+    if args.seconds is None:
+        args.seconds = 0 if (args.requests or args.replay) else 10
+    ops = load_ops(args.replay) if args.replay else generate_ops(parse_mix(args.mix), args.accounts, args.seed)
+    record = open(args.record, 'w', encoding='utf-8') if args.record else None
+    with tempfile.TemporaryDirectory() as tmp:
+        procs: List[subprocess.Popen] = []
+        try:
+            if args.target:
+                target, stub_urls = args.target.rstrip('/'), []
+            else:
+                procs, target, stub_urls = start_stack(args, Path(tmp))
+            fsyncs_before = _wal_fsyncs(target)
+            result = asyncio.run(drive(target, ops, args, record))
+            transfers = result.pop('_transfers')
+            fsyncs_after = _wal_fsyncs(target)
+            if transfers and fsyncs_before is not None and fsyncs_after is not None:
+                result['fsyncs_per_transfer'] = round((fsyncs_after - fsyncs_before) / len(transfers), 3)
+            if stub_urls:
+                result.update(phase_breakdown(stub_urls, transfers))
+        finally:
+            stop_stack(procs)
+            if record:
+                record.close()
+    result['config'] = {
+        k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items() if k not in ('json', 'output')
+    }
+    if args.output:
+        args.output.write_text(json.dumps(result, indent=2), encoding='utf-8')
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['requests']} peticiones en {result['seconds']}s ({result['throughput_rps']} req/s)")
+    for name, stats in sorted(result['endpoints'].items()):
+        print(f"  {name:<15} n={stats['count']:<7} p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms "
+              f"p99={stats['p99_ms']}ms errors={stats['errors']}")
+    for name, stats in sorted(result.get('phases', {}).items()):
+        print(f"  fase {name:<10} n={stats['count']:<7} p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms")
+    print(f"  resultados: {result['outcomes']}")
+    if 'messages_per_transfer' in result or 'fsyncs_per_transfer' in result:
+        print(f"  mensajes/transferencia: {result.get('messages_per_transfer')} "
+              f"fsyncs/transferencia: {result.get('fsyncs_per_transfer')}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Benchmark de almacenamiento: throughput mixto lectura/escritura en SQLite.
+
+Compara el motor por defecto (journal rollback, un solo pool, solo índice en
+tx_id) contra la configuración de `database.create_engines` (WAL, pools de
+lectura/escritura separados e índices compuestos). Los escritores insertan
+filas de `TransactionLog` con un commit por fila, como `/transfer`; los
+lectores alternan el listado de `/transactions` y la consulta de
+reconciliación por (status, created_at).
+
+Uso (desde la raíz del proyecto):
+  python -m benchmarks.storage_bench --writers 4 --readers 8 --seconds 10 [--json]
+"""
+
+import argparse
+import json
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlalchemy import text
+from sqlmodel import SQLModel, Session, select
+from database import create_engines
+from models import TransactionLog
+
+# _prepare_db: Crea el esquema; en modo baseline reproduce los índices originales.
+def _prepare_db(write_engine, baseline: bool, seed_rows: int):
+    SQLModel.metadata.create_all(write_engine)
+    with write_engine.begin() as conn:
+        if baseline:
+            conn.execute(text('DROP INDEX IF EXISTS ix_transactionlog_status_created_at'))
+            conn.execute(text('DROP INDEX IF EXISTS ix_transactionlog_tx_id'))
+            conn.execute(text('CREATE INDEX ix_transactionlog_tx_id ON transactionlog (tx_id)'))
+    with Session(write_engine) as s:
+        old = datetime.utcnow() - timedelta(hours=1)
+        for i in range(seed_rows):
+            status = 'PREPARED' if i % 50 == 0 else ('COMMITTED' if i % 3 else 'ABORTED')
+            s.add(TransactionLog(tx_id=str(uuid.uuid4()), status=status, participants='[]', created_at=old, updated_at=old))
+        s.commit()
+
+# _writer: Inserta filas con un commit cada una hasta que se active stop.
+def _writer(engine, stop: threading.Event, counts: list, idx: int):
+    while not stop.is_set():
+        with Session(engine) as s:
+            s.add(TransactionLog(tx_id=str(uuid.uuid4()), status='COMMITTED', participants='[]'))
+            s.commit()
+        counts[idx] += 1
+
+# _reader: Alterna listado reciente y consulta de candidatas a reconciliación.
+def _reader(engine, stop: threading.Event, counts: list, idx: int):
+    n = 0
+    while not stop.is_set():
+        with Session(engine) as s:
+            if n % 2:
+                s.exec(select(TransactionLog).order_by(TransactionLog.id.desc()).limit(50)).all()
+            else:
+                cutoff = datetime.utcnow() - timedelta(minutes=5)
+                s.exec(
+                    select(TransactionLog)
+                    .where(TransactionLog.status == 'PREPARED', TransactionLog.created_at < cutoff)
+                    .limit(100)
+                ).all()
+        n += 1
+        counts[idx] += 1
+
+# run: Ejecuta la carga mixta sobre una configuración y retorna ops/s.
+def run(tuned: bool, writers: int, readers: int, seconds: float, seed_rows: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        write_engine, read_engine = create_engines(url, tuned=tuned)
+        _prepare_db(write_engine, baseline=not tuned, seed_rows=seed_rows)
+        stop = threading.Event()
+        w_counts, r_counts = [0] * writers, [0] * readers
+        errors = []
+
+        def guarded(fn, *args):
+            try:
+                fn(*args)
+            except Exception as e:  # p.ej. "database is locked" en modo baseline
+                errors.append(str(e))
+                stop.set()
+
+        runners = [threading.Thread(target=guarded, args=(_writer, write_engine, stop, w_counts, i)) for i in range(writers)]
+        runners += [threading.Thread(target=guarded, args=(_reader, read_engine, stop, r_counts, i)) for i in range(readers)]
+        started = time.perf_counter()
+        for t in runners:
+            t.start()
+        stop.wait(seconds)
+        stop.set()
+        for t in runners:
+            t.join()
+        elapsed = time.perf_counter() - started
+        write_engine.dispose()
+        read_engine.dispose()
+        return {
+            'config': 'tuned' if tuned else 'baseline',
+            'seconds': round(elapsed, 2),
+            'writes_per_sec': round(sum(w_counts) / elapsed, 1),
+            'reads_per_sec': round(sum(r_counts) / elapsed, 1),
+            'errors': errors[:3],
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--seed-rows', type=int, default=20000)
+    parser.add_argument('--json', action='store_true', help='Imprime resultados como JSON')
+    args = parser.parse_args()
+    results = [run(tuned, args.writers, args.readers, args.seconds, args.seed_rows) for tuned in (False, True)]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"{r['config']:>8}: {r['writes_per_sec']:>8} writes/s  {r['reads_per_sec']:>8} reads/s  errors={len(r['errors'])}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""Participante 2PC simulado para benchmarks.
+
+Implementa `/prepare`, `/commit`, `/rollback` (y sus variantes `/batch`),
+`/status/{tx_id}`, `/balance/{account_id}` y `/health` con latencia, jitter,
+tasa de votos ABORT y tasa de caídas configurables. Una caída deja al
+participante respondiendo 503 durante `--crash-downtime` segundos (incluido
+`/health`), como un banco reiniciándose detrás de su proxy. El rol `mirror`
+vota READ_ONLY cuando el PREPARE lo permite (`read_only_ok`) y un COMMIT con
+`one_phase` decide solo (aplica la tasa de ABORT). El rol `owner` (bancos detrás
+de la tabla de ruteo) debita `from_account` y acredita `to_account` según los
+campos que traiga cada mensaje.
+
+Cada mensaje registra por tx_id su instante de llegada y de respuesta;
+`GET /bench/events` los expone para que `load_bench` calcule la latencia de
+cada fase 2PC vista desde los participantes.
+
+Uso (desde la raíz del proyecto):
+  python -m benchmarks.stub_bank --port 9301 --role debit --latency-ms 5 --jitter-ms 2 --abort-rate 0.01
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from typing import Dict, List, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+class StubBank:
+    """Estado y comportamiento simulado de un banco participante."""
+    def __init__(self, name: str, role: str, latency_ms: float, jitter_ms: float, abort_rate: float,
+                 crash_rate: float, crash_downtime: float, seed: Optional[int] = None):
+        self.name = name
+        self.role = role
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.abort_rate = abort_rate
+        self.crash_rate = crash_rate
+        self.crash_downtime = crash_downtime
+        self.rng = random.Random(seed)
+        self.down_until = 0.0
+        self.crashes = 0
+        self.balances: Dict[int, float] = {}
+        self.prepared: Dict[str, dict] = {}
+        self.status: Dict[str, str] = {}
+        # [tx_id, tipo de mensaje, llegada, respuesta] (epoch)
+        self.events: List[list] = []
+
+    # is_down: Indica si el participante está "caído"; puede provocar una caída nueva.
+    def is_down(self) -> bool:
+        now = time.time()
+        if now < self.down_until:
+            return True
+        if self.crash_rate and self.rng.random() < self.crash_rate:
+            self.down_until = now + self.crash_downtime
+            self.crashes += 1
+            return True
+        return False
+
+    # delay: Espera la latencia configurada con jitter uniforme.
+    async def delay(self):
+        wait = self.latency + (self.rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    # prepare: Vota READY (o ABORT con probabilidad abort_rate) y guarda el payload.
+    # Un mirror vota READ_ONLY si el coordinador lo acepta: no espera COMMIT ni ROLLBACK.
+    def prepare(self, item: dict) -> str:
+        tx_id = item.get('tx_id')
+        if self.abort_rate and self.rng.random() < self.abort_rate:
+            self.status[tx_id] = 'ABORTED'
+            return 'ABORT'
+        if self.role == 'mirror' and item.get('read_only_ok'):
+            self.status[tx_id] = 'READ_ONLY'
+            return 'READ_ONLY'
+        self.prepared[tx_id] = item
+        self.status[tx_id] = 'PREPARED'
+        return 'READY'
+
+    # commit: Aplica la transferencia preparada y retorna (status, balance afectado).
+    # En one-phase commit no hubo PREPARE: el participante puede rechazarla (ABORT).
+    def commit(self, item: dict):
+        tx_id = item.get('tx_id')
+        if item.get('one_phase') and self.abort_rate and self.rng.random() < self.abort_rate:
+            self.status[tx_id] = 'ABORTED'
+            return 'ABORT', None
+        data = self.prepared.pop(tx_id, item)
+        balance = None
+        amount = float(data.get('amount') or 0)
+        if self.role in ('debit', 'owner') and data.get('from_account') is not None:
+            account = int(data['from_account'])
+            balance = self.balances[account] = self.balances.get(account, 1000.0) - amount
+        if self.role in ('credit', 'owner') and data.get('to_account') is not None:
+            account = int(data['to_account'])
+            balance = self.balances[account] = self.balances.get(account, 1000.0) + amount
+        self.status[tx_id] = 'COMMITTED'
+        return 'COMMITTED', balance
+
+    # rollback: Descarta lo preparado.
+    def rollback(self, tx_id: str) -> str:
+        self.prepared.pop(tx_id, None)
+        if self.status.get(tx_id) != 'COMMITTED':
+            self.status[tx_id] = 'ABORTED'
+        return 'ROLLED_BACK'
+
+# make_app: Construye la app FastAPI del participante simulado.
+def make_app(bank: StubBank) -> FastAPI:
+    app = FastAPI(title=f"Stub bank {bank.name}")
+    unavailable = JSONResponse({'detail': 'stub crashed'}, status_code=503)
+
+    @app.get('/health')
+    async def health():
+        if time.time() < bank.down_until:
+            return unavailable
+        return {'status': 'ok', 'name': bank.name}
+
+    @app.post('/prepare')
+    async def prepare(request: Request):
+        recv = time.time()
+        item = await request.json()
+        if bank.is_down():
+            return unavailable
+        await bank.delay()
+        result = bank.prepare(item)
+        bank.events.append([item.get('tx_id'), 'prepare', recv, time.time()])
+        return {'status': result}
+
+    @app.post('/commit')
+    async def commit(request: Request):
+        recv = time.time()
+        item = await request.json()
+        if bank.is_down():
+            return unavailable
+        await bank.delay()
+        result, balance = bank.commit(item)
+        bank.events.append([item.get('tx_id'), 'commit', recv, time.time()])
+        return {'status': result, 'balance': balance}
+
+    @app.post('/rollback')
+    async def rollback(request: Request):
+        recv = time.time()
+        item = await request.json()
+        if bank.is_down():
+            return unavailable
+        await bank.delay()
+        result = bank.rollback(item.get('tx_id'))
+        bank.events.append([item.get('tx_id'), 'rollback', recv, time.time()])
+        return {'status': result}
+
+    @app.post('/prepare/batch')
+    async def prepare_batch(request: Request):
+        recv = time.time()
+        body = await request.json()
+        if bank.is_down():
+            return unavailable
+        await bank.delay()
+        results = [{'tx_id': i.get('tx_id'), 'status': bank.prepare(i)} for i in body.get('items', [])]
+        done = time.time()
+        bank.events.extend([r['tx_id'], 'prepare', recv, done] for r in results)
+        return {'results': results}
+
+    @app.post('/commit/batch')
+    async def commit_batch(request: Request):
+        recv = time.time()
+        body = await request.json()
+        if bank.is_down():
+            return unavailable
+        await bank.delay()
+        results = [{'tx_id': i.get('tx_id'), 'status': bank.commit(i)[0]} for i in body.get('items', [])]
+        done = time.time()
+        bank.events.extend([r['tx_id'], 'commit', recv, done] for r in results)
+        return {'results': results}
+
+    @app.post('/rollback/batch')
+    async def rollback_batch(request: Request):
+        recv = time.time()
+        body = await request.json()
+        if bank.is_down():
+            return unavailable
+        await bank.delay()
+        results = [{'tx_id': t, 'status': bank.rollback(t)} for t in body.get('tx_ids', [])]
+        done = time.time()
+        bank.events.extend([r['tx_id'], 'rollback', recv, done] for r in results)
+        return {'results': results}
+
+    @app.get('/status/{tx_id}')
+    async def status(tx_id: str):
+        return {'status': bank.status.get(tx_id, 'UNKNOWN')}
+
+    @app.get('/balance/{account_id}')
+    async def balance(account_id: int):
+        await bank.delay()
+        return {'account_id': account_id, 'balance': bank.balances.get(account_id, 1000.0)}
+
+    @app.get('/bench/events')
+    async def events():
+        return {'name': bank.name, 'crashes': bank.crashes, 'events': bank.events}
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--name', default='stub')
+    parser.add_argument('--role', default='debit', choices=('debit', 'credit', 'mirror', 'owner'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--latency-ms', type=float, default=5)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--abort-rate', type=float, default=0)
+    parser.add_argument('--crash-rate', type=float, default=0)
+    parser.add_argument('--crash-downtime', type=float, default=1.0, help='Segundos que dura cada caída')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    import uvicorn
+    bank = StubBank(args.name, args.role, args.latency_ms, args.jitter_ms, args.abort_rate,
+                    args.crash_rate, args.crash_downtime, args.seed)
+    uvicorn.run(make_app(bank), host=args.host, port=args.port, log_level='warning')
+
+if __name__ == '__main__':
+    main()
@@ -5,15 +5,30 @@ que intervienen en las transacciones 2PC.
 
 Formato esperado en BANK_PARTICIPANTS:
   "nombre|url|rol,nombre|url|rol,..." donde rol ∈ {debit, credit, mirror}.
+
+participants.json acepta la lista anterior o un objeto con tabla de ruteo:
+  {"participants": [{"name", "url", "role"?}, ...],
+   "routing": {"ranges": [{"start", "end", "participant"}, ...],
+               "hash": ["bank_a", "bank_b"],
+               "mirrors": ["bank_c"]}}
+Con `routing` cada transferencia contacta solo al dueño de la cuenta origen
+(debit), al de la cuenta destino (credit) y a los mirrors; los rangos son
+inclusivos y las cuentas fuera de ellos se reparten por `cuenta % len(hash)`.
+Sin `routing` se contacta a todos los participantes con su rol fijo.
 """
 
+import bisect
+import logging
 import os
 import json
+import threading
 from pathlib import Path
 from functools import lru_cache
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 # parse_participants: Convierte la cadena cruda de participantes en una lista
 # de diccionarios con nombre, url y rol.
 def parse_participants(raw: str) -> List[Dict[str, str]]:
@@ -30,22 +45,120 @@ def parse_participants(raw: str) -> List[Dict[str, str]]:
             })
     return participants
 
-def load_participants_from_file(path: Path) -> List[Dict[str, str]]:
-    if not path.exists():
-        return []
-    try:
-        data = json.loads(path.read_text(encoding='utf-8'))
-        result: List[Dict[str, str]] = []
-        for item in data:
-            if all(k in item for k in ('name', 'url', 'role')):
-                result.append({
-                    'name': str(item['name']).strip(),
-                    'url': str(item['url']).strip(),
-                    'role': str(item['role']).strip(),
-                })
-        return result
-    except Exception:
-        return []
+# _parse_participant_list: Normaliza la lista de participantes del JSON. En un archivo con
+# ruteo el rol es opcional: los dueños de cuentas reciben debit/credit según la transferencia.
+def _parse_participant_list(items, role_required: bool) -> List[Dict[str, str]]:
+    result: List[Dict[str, str]] = []
+    for item in items:
+        if all(k in item for k in ('name', 'url')) and ('role' in item or not role_required):
+            result.append({
+                'name': str(item['name']).strip(),
+                'url': str(item['url']).strip(),
+                'role': str(item.get('role', 'owner')).strip(),
+            })
+    return result
+
+# load_routing_from_file: Construye la RoutingTable del archivo (lista simple u objeto con
+# "participants" y "routing"). Lanza ValueError/OSError si el archivo es inválido.
+def load_routing_from_file(path: Path) -> 'RoutingTable':
+    mtime = path.stat().st_mtime
+    data = json.loads(path.read_text(encoding='utf-8'))
+    if isinstance(data, list):
+        return RoutingTable(_parse_participant_list(data, role_required=True), path=path, mtime=mtime)
+    routing = data.get('routing') or {}
+    return RoutingTable(
+        _parse_participant_list(data.get('participants', []), role_required=not routing),
+        ranges=routing.get('ranges'),
+        hash_nodes=routing.get('hash'),
+        mirrors=routing.get('mirrors'),
+        path=path,
+        mtime=mtime,
+    )
+
+class RoutingError(ValueError):
+    """Ninguna regla de ruteo asigna la cuenta a un participante."""
+
+class RoutingTable:
+    """Asignación cuenta -> participante por rangos y/o hash, más mirrors obligatorios.
+
+    Sin rangos ni hash la tabla está desactivada y `route` devuelve todos los
+    participantes con su rol configurado (comportamiento histórico).
+    """
+    def __init__(self, participants: List[Dict[str, str]], ranges: Optional[List[Dict]] = None,
+                 hash_nodes: Optional[List[str]] = None, mirrors: Optional[List[str]] = None,
+                 path: Optional[Path] = None, mtime: Optional[float] = None):
+        self.participants = participants
+        self.path = path
+        self.mtime = mtime
+        self._by_name = {p['name']: p for p in participants}
+        self._ranges = sorted((int(r['start']), int(r['end']), str(r['participant'])) for r in ranges or [])
+        self._starts = [r[0] for r in self._ranges]
+        self._hash = [str(n) for n in hash_nodes or []]
+        if mirrors is None:
+            mirrors = [p['name'] for p in participants if p['role'] == 'mirror']
+        self._mirrors = [str(n) for n in mirrors]
+        self.enabled = bool(self._ranges or self._hash)
+        self._validate()
+
+    # _validate: Rechaza rangos solapados o invertidos, nombres de participantes desconocidos
+    # y mirrors que además son dueños de cuentas (recibirían dos mensajes por transferencia).
+    def _validate(self):
+        for start, end, name in self._ranges:
+            if start > end:
+                raise ValueError(f"Routing range {start}-{end} is inverted")
+        for prev, cur in zip(self._ranges, self._ranges[1:]):
+            if cur[0] <= prev[1]:
+                raise ValueError(f"Routing ranges {prev[0]}-{prev[1]} and {cur[0]}-{cur[1]} overlap")
+        for name in [r[2] for r in self._ranges] + self._hash + (self._mirrors if self.enabled else []):
+            if name not in self._by_name:
+                raise ValueError(f"Routing references unknown participant '{name}'")
+        if self.enabled:
+            owners = {r[2] for r in self._ranges} | set(self._hash)
+            for name in self._mirrors:
+                if name in owners:
+                    raise ValueError(f"Routing mirror '{name}' also owns accounts (range or hash)")
+
+    # owner: Participante dueño de una cuenta (rango que la contiene o, si no, hash).
+    def owner(self, account: int) -> Dict[str, str]:
+        i = bisect.bisect_right(self._starts, account) - 1
+        if i >= 0 and account <= self._ranges[i][1]:
+            return self._by_name[self._ranges[i][2]]
+        if self._hash:
+            return self._by_name[self._hash[account % len(self._hash)]]
+        raise RoutingError(f"No participant owns account {account}")
+
+    # route: Participantes de una transferencia con el rol que cumple cada uno.
+    # Si ambas cuentas son del mismo participante recibe un único mensaje con rol 'transfer'.
+    def route(self, from_account: int, to_account: int) -> List[Dict[str, str]]:
+        if not self.enabled:
+            return self.participants
+        debit, credit = self.owner(from_account), self.owner(to_account)
+        if debit['name'] == credit['name']:
+            routed = [{**debit, 'role': 'transfer'}]
+        else:
+            routed = [{**debit, 'role': 'debit'}, {**credit, 'role': 'credit'}]
+        return routed + [{**self._by_name[n], 'role': 'mirror'} for n in self._mirrors]
+
+    # sources: Participantes que pueden informar el saldo de una cuenta (dueño primero, luego mirrors).
+    def sources(self, account: int) -> List[Dict[str, str]]:
+        if not self.enabled:
+            return sorted(self.participants, key=lambda p: p['role'] == 'mirror')
+        mirrors = [self._by_name[n] for n in self._mirrors]
+        try:
+            return [self.owner(account)] + mirrors
+        except RoutingError:
+            return mirrors
+
+    # describe: Resumen de la tabla para /admin/routing.
+    def describe(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "source": str(self.path) if self.path else None,
+            "participants": self.participants,
+            "ranges": [{"start": s, "end": e, "participant": n} for s, e, n in self._ranges],
+            "hash": self._hash,
+            "mirrors": self._mirrors if self.enabled else [],
+        }
 
 # get_settings: Devuelve (cacheado) la instancia única de Settings.
 @lru_cache
@@ -66,15 +179,43 @@ class Settings:
         # Base de datos: usar ruta absoluta local controlada para evitar crear el archivo fuera del proyecto.
         default_db_path = base_dir / 'transactions.db'
         self.database_url = os.getenv('TX_DB_URL', f"sqlite:///{default_db_path}")
+        # Ajustes de almacenamiento SQLite (ver database.py).
+        self.db_tuning = os.getenv('DB_TUNING', 'true').lower() in ('1', 'true', 'yes')
+        self.db_journal_mode = os.getenv('DB_JOURNAL_MODE', 'WAL')
+        self.db_synchronous = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+        self.db_busy_timeout_ms = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+        self.db_cache_kb = int(os.getenv('DB_CACHE_KB', '16384'))
+        self.db_write_pool_size = int(os.getenv('DB_WRITE_POOL_SIZE', '1'))
+        self.db_read_pool_size = int(os.getenv('DB_READ_POOL_SIZE', '8'))
         self.jwt_secret = os.getenv('JWT_SECRET', 'dev-secret-change')
         self.jwt_algorithm = os.getenv('JWT_ALG', 'HS256')
         self.jwt_exp_minutes = int(os.getenv('JWT_EXP_MIN', '60'))
+        # Caché de tokens verificados -> usuario (evita consulta a BD por petición).
+        self.auth_cache_size = int(os.getenv('AUTH_CACHE_SIZE', '10000'))
+        self.auth_cache_ttl = float(os.getenv('AUTH_CACHE_TTL_SEC', '300'))
+        # Pool de procesos para bcrypt: trabajadores y operaciones en espera admitidas.
+        self.password_workers = int(os.getenv('PASSWORD_WORKERS', str(os.cpu_count() or 2)))
+        self.password_max_pending = int(os.getenv('PASSWORD_MAX_PENDING', str(self.password_workers * 4)))
         raw_participants = os.getenv('BANK_PARTICIPANTS', '')
+        self.participants_file = Path(os.getenv('PARTICIPANTS_FILE', str(base_dir / 'participants.json')))
+        # Cada cuánto se revisa si el archivo de participantes cambió (0 = solo con /admin/routing/reload).
+        self.routing_reload_sec = float(os.getenv('ROUTING_RELOAD_SEC', '5'))
+        self._routing_lock = threading.Lock()
+        self._routing_stop = threading.Event()
+        self._routing_thread: Optional[threading.Thread] = None
+        # Funciones que reciben la lista de participantes cada vez que se recarga la tabla.
+        self._routing_listeners: List[Callable[[List[Dict[str, str]]], None]] = []
 
         participants = parse_participants(raw_participants)
-        if not participants:
-            # Intentar cargar archivo JSON local si no hay env var.
-            participants = load_participants_from_file(base_dir / 'participants.json')
+        routing = None
+        if not participants and self.participants_file.exists():
+            # Intentar cargar archivo JSON local (con tabla de ruteo opcional) si no hay env var.
+            try:
+                routing = load_routing_from_file(self.participants_file)
+                participants = routing.participants
+            except (OSError, ValueError) as e:
+                logger.warning("Archivo de participantes %s inválido: %s", self.participants_file, e)
+                routing = None
         if not participants:
             # Fallback: intentar hostnames internos Docker, luego localhost.
             docker_candidates = [
@@ -89,7 +230,128 @@ class Settings:
             mode = os.getenv('ENV_MODE', '').lower()
             participants = docker_candidates if mode == 'docker' else local_candidates
         self.participants = participants
+        self.routing = routing if routing is not None and routing.participants else RoutingTable(participants)
         # Parámetros de red
         self.request_timeout = float(os.getenv('REQUEST_TIMEOUT', '3'))
         self.max_retries = int(os.getenv('REQUEST_RETRIES', '2'))
+        # Presupuesto de tiempo por transferencia (por defecto y tope de X-Deadline-Ms) y
+        # backoff exponencial con jitter entre reintentos (base y tope en ms).
+        self.tx_deadline = float(os.getenv('TX_DEADLINE_MS', '5000')) / 1000
+        self.tx_deadline_max = float(os.getenv('TX_DEADLINE_MAX_MS', '30000')) / 1000
+        self.retry_base_ms = float(os.getenv('RETRY_BASE_MS', '50'))
+        self.retry_max_ms = float(os.getenv('RETRY_MAX_MS', '2000'))
+        # Entrega de la decisión: 'sync' (por defecto) espera a los participantes; 'async' (opcional)
+        # responde al registrar la decisión y reenvía COMMIT/ROLLBACK en segundo plano (ver redelivery.py).
+        self.decision_delivery = os.getenv('DECISION_DELIVERY', 'sync').lower()
+        self.redelivery_concurrency = int(os.getenv('REDELIVERY_CONCURRENCY', '64'))
+        # Intentos por participante antes de dejar la decisión al reconciliador.
+        self.redelivery_max_attempts = int(os.getenv('REDELIVERY_MAX_ATTEMPTS', '20'))
         self.reconcile_interval = int(os.getenv('RECONCILE_INTERVAL_SEC', '60'))
+        # Reconciliación incremental: edad mínima, tamaño de lote y lotes por pasada.
+        self.reconcile_age_minutes = int(os.getenv('RECONCILE_AGE_MIN', '5'))
+        self.reconcile_batch_size = int(os.getenv('RECONCILE_BATCH_SIZE', '100'))
+        self.reconcile_max_batches = int(os.getenv('RECONCILE_MAX_BATCHES', '10'))
+        # Monitor de salud de participantes y circuit breakers (ver health.py).
+        self.health_interval = float(os.getenv('HEALTH_INTERVAL_SEC', '5'))
+        self.health_timeout = float(os.getenv('HEALTH_TIMEOUT_SEC', '1'))
+        self.breaker_failures = int(os.getenv('BREAKER_FAILURES', '3'))
+        self.breaker_reset_sec = float(os.getenv('BREAKER_RESET_SEC', '10'))
+        # Optimizaciones del protocolo: one-phase commit con un solo participante, votos
+        # READ_ONLY que salen de la fase COMMIT y presumed abort (abortos sin escrituras forzadas).
+        self.tpc_one_phase = os.getenv('TPC_ONE_PHASE', 'false').lower() in ('1', 'true', 'yes')
+        self.tpc_read_only = os.getenv('TPC_READ_ONLY', 'false').lower() in ('1', 'true', 'yes')
+        self.tpc_presumed_abort = os.getenv('TPC_PRESUMED_ABORT', 'false').lower() in ('1', 'true', 'yes')
+        # Hilos para contactar participantes en paralelo durante cada fase 2PC.
+        self.phase_workers = int(os.getenv('PHASE_WORKERS', '32'))
+        # Guardar desglose de tiempos por transacción en TransactionLog.timings.
+        self.tx_timings = os.getenv('TX_TIMINGS', 'true').lower() in ('1', 'true', 'yes')
+        # Pool de conexiones persistentes por participante.
+        self.participant_pool_size = int(os.getenv('PARTICIPANT_POOL_SIZE', '32'))
+        self.participant_pool_block = os.getenv('PARTICIPANT_POOL_BLOCK', 'false').lower() in ('1', 'true', 'yes')
+        self.participant_keepalive = float(os.getenv('PARTICIPANT_KEEPALIVE_SEC', '30'))
+        # Conexiones máximas del cliente asíncrono por participante (camino de /transfer).
+        self.participant_async_pool_size = int(os.getenv('PARTICIPANT_ASYNC_POOL_SIZE', '512'))
+        # Máximo de transferencias aceptadas en una sola petición /transfer/batch.
+        self.batch_max_size = int(os.getenv('BATCH_MAX_SIZE', '5000'))
+        # Planificador por cuenta de /transfer: en vuelo, cola de admisión y espera máxima por cuenta.
+        self.scheduler_max_in_flight = int(os.getenv('SCHED_MAX_IN_FLIGHT', '256'))
+        self.scheduler_max_queue = int(os.getenv('SCHED_MAX_QUEUE', '1024'))
+        self.scheduler_max_per_account = int(os.getenv('SCHED_MAX_PER_ACCOUNT', '64'))
+        # Idempotency-Key de /transfer: entradas en memoria, vigencia y espera máxima de duplicados.
+        self.idempotency_cache_size = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '10000'))
+        self.idempotency_ttl = float(os.getenv('IDEMPOTENCY_TTL_SEC', '86400'))
+        self.idempotency_wait = float(os.getenv('IDEMPOTENCY_WAIT_SEC', '30'))
+        # Agregados de /transactions/stats: ancho de cada bucket de throughput y buckets máximos por consulta.
+        self.stats_bucket_sec = int(os.getenv('STATS_BUCKET_SEC', '60'))
+        self.stats_max_buckets = int(os.getenv('STATS_MAX_BUCKETS', '1440'))
+        # Paginación de /transactions y tamaño de bloque de la exportación NDJSON.
+        self.list_max_limit = int(os.getenv('LIST_MAX_LIMIT', '1000'))
+        self.export_chunk_size = int(os.getenv('EXPORT_CHUNK_SIZE', '1000'))
+        # Caché de balances: tamaño LRU, frescura y antigüedad máxima antes de consultar en línea.
+        self.balance_cache_size = int(os.getenv('BALANCE_CACHE_SIZE', '10000'))
+        self.balance_fresh_sec = float(os.getenv('BALANCE_FRESH_SEC', '5'))
+        self.balance_max_stale_sec = float(os.getenv('BALANCE_MAX_STALE_SEC', '300'))
+        # Log write-ahead del coordinador (group commit) y su compactación.
+        self.coordinator_log_path = Path(os.getenv('COORD_LOG_PATH', str(base_dir / 'coordinator.wal')))
+        self.coordinator_log_group_window = float(os.getenv('COORD_LOG_GROUP_MS', '0')) / 1000
+        self.coordinator_log_max_bytes = int(os.getenv('COORD_LOG_MAX_BYTES', str(64 * 1024 * 1024)))
+
+    # reload_routing: Relee el archivo de participantes si cambió (o siempre con force=True).
+    # Retorna True si se reemplazó la tabla; un archivo inválido lanza ValueError/OSError
+    # y deja la tabla anterior en uso.
+    # Las recargas (hilo vigía y /admin/routing/reload) no se solapan.
+    def reload_routing(self, force: bool = False) -> bool:
+        with self._routing_lock:
+            current = self.routing
+            if current.path is None:
+                return False
+            if not force and current.path.stat().st_mtime == current.mtime:
+                return False
+            table = load_routing_from_file(current.path)
+            if not table.participants:
+                raise ValueError(f"{current.path} has no participants")
+            self.routing, self.participants = table, table.participants
+            for listener in self._routing_listeners:
+                try:
+                    listener(table.participants)
+                except Exception:
+                    logger.exception("Fallo al registrar los participantes recargados")
+            return True
+
+    # on_routing_reload: Registra `listener(participants)`, que se invoca tras cada recarga
+    # de la tabla (periódica o por /admin/routing/reload) para dar de alta participantes nuevos.
+    def on_routing_reload(self, listener: Callable[[List[Dict[str, str]]], None]):
+        if listener not in self._routing_listeners:
+            self._routing_listeners.append(listener)
+
+    # current_routing: Tabla vigente. No toca el archivo: la recarga la hace el hilo vigía
+    # (start_routing_watcher), así el event loop nunca espera la lectura ni los listeners.
+    def current_routing(self) -> RoutingTable:
+        return self.routing
+
+    # start_routing_watcher: Inicia el hilo que revisa el archivo cada ROUTING_RELOAD_SEC
+    # (no hace nada con 0 o si la tabla no viene de un archivo).
+    def start_routing_watcher(self):
+        if self.routing_reload_sec <= 0 or self.routing.path is None:
+            return
+        if self._routing_thread and self._routing_thread.is_alive():
+            return
+        self._routing_stop.clear()
+        self._routing_thread = threading.Thread(target=self._watch_routing, name='routing-watcher', daemon=True)
+        self._routing_thread.start()
+
+    # stop_routing_watcher: Detiene el hilo vigía.
+    def stop_routing_watcher(self):
+        self._routing_stop.set()
+        if self._routing_thread:
+            self._routing_thread.join()
+            self._routing_thread = None
+
+    # _watch_routing: Bucle del hilo vigía; un archivo inválido deja la tabla anterior en uso.
+    def _watch_routing(self):
+        while not self._routing_stop.wait(self.routing_reload_sec):
+            try:
+                if self.reload_routing():
+                    logger.info("Tabla de ruteo recargada desde %s", self.routing.path)
+            except (OSError, ValueError) as e:
+                logger.warning("No se pudo recargar la tabla de ruteo: %s", e)
@@ -0,0 +1,330 @@
+"""Log write-ahead (WAL) de decisiones del coordinador 2PC.
+
+Cada transacción deja en un archivo append-only (una línea JSON por registro):
+  BEGIN     antes de enviar PREPARE (participantes y datos de la transferencia).
+  PREPARED  votos recibidos en la fase PREPARE.
+  DECISION  COMMIT | ABORT, antes de enviar COMMIT/ROLLBACK.
+  END       cuando todos los participantes confirmaron la decisión.
+
+Los registros forzados se escriben con group commit: un hilo escritor drena
+todo lo encolado por transacciones concurrentes y cubre el lote con un único
+fsync. Al arrancar, `unfinished()` devuelve las transacciones sin END para que
+el servicio reenvíe la decisión tomada (o ROLLBACK si no llegó a decidirse).
+Esa regla es la de presumed abort: con `TPC_PRESUMED_ABORT` el coordinador no
+fuerza el BEGIN ni registra los abortos, y solo la decisión COMMIT espera fsync.
+Las variantes `*_async` esperan el fsync desde el event loop sin ocupar un hilo.
+Un error de E/S del hilo escritor marca el log como fallido: los que esperaban
+su fsync reciben `CoordinatorLogError` y los siguientes `append` también.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+class CoordinatorLogError(RuntimeError):
+    """El log del coordinador no pudo escribirse (o ya falló antes) y no admite registros."""
+
+class _ThreadSignal:
+    """Espera bloqueante del fsync de un lote; `wait()` relanza el error del escritor."""
+    def __init__(self):
+        self._event = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    # set: Llamado desde el hilo escritor cuando el lote está en disco.
+    def set(self):
+        self._event.set()
+
+    # fail: Llamado desde el hilo escritor si el lote no pudo escribirse.
+    def fail(self, error: BaseException):
+        self._error = error
+        self._event.set()
+
+    def wait(self):
+        self._event.wait()
+        if self._error is not None:
+            raise CoordinatorLogError(f"Coordinator log write failed: {self._error}") from self._error
+
+class _LoopSignal:
+    """Adaptador con la interfaz de _ThreadSignal que resuelve un future asyncio."""
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+
+    # set: Llamado desde el hilo escritor; resuelve el future en su event loop.
+    def set(self):
+        self.loop.call_soon_threadsafe(self._resolve, None)
+
+    # fail: Llamado desde el hilo escritor; el future termina con CoordinatorLogError.
+    def fail(self, error: BaseException):
+        self.loop.call_soon_threadsafe(self._resolve, error)
+
+    def _resolve(self, error: Optional[BaseException]):
+        if self.future.done():
+            return
+        if error is None:
+            self.future.set_result(None)
+        else:
+            self.future.set_exception(CoordinatorLogError(f"Coordinator log write failed: {error}"))
+
+class CoordinatorLog:
+    """Archivo WAL con group commit y compactación de transacciones terminadas."""
+    def __init__(self, path: Path, group_window: float = 0.0, max_bytes: int = 64 * 1024 * 1024):
+        self.path = Path(path)
+        self.group_window = group_window
+        self.max_bytes = max_bytes
+        self._pending: List[Tuple[List[dict], Optional[_ThreadSignal | _LoopSignal]]] = []
+        self._cond = threading.Condition()
+        self._active: Dict[str, List[dict]] = {}
+        self._file = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        # Error de E/S que detuvo al hilo escritor (None mientras el log está sano).
+        self.error: Optional[BaseException] = None
+        self.records_written = 0
+        self.fsyncs = 0
+
+    # open: Abre el archivo en modo append e inicia el hilo escritor.
+    def open(self):
+        if self._running:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._active = self._load_active()
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, 'ab')
+        self.error = None
+        self._running = True
+        self._thread = threading.Thread(target=self._writer_loop, name='coordinator-wal', daemon=True)
+        self._thread.start()
+
+    # close: Vacía lo pendiente y cierra el archivo.
+    def close(self):
+        if self._thread is None:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join()
+        self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # append: Encola registros; si force=True bloquea hasta que estén en disco (fsync).
+    # Lanza CoordinatorLogError si el log falló (antes o al escribir este lote).
+    def append(self, records: List[dict], force: bool = True):
+        done = _ThreadSignal() if force else None
+        with self._cond:
+            self._check_open()
+            self._pending.append((records, done))
+            self._cond.notify()
+        if done:
+            done.wait()
+
+    # append_async: Como append forzado, pero espera el fsync sin bloquear el event loop.
+    async def append_async(self, records: List[dict]):
+        done = _LoopSignal()
+        with self._cond:
+            self._check_open()
+            self._pending.append((records, done))
+            self._cond.notify()
+        await done.future
+
+    # begin: Registra el inicio de una transacción antes de enviar PREPARE.
+    def begin(self, tx_id: str, participants: List[Dict[str, str]], transfer: Tuple[float, int, int]):
+        self.append([self._record('BEGIN', tx_id, participants=participants, transfer=list(transfer))])
+
+    # begin_async: Versión asíncrona de begin. Con force=False solo encola el registro
+    # (llega a disco con el siguiente fsync del grupo) y no espera.
+    async def begin_async(self, tx_id: str, participants: List[Dict[str, str]], transfer: Tuple[float, int, int],
+                          force: bool = True):
+        records = [self._record('BEGIN', tx_id, participants=participants, transfer=list(transfer))]
+        if force:
+            await self.append_async(records)
+        else:
+            self.append(records, force=False)
+
+    # begin_many: Registra el inicio de varias transacciones con un solo fsync.
+    def begin_many(self, entries: List[Tuple[str, List[Dict[str, str]], Tuple[float, int, int]]]):
+        self.append([self._record('BEGIN', tx_id, participants=p, transfer=list(t)) for tx_id, p, t in entries])
+
+    # decide: Registra votos y decisión (forzado) antes de enviar COMMIT/ROLLBACK.
+    def decide(self, tx_id: str, votes: Dict[str, Optional[str]], decision: str):
+        self.append([
+            self._record('PREPARED', tx_id, votes=votes),
+            self._record('DECISION', tx_id, decision=decision),
+        ])
+
+    # decide_async: Versión asíncrona de decide.
+    async def decide_async(self, tx_id: str, votes: Dict[str, Optional[str]], decision: str):
+        await self.append_async([
+            self._record('PREPARED', tx_id, votes=votes),
+            self._record('DECISION', tx_id, decision=decision),
+        ])
+
+    # decide_many: Versión en lote de decide con un solo fsync.
+    def decide_many(self, entries: List[Tuple[str, Dict[str, Optional[str]], str]]):
+        records = []
+        for tx_id, votes, decision in entries:
+            records.append(self._record('PREPARED', tx_id, votes=votes))
+            records.append(self._record('DECISION', tx_id, decision=decision))
+        self.append(records)
+
+    # end: Marca la transacción como terminada (no forzado; se agrupa con el siguiente lote).
+    def end(self, tx_id: str):
+        self.append([self._record('END', tx_id)], force=False)
+
+    # end_many: Versión en lote de end.
+    def end_many(self, tx_ids: List[str]):
+        self.append([self._record('END', tx_id) for tx_id in tx_ids], force=False)
+
+    # unfinished: Transacciones sin END, con su BEGIN y la decisión (None si no se decidió).
+    def unfinished(self) -> List[Dict]:
+        with self._cond:
+            active = {tx_id: list(records) for tx_id, records in self._active.items()}
+        result = []
+        for tx_id, records in active.items():
+            entry = {'tx_id': tx_id, 'begin': None, 'votes': {}, 'decision': None}
+            for r in records:
+                if r['type'] == 'BEGIN':
+                    entry['begin'] = r
+                elif r['type'] == 'PREPARED':
+                    entry['votes'] = r.get('votes', {})
+                elif r['type'] == 'DECISION':
+                    entry['decision'] = r.get('decision')
+            if entry['begin'] is not None:
+                result.append(entry)
+        return result
+
+    # stats: Registros escritos y fsyncs realizados (registros/fsync mide el agrupamiento).
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"records": self.records_written, "fsyncs": self.fsyncs, "active": len(self._active),
+                    "failed": int(self.error is not None)}
+
+    # _check_open: Lanza si el log no está abierto o el escritor falló (llamar con _cond tomado).
+    def _check_open(self):
+        if self.error is not None:
+            raise CoordinatorLogError(f"Coordinator log failed: {self.error}")
+        if not self._running:
+            raise RuntimeError("Coordinator log is not open")
+
+    # _record: Construye un registro con tipo, tx_id y marca de tiempo.
+    @staticmethod
+    def _record(kind: str, tx_id: str, **fields) -> dict:
+        return {'type': kind, 'tx_id': tx_id, 'ts': time.time(), **fields}
+
+    # _track: Actualiza el conjunto de transacciones activas con un registro.
+    def _track(self, record: dict):
+        tx_id = record['tx_id']
+        if record['type'] == 'END':
+            self._active.pop(tx_id, None)
+        else:
+            self._active.setdefault(tx_id, []).append(record)
+
+    # _load_active: Lee el archivo existente y reconstruye las transacciones sin END.
+    # Una cola truncada por una caída a mitad de escritura se descarta del archivo.
+    def _load_active(self) -> Dict[str, List[dict]]:
+        active: Dict[str, List[dict]] = {}
+        if not self.path.exists():
+            return active
+        valid_end = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                valid_end += len(line)
+                tx_id = record.get('tx_id')
+                if record.get('type') == 'END':
+                    active.pop(tx_id, None)
+                else:
+                    active.setdefault(tx_id, []).append(record)
+        if valid_end < self.path.stat().st_size:
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_end)
+        return active
+
+    # _writer_loop: Hilo escritor; agrupa todo lo pendiente en una escritura + un fsync.
+    # Un lote sin registros forzados (END, BEGIN de presumed abort) se escribe sin fsync:
+    # llega a disco con el siguiente fsync o cuando el sistema vacíe sus buffers.
+    def _writer_loop(self):
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._pending and not self._running:
+                    return
+            if self.group_window > 0:
+                time.sleep(self.group_window)
+            with self._cond:
+                batch, self._pending = self._pending, []
+                for records, _ in batch:
+                    for r in records:
+                        self._track(r)
+            data = b''.join(
+                json.dumps(r, separators=(',', ':')).encode('utf-8') + b'\n'
+                for records, _ in batch for r in records
+            )
+            forced = any(done for _, done in batch)
+            try:
+                self._file.write(data)
+                self._file.flush()
+                if forced:
+                    os.fsync(self._file.fileno())
+            except Exception as e:
+                self._fail(e, batch)
+                return
+            with self._cond:
+                self.records_written += sum(len(records) for records, _ in batch)
+                self.fsyncs += forced
+            for _, done in batch:
+                if done:
+                    done.set()
+            if self._file.tell() > self.max_bytes:
+                try:
+                    self._compact()
+                except Exception as e:
+                    self._fail(e, [])
+                    return
+
+    # _fail: Marca el log como fallido y despierta con el error al lote en curso y a lo
+    # encolado; el hilo escritor termina y los siguientes append lanzan CoordinatorLogError.
+    def _fail(self, error: BaseException, batch):
+        logger.error("Coordinator log write failed, log disabled: %s", error)
+        with self._cond:
+            self.error = error
+            self._running = False
+            batch, self._pending = list(batch) + self._pending, []
+        for _, done in batch:
+            if done:
+                done.fail(error)
+
+    # _compact: Reescribe el archivo solo con transacciones activas (reemplazo atómico).
+    def _compact(self):
+        with self._cond:
+            records = [r for recs in self._active.values() for r in recs]
+        tmp = self.path.with_suffix(self.path.suffix + '.tmp')
+        with open(tmp, 'wb') as f:
+            for r in records:
+                f.write(json.dumps(r, separators=(',', ':')).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp, self.path)
+        self._file = open(self.path, 'ab')
+
+# Instancia compartida; se abre en el startup de la aplicación.
+coordinator_log = CoordinatorLog(settings.coordinator_log_path, settings.coordinator_log_group_window, settings.coordinator_log_max_bytes)
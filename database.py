@@ -1,25 +1,114 @@
 """Módulo de acceso a la base de datos.
 
-Define el motor y utilidades de sesión para realizar operaciones CRUD.
+Define los motores y utilidades de sesión para realizar operaciones CRUD.
+
+Para SQLite se aplica una capa de configuración de almacenamiento: journal en
+modo WAL (lectores y escritor no se bloquean entre sí), nivel `synchronous`
+configurable, `busy_timeout` y dos pools separados: uno de escritura acotado
+(serializa a los escritores dentro del proceso en vez de competir por el lock
+del archivo) y otro de solo lectura para consultas. `init_db` además aplica
+migraciones aditivas (columnas e índices nuevos) sobre bases existentes.
 """
 
+import logging
+from typing import Tuple
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
 from sqlmodel import SQLModel, create_engine, Session
 from config import get_settings
 
 settings = get_settings()
-engine = create_engine(settings.database_url, echo=False)
+logger = logging.getLogger(__name__)
+
+# _apply_sqlite_pragmas: Registra los PRAGMA que se ejecutan en cada conexión nueva.
+def _apply_sqlite_pragmas(engine: Engine, read_only: bool):
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        cursor.execute(f"PRAGMA journal_mode={settings.db_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={settings.db_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.db_busy_timeout_ms}")
+        cursor.execute(f"PRAGMA cache_size=-{settings.db_cache_kb}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+# create_engines: Crea el par (escritura, lectura) para una URL de base de datos.
+# En motores que no son SQLite ambos comparten el mismo Engine.
+def create_engines(url: str, tuned: bool = True) -> Tuple[Engine, Engine]:
+    if not url.startswith('sqlite') or ':memory:' in url or not tuned:
+        shared = create_engine(url, echo=False)
+        return shared, shared
+    write = create_engine(url, echo=False, pool_size=settings.db_write_pool_size, max_overflow=0)
+    read = create_engine(url, echo=False, pool_size=settings.db_read_pool_size, max_overflow=settings.db_read_pool_size)
+    _apply_sqlite_pragmas(write, read_only=False)
+    _apply_sqlite_pragmas(read, read_only=True)
+    return write, read
+
+write_engine, read_engine = create_engines(settings.database_url, tuned=settings.db_tuning)
+# engine: alias histórico del motor de escritura.
+engine = write_engine
 
-# init_db: Crea todas las tablas definidas en los modelos si no existen.
+# _has_duplicates: Indica si las columnas del índice tienen valores repetidos.
+def _has_duplicates(conn, idx) -> bool:
+    cols = ', '.join(c.name for c in idx.columns)
+    row = conn.execute(text(
+        f'SELECT 1 FROM {idx.table.name} GROUP BY {cols} HAVING COUNT(*) > 1 LIMIT 1'
+    )).first()
+    return row is not None
+
+# migrate: Aplica cambios aditivos del modelo sobre tablas existentes.
+# Agrega columnas faltantes (deben ser nulables) y crea o recrea índices cuyo
+# nombre falta o cuya unicidad difiere. Si un índice único no puede crearse por
+# datos duplicados se conserva el índice anterior y se registra una advertencia
+# (no se borran ni reescriben filas).
+def migrate(target: Engine = None):
+    target = target or write_engine
+    insp = inspect(target)
+    for table in SQLModel.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existing_cols = {c['name'] for c in insp.get_columns(table.name)}
+        with target.begin() as conn:
+            for col in table.columns:
+                if col.name not in existing_cols:
+                    col_type = col.type.compile(dialect=target.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}'))
+        existing_idx = {i['name']: i for i in insp.get_indexes(table.name)}
+        for idx in table.indexes:
+            current = existing_idx.get(idx.name)
+            if current is not None and bool(current.get('unique')) == bool(idx.unique):
+                continue
+            with target.begin() as conn:
+                if idx.unique and _has_duplicates(conn, idx):
+                    logger.warning("Índice único %s no aplicado: existen valores duplicados", idx.name)
+                    continue
+                if current is not None:
+                    conn.execute(text(f'DROP INDEX {idx.name}'))
+                idx.create(conn)
+
+# init_db: Crea todas las tablas definidas en los modelos si no existen y migra las existentes.
 def init_db():
-    SQLModel.metadata.create_all(engine)
+    import models  # noqa: F401  (registra las tablas en SQLModel.metadata)
+    SQLModel.metadata.create_all(write_engine)
+    migrate(write_engine)
 
 class DBSession:
     """Context manager para manejar sesiones.
 
     Al salir del contexto realiza rollback si hubo excepción y cierra la sesión.
+    Con `expire_on_commit=False` los objetos siguen legibles tras el commit sin
+    recargarlos uno a uno (útil en inserciones masivas). Con `readonly=True`
+    la sesión usa el pool de lectura.
     """
+    def __init__(self, expire_on_commit: bool = True, readonly: bool = False):
+        self.expire_on_commit = expire_on_commit
+        self.readonly = readonly
+
     def __enter__(self):
-        self.session = Session(engine)
+        bind = read_engine if self.readonly else write_engine
+        self.session = Session(bind, expire_on_commit=self.expire_on_commit)
         return self.session
 
     def __exit__(self, exc_type, exc, tb):
@@ -0,0 +1,234 @@
+"""Monitor de salud de participantes y circuit breakers por URL.
+
+Un hilo en segundo plano sondea `/health` de cada participante cada
+`HEALTH_INTERVAL_SEC` y mantiene su estado (vivo, latencia, último error).
+Cada URL tiene un circuit breaker alimentado tanto por los sondeos como por
+las llamadas 2PC: tras `BREAKER_FAILURES` fallos de transporte consecutivos se
+abre y las transferencias que lo requieren se rechazan sin contactar a nadie;
+pasado `BREAKER_RESET_SEC` permite una prueba (HALF_OPEN) y se cierra si tiene éxito.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+from config import get_settings
+from participant_client import clients
+
+settings = get_settings()
+
+class CircuitBreaker:
+    """Breaker CLOSED -> OPEN -> HALF_OPEN -> CLOSED para un participante."""
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'CLOSED'
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    # allow: Indica si se puede contactar al participante.
+    # En OPEN, pasado reset_timeout deja pasar una única prueba (HALF_OPEN).
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'CLOSED':
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            # Se reinicia el plazo para que solo una llamada haga de prueba.
+            self.state = 'HALF_OPEN'
+            self._opened_at = time.monotonic()
+            return True
+
+    # blocked: Indica sin cambiar el estado si `allow` rechazaría ahora (OPEN dentro de
+    # reset_timeout o prueba HALF_OPEN ya en curso).
+    def blocked(self) -> bool:
+        with self._lock:
+            return self.state != 'CLOSED' and time.monotonic() - self._opened_at < self.reset_timeout
+
+    # release: Devuelve una prueba HALF_OPEN concedida por `allow` que no llegó a usarse.
+    def release(self):
+        with self._lock:
+            if self.state == 'HALF_OPEN':
+                self._opened_at = time.monotonic() - self.reset_timeout
+
+    # record_success: Cierra el breaker y reinicia el contador de fallos.
+    def record_success(self):
+        with self._lock:
+            self.state = 'CLOSED'
+            self.failures = 0
+
+    # record_failure: Suma un fallo; abre el breaker al alcanzar el umbral o si falla la prueba.
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'HALF_OPEN' or self.failures >= self.failure_threshold:
+                self.state = 'OPEN'
+                self._opened_at = time.monotonic()
+
+class ParticipantHealth:
+    """Último estado conocido de un participante."""
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self.alive: Optional[bool] = None
+        self.latency_ms: Optional[float] = None
+        self.last_checked: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    # to_dict: Serializa el estado para /health.
+    def to_dict(self, breaker: CircuitBreaker) -> Dict:
+        return {
+            'name': self.name,
+            'url': self.url,
+            'alive': self.alive,
+            'latency_ms': self.latency_ms,
+            'last_checked': self.last_checked,
+            'last_error': self.last_error,
+            'breaker': breaker.state,
+        }
+
+class HealthMonitor:
+    """Sondeo periódico de participantes y registro de breakers por URL."""
+    def __init__(self, interval: float, failure_threshold: int, reset_timeout: float, probe_timeout: float):
+        self.interval = interval
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self._health: Dict[str, ParticipantHealth] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._workers = 0
+
+    # start: Registra los participantes e inicia el hilo de sondeo. En una recarga con
+    # participantes nuevos el pool de sondeo se reemplaza por uno de su tamaño.
+    def start(self, participants: List[Dict[str, str]]):
+        for p in participants:
+            self._entry(p['url'], p['name'])
+        if self.interval <= 0:
+            return
+        with self._lock:
+            size, old = max(1, len(self._health)), self._executor
+            if old is None or self._workers < size:
+                self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='health')
+                self._workers = size
+            else:
+                old = None
+        if old is not None:
+            old.shutdown(wait=False)
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='health-monitor', daemon=True)
+        self._thread.start()
+
+    # stop: Detiene el sondeo.
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            self._workers = 0
+
+    # breaker: Devuelve (creándolo si falta) el breaker de una URL.
+    def breaker(self, url: str) -> CircuitBreaker:
+        url = url.rstrip('/')
+        breaker = self._breakers.get(url)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(url, CircuitBreaker(self.failure_threshold, self.reset_timeout))
+        return breaker
+
+    # allow: Atajo para consultar el breaker de una URL.
+    def allow(self, url: str) -> bool:
+        return self.breaker(url).allow()
+
+    # allow_all: Pide permiso para contactar a todas las URLs. Primero revisa el estado sin
+    # consumir pruebas HALF_OPEN; solo si ninguna está bloqueada llama a `allow` en cada una
+    # (y devuelve las pruebas concedidas si otra petición ganó alguna). Retorna las URLs
+    # bloqueadas (vacía si se pueden contactar todas).
+    def allow_all(self, urls: List[str]) -> List[str]:
+        blocked = [url for url in urls if self.breaker(url).blocked()]
+        if blocked:
+            return blocked
+        granted = []
+        for url in urls:
+            if not self.allow(url):
+                for other in granted:
+                    self.breaker(other).release()
+                return [url]
+            granted.append(url)
+        return []
+
+    # record: Registra el resultado de una llamada (éxito = respuesta HTTP < 500 o /health 200).
+    def record(self, url: str, ok: bool):
+        breaker = self.breaker(url)
+        if ok:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+    # is_available: Estado cacheado: vivo según el último sondeo y breaker no abierto.
+    def is_available(self, url: str) -> bool:
+        url = url.rstrip('/')
+        health = self._health.get(url)
+        return (health is None or health.alive is not False) and self.breaker(url).state != 'OPEN'
+
+    # snapshot: Estado de todos los participantes para /health.
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            entries = list(self._health.values())
+        return [h.to_dict(self.breaker(h.url)) for h in entries]
+
+    # probe_all: Sondea a todos los participantes en paralelo (una vuelta del monitor).
+    def probe_all(self):
+        with self._lock:
+            entries = list(self._health.values())
+            executor = self._executor
+        if executor is None:
+            for h in entries:
+                self._probe(h)
+            return
+        wait([executor.submit(self._probe, h) for h in entries])
+
+    # _entry: Devuelve (creándolo si falta) el registro de salud de una URL.
+    def _entry(self, url: str, name: str) -> ParticipantHealth:
+        url = url.rstrip('/')
+        with self._lock:
+            return self._health.setdefault(url, ParticipantHealth(name, url))
+
+    # _probe: GET /health a un participante y actualización de su estado y breaker.
+    def _probe(self, h: ParticipantHealth):
+        started = time.perf_counter()
+        try:
+            resp = clients.get(h.url).get('/health', timeout=self.probe_timeout)
+            ok = resp.status_code == 200
+            h.last_error = None if ok else f"HTTP {resp.status_code}"
+        except Exception as e:
+            ok = False
+            h.last_error = str(e)
+        h.latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        h.last_checked = time.time()
+        h.alive = ok
+        self.record(h.url, ok)
+
+    # _loop: Sondea cada intervalo hasta que se pida detener.
+    def _loop(self):
+        while True:
+            try:
+                self.probe_all()
+            except Exception:
+                pass
+            if self._stop.wait(self.interval):
+                return
+
+# Instancia compartida por el coordinador, /balance y /health.
+health_monitor = HealthMonitor(
+    settings.health_interval, settings.breaker_failures, settings.breaker_reset_sec, settings.health_timeout
+)
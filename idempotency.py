@@ -0,0 +1,285 @@
+"""Deduplicación de /transfer mediante la cabecera Idempotency-Key.
+
+Cada clave (por usuario) se resuelve en tres niveles:
+  1. LRU en memoria con las respuestas ya terminadas.
+  2. Transferencias en curso en este proceso: los duplicados concurrentes
+     esperan el mismo future en vez de lanzar otra ronda 2PC.
+  3. Tabla `IdempotencyRecord`: la fila IN_PROGRESS insertada antes de empezar
+     sirve de lock entre procesos; un duplicado en otro worker sondea la fila
+     hasta que pasa a DONE y devuelve la respuesta registrada.
+
+Si la transferencia falla después de poder contactar a los participantes la
+clave no se libera: la fila pasa a FAILED con su tx_id y los reintentos
+devuelven el resultado de ese tx_id en cuanto existe en `TransactionLog`.
+
+Reusar una clave con un payload distinto se rechaza (`IdempotencyConflict`).
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from config import get_settings
+from database import DBSession
+from models import IdempotencyRecord, TransactionLog
+import metrics
+
+settings = get_settings()
+
+class IdempotencyConflict(Exception):
+    """La clave ya se usó con un payload distinto."""
+
+class IdempotencyInProgress(Exception):
+    """Otra petición con la misma clave sigue en curso tras la espera máxima."""
+    def __init__(self, tx_id: str):
+        super().__init__(tx_id)
+        self.tx_id = tx_id
+
+# fingerprint: Hash estable del payload de la petición.
+def fingerprint(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+# transfer_response: Respuesta de /transfer para una transacción registrada.
+def transfer_response(log: TransactionLog) -> dict:
+    return {"tx_id": log.tx_id, "status": log.status, "participants": log.participant_states()}
+
+class IdempotencyStore:
+    """Respuestas por (scope, clave) en memoria y en la tabla IdempotencyRecord."""
+    def __init__(self, max_size: int, ttl: float, wait_timeout: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        # (scope, key) -> (fingerprint, respuesta, expira en epoch)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, dict, float]]" = OrderedDict()
+        # (scope, key) -> (fingerprint, future con la respuesta)
+        self._inflight: Dict[Tuple[str, str], Tuple[str, asyncio.Future]] = {}
+        self._lock = threading.Lock()
+        self.replays = 0
+
+    # execute: Ejecuta `producer(tx_id)` una sola vez por clave.
+    # Retorna (respuesta, replayed); replayed=True si la respuesta es de una ejecución anterior.
+    async def execute(self, scope: str, key: str, fp: str,
+                      producer: Callable[[str], Awaitable[dict]]) -> Tuple[dict, bool]:
+        ident = (scope, key)
+        cached = self._memory_get(ident)
+        if cached is not None:
+            self._check(fp, cached[0])
+            return self._replayed(cached[1], 'memory'), True
+        inflight = self._inflight.get(ident)
+        if inflight is not None:
+            self._check(fp, inflight[0])
+            try:
+                response = await asyncio.wait_for(asyncio.shield(inflight[1]), self.wait_timeout)
+            except asyncio.TimeoutError:
+                raise IdempotencyInProgress('')
+            return self._replayed(response, 'inflight'), True
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[ident] = (fp, future)
+        owned = False
+        try:
+            tx_id = str(uuid.uuid4())
+            existing = await run_in_threadpool(self._claim, scope, key, fp, tx_id)
+            if existing is None:
+                owned = True
+                response = await producer(tx_id)
+                await run_in_threadpool(self._complete, scope, key, response)
+                metrics.idempotency_total.inc(result='executed')
+                replayed = False
+            else:
+                self._check(fp, existing.fingerprint)
+                response = self._replayed(await self._wait_done(existing), 'database')
+                replayed = True
+            self._memory_put(ident, fp, response)
+            future.set_result(response)
+            return response, replayed
+        except Exception as e:
+            if owned:
+                if isinstance(e, HTTPException) and e.status_code < 500:
+                    # Rechazada antes de contactar a los participantes (ruteo, planificador).
+                    await run_in_threadpool(self._release, scope, key)
+                else:
+                    await run_in_threadpool(self._fail, scope, key)
+            future.set_exception(e)
+            future.exception()  # marcado como leído aunque no haya duplicados esperando
+            raise
+        finally:
+            self._inflight.pop(ident, None)
+
+    # recover: Resuelve al arrancar las filas IN_PROGRESS/FAILED que dejó una caída o un fallo:
+    # con TransactionLog para su tx_id pasan a DONE; una IN_PROGRESS sin transacción registrada
+    # y más vieja que IDEMPOTENCY_WAIT_SEC + TX_DEADLINE_MAX_MS se borra (nunca llegó al log del
+    # coordinador, que `TransactionService.recover` ya volcó a TransactionLog). Retorna
+    # (resueltas, borradas).
+    def recover(self) -> Tuple[int, int]:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.wait_timeout + settings.tx_deadline_max)
+        resolved = expired = 0
+        with DBSession() as s:
+            rows = s.exec(select(IdempotencyRecord).where(
+                IdempotencyRecord.status.in_(('IN_PROGRESS', 'FAILED'))
+            )).all()
+            for row in rows:
+                log = s.exec(select(TransactionLog).where(TransactionLog.tx_id == row.tx_id)).first()
+                if log is not None:
+                    row.status, row.response = 'DONE', json.dumps(transfer_response(log))
+                    row.updated_at = datetime.utcnow()
+                    s.add(row)
+                    resolved += 1
+                elif row.status == 'IN_PROGRESS' and row.created_at < cutoff:
+                    s.delete(row)
+                    expired += 1
+            s.commit()
+        return resolved, expired
+
+    # stats: Tamaño de la caché, claves en curso y respuestas repetidas.
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "inflight": len(self._inflight), "replays": self.replays}
+
+    # _check: Rechaza la clave si el payload no coincide con el original.
+    @staticmethod
+    def _check(fp: str, stored_fp: str):
+        if fp != stored_fp:
+            metrics.idempotency_total.inc(result='conflict')
+            raise IdempotencyConflict()
+
+    # _replayed: Contabiliza una respuesta repetida según su origen y la devuelve.
+    def _replayed(self, response: dict, source: str) -> dict:
+        with self._lock:
+            self.replays += 1
+        metrics.idempotency_total.inc(result=f'replayed_{source}')
+        return response
+
+    # _wait_done: Sondea una fila IN_PROGRESS de otro proceso hasta que termine. Una fila FAILED
+    # se resuelve con la transacción registrada de su tx_id, o se informa como en curso.
+    async def _wait_done(self, record: IdempotencyRecord) -> dict:
+        deadline = time.monotonic() + self.wait_timeout
+        while record.status != 'DONE':
+            if record.status == 'FAILED':
+                response = await run_in_threadpool(self._resolve, record.scope, record.key, record.tx_id)
+                if response is None:
+                    raise IdempotencyInProgress(record.tx_id)
+                return response
+            if time.monotonic() >= deadline:
+                raise IdempotencyInProgress(record.tx_id)
+            await asyncio.sleep(0.05)
+            record = await run_in_threadpool(self._load, record.scope, record.key)
+            if record is None:
+                # El dueño falló y liberó la clave: el cliente debe reintentar.
+                raise IdempotencyInProgress('')
+        return json.loads(record.response)
+
+    # _claim: Inserta la fila IN_PROGRESS. Retorna None si se obtuvo la clave o la fila existente.
+    # Una fila DONE o FAILED vencida (más vieja que ttl) se reemplaza.
+    def _claim(self, scope: str, key: str, fp: str, tx_id: str) -> Optional[IdempotencyRecord]:
+        with DBSession(expire_on_commit=False) as s:
+            try:
+                s.add(IdempotencyRecord(scope=scope, key=key, fingerprint=fp, tx_id=tx_id))
+                s.commit()
+                return None
+            except IntegrityError:
+                s.rollback()
+            row = s.exec(select(IdempotencyRecord).where(
+                IdempotencyRecord.scope == scope, IdempotencyRecord.key == key
+            )).first()
+            expired = (row is not None and row.status in ('DONE', 'FAILED')
+                       and row.updated_at < datetime.utcnow() - timedelta(seconds=self.ttl))
+            if row is None or expired:
+                if row is not None:
+                    s.delete(row)
+                s.add(IdempotencyRecord(scope=scope, key=key, fingerprint=fp, tx_id=tx_id))
+                try:
+                    s.commit()
+                    return None
+                except IntegrityError:
+                    s.rollback()
+                    return self._load(scope, key)
+            return row
+
+    # _load: Lee la fila de una clave (None si no existe).
+    def _load(self, scope: str, key: str) -> Optional[IdempotencyRecord]:
+        with DBSession(expire_on_commit=False, readonly=True) as s:
+            return s.exec(select(IdempotencyRecord).where(
+                IdempotencyRecord.scope == scope, IdempotencyRecord.key == key
+            )).first()
+
+    # _complete: Marca la fila como DONE con la respuesta serializada.
+    def _complete(self, scope: str, key: str, response: dict):
+        with DBSession() as s:
+            row = s.exec(select(IdempotencyRecord).where(
+                IdempotencyRecord.scope == scope, IdempotencyRecord.key == key
+            )).first()
+            row.status = 'DONE'
+            row.response = json.dumps(response)
+            row.updated_at = datetime.utcnow()
+            s.add(row)
+            s.commit()
+
+    # _fail: Marca la fila propia como FAILED cuando la transferencia falló después de poder
+    # contactar a los participantes; la clave queda ligada a su tx_id.
+    def _fail(self, scope: str, key: str):
+        with DBSession() as s:
+            row = s.exec(select(IdempotencyRecord).where(
+                IdempotencyRecord.scope == scope, IdempotencyRecord.key == key,
+                IdempotencyRecord.status == 'IN_PROGRESS',
+            )).first()
+            if row is not None:
+                row.status = 'FAILED'
+                row.updated_at = datetime.utcnow()
+                s.add(row)
+                s.commit()
+
+    # _resolve: Completa una fila FAILED con la transacción registrada de `tx_id`
+    # (None si todavía no existe en TransactionLog).
+    def _resolve(self, scope: str, key: str, tx_id: str) -> Optional[dict]:
+        with DBSession(readonly=True) as s:
+            log = s.exec(select(TransactionLog).where(TransactionLog.tx_id == tx_id)).first()
+            if log is None:
+                return None
+            response = transfer_response(log)
+        self._complete(scope, key, response)
+        return response
+
+    # _release: Borra una fila IN_PROGRESS propia cuando la transferencia se rechazó sin empezar.
+    def _release(self, scope: str, key: str):
+        with DBSession() as s:
+            row = s.exec(select(IdempotencyRecord).where(
+                IdempotencyRecord.scope == scope, IdempotencyRecord.key == key,
+                IdempotencyRecord.status == 'IN_PROGRESS',
+            )).first()
+            if row is not None:
+                s.delete(row)
+                s.commit()
+
+    # _memory_get: Respuesta vigente en memoria como (fingerprint, respuesta) o None.
+    def _memory_get(self, ident: Tuple[str, str]) -> Optional[Tuple[str, dict]]:
+        with self._lock:
+            entry = self._entries.get(ident)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                del self._entries[ident]
+                return None
+            self._entries.move_to_end(ident)
+            return entry[0], entry[1]
+
+    # _memory_put: Guarda una respuesta terminada, desalojando la menos usada.
+    def _memory_put(self, ident: Tuple[str, str], fp: str, response: dict):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[ident] = (fp, response, time.time() + self.ttl)
+            self._entries.move_to_end(ident)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+# Instancia compartida por el endpoint /transfer.
+idempotency_store = IdempotencyStore(settings.idempotency_cache_size, settings.idempotency_ttl, settings.idempotency_wait)
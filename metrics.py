@@ -0,0 +1,228 @@
+"""Métricas del coordinador en formato de exposición de Prometheus.
+
+Implementación mínima sin dependencias: contadores, gauges e histogramas con
+etiquetas, protegidos por un lock y renderizados como texto en `/metrics`.
+Cubre latencia por participante y fase 2PC, reintentos y timeouts, resultados
+por estado, latencia de commits en BD y del log del coordinador, autenticación,
+transacciones en vuelo, la cola del planificador por cuenta y la cola de
+reentrega de decisiones.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+import httpx
+import requests
+
+# Buckets (segundos) pensados para llamadas de red y commits locales.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _Metric:
+    """Base común: nombre, ayuda, etiquetas y valores por combinación de etiquetas."""
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    # _key: Tupla de valores de etiquetas en el orden declarado.
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    # _fmt_labels: Formatea etiquetas como {a="x",b="y"}.
+    def _fmt_labels(self, key: Tuple[str, ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        body = ','.join(f'{n}="{_escape(v)}"' for n, v in pairs)
+        return '{' + body + '}'
+
+    # render: Líneas de texto de la métrica.
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value) -> List[str]:
+        return [f"{self.name}{self._fmt_labels(key)} {_num(value)}"]
+
+class Counter(_Metric):
+    """Contador monótono."""
+    kind = 'counter'
+
+    # inc: Suma `amount` a la serie de las etiquetas dadas.
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """Valor que sube y baja (p.ej. transacciones en vuelo)."""
+    kind = 'gauge'
+
+    # inc: Incrementa la serie.
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    # dec: Decrementa la serie.
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    # set: Fija el valor de la serie.
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    # track: Context manager que mantiene la serie incrementada mientras dura el bloque.
+    @contextmanager
+    def track(self, amount: float = 1, **labels):
+        self.inc(amount, **labels)
+        try:
+            yield
+        finally:
+            self.dec(amount, **labels)
+
+class Histogram(_Metric):
+    """Histograma acumulativo con buckets fijos."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    # observe: Registra una observación (en segundos).
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += 1
+            state[2] += value
+
+    # time: Context manager que observa la duración del bloque.
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_value(self, key, value) -> List[str]:
+        counts, total, sum_ = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{self._fmt_labels(key, (('le', _num(bound)),))} {cumulative}")
+        lines.append(f"{self.name}_bucket{self._fmt_labels(key, (('le', '+Inf'),))} {total}")
+        lines.append(f"{self.name}_sum{self._fmt_labels(key)} {_num(sum_)}")
+        lines.append(f"{self.name}_count{self._fmt_labels(key)} {total}")
+        return lines
+
+class Registry:
+    """Conjunto de métricas expuestas en /metrics."""
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    # register: Agrega una métrica y la devuelve.
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    # render: Texto completo en formato de exposición 0.0.4.
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return '\n'.join(lines) + '\n'
+
+# _escape: Escapa valores de etiquetas según el formato de Prometheus.
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# _num: Formatea números sin decimales superfluos.
+def _num(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+# is_timeout: Indica si una excepción de transporte fue un timeout (requests o httpx).
+def is_timeout(exc: Exception) -> bool:
+    return isinstance(exc, (requests.Timeout, httpx.TimeoutException))
+
+registry = Registry()
+
+phase_seconds = registry.register(Histogram(
+    'tpc_participant_phase_seconds', 'Latencia de cada mensaje 2PC por participante y fase (incluye reintentos).',
+    ('participant', 'phase'),
+))
+phase_retries = registry.register(Counter(
+    'tpc_participant_retries_total', 'Reintentos de mensajes 2PC por participante y fase.', ('participant', 'phase'),
+))
+phase_timeouts = registry.register(Counter(
+    'tpc_participant_timeouts_total', 'Timeouts de mensajes 2PC por participante y fase.', ('participant', 'phase'),
+))
+phase_errors = registry.register(Counter(
+    'tpc_participant_errors_total', 'Errores de transporte (no timeout) por participante y fase.', ('participant', 'phase'),
+))
+messages_total = registry.register(Counter(
+    'tpc_messages_total', 'Mensajes 2PC enviados a participantes por protocolo (1pc, 2pc, 2pc-pa).', ('protocol',),
+))
+forced_log_writes_total = registry.register(Counter(
+    'tpc_forced_log_writes_total', 'Escrituras forzadas (con espera de fsync) al log del coordinador por protocolo.', ('protocol',),
+))
+transactions_total = registry.register(Counter(
+    'tpc_transactions_total', 'Transacciones terminadas por estado final.', ('status',),
+))
+transaction_seconds = registry.register(Histogram(
+    'tpc_transaction_seconds', 'Duración total de cada transacción en el coordinador.', ('mode',),
+))
+in_flight = registry.register(Gauge(
+    'tpc_transactions_in_flight', 'Transacciones en curso en el coordinador.', ('mode',),
+))
+db_commit_seconds = registry.register(Histogram(
+    'db_commit_seconds', 'Latencia de commits en la base de datos del coordinador.', ('operation',),
+))
+wal_append_seconds = registry.register(Histogram(
+    'coordinator_log_append_seconds', 'Espera hasta que un registro forzado del log del coordinador queda en disco.', ('record',),
+))
+idempotency_total = registry.register(Counter(
+    'idempotency_requests_total', 'Peticiones con Idempotency-Key por resultado (executed, replayed_*, conflict).', ('result',),
+))
+scheduler_queue_depth = registry.register(Gauge(
+    'scheduler_queue_depth', 'Transferencias admitidas esperando turno (cuenta ocupada o límite en vuelo).',
+))
+scheduler_running = registry.register(Gauge(
+    'scheduler_running', 'Transferencias ejecutándose tras pasar el planificador.',
+))
+scheduler_accounts_busy = registry.register(Gauge(
+    'scheduler_accounts_busy', 'Cuentas con transferencias en curso o en espera.',
+))
+scheduler_wait_seconds = registry.register(Histogram(
+    'scheduler_wait_seconds', 'Espera en el planificador desde la admisión hasta empezar el 2PC.',
+))
+scheduler_rejected_total = registry.register(Counter(
+    'scheduler_rejected_total', 'Transferencias rechazadas con 429 por motivo.', ('reason',),
+))
+redelivery_pending = registry.register(Gauge(
+    'redelivery_pending', 'Decisiones registradas cuyo COMMIT/ROLLBACK aún no confirmaron todos los participantes.',
+))
+decision_delivery_seconds = registry.register(Histogram(
+    'decision_delivery_seconds', 'Tiempo desde la decisión hasta que todos los participantes la confirman.', ('decision',),
+))
+auth_seconds = registry.register(Histogram(
+    'auth_resolve_seconds', 'Resolución del usuario autenticado por origen.', ('source',),
+))
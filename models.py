@@ -1,12 +1,15 @@
 """Modelos de datos persistentes.
 
-Incluye usuarios, log de transacciones y caché de balances para posibles
-consultas tolerantes a fallos.
+Incluye usuarios, log de transacciones con el resultado de cada participante,
+caché de balances para posibles consultas tolerantes a fallos, registros de
+claves de idempotencia y los agregados de `/transactions/stats`.
 """
 
+import json
 from datetime import datetime
-from typing import Optional
-from sqlmodel import SQLModel, Field
+from typing import List, Optional
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field, Relationship
 
 class User(SQLModel, table=True):
     """Representa un usuario autenticable con rol.
@@ -24,14 +27,111 @@ class User(SQLModel, table=True):
 class TransactionLog(SQLModel, table=True):
     """Registro de cada transacción 2PC.
 
-    Guarda el tx_id, estado final y snapshot JSON de estados de participantes.
+    Guarda el tx_id y el estado final; el resultado de cada participante vive
+    en `ParticipantOutcome` (`outcomes`, cargado junto con la fila). La columna
+    `participants` conserva el JSON de filas anteriores hasta que se migran y
+    queda vacía en las nuevas. `timings` (opcional) guarda el desglose de
+    tiempos por fase y participante.
+    El índice (status, created_at) sirve a reconciliación y filtros por estado;
+    (status, id) a la paginación keyset filtrada por estado.
     """
+    __table_args__ = (
+        Index('ix_transactionlog_status_created_at', 'status', 'created_at'),
+        Index('ix_transactionlog_status_id', 'status', 'id'),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    tx_id: str = Field(index=True)
+    tx_id: str = Field(index=True, unique=True)
     status: str  # PREPARED | COMMITTED | ABORTED | ERROR
-    participants: str  # JSON con estados de cada participante
+    participants: str = ''  # JSON legado con estados de participantes (vacío si ya está en ParticipantOutcome)
+    timings: Optional[str] = None  # JSON con latencias por fase/participante (TX_TIMINGS)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    outcomes: List["ParticipantOutcome"] = Relationship(
+        sa_relationship_kwargs={'lazy': 'selectin', 'order_by': 'ParticipantOutcome.id'}
+    )
+
+    # participant_states: Estados de los participantes como lista de dicts (tabla normalizada o JSON legado).
+    def participant_states(self) -> List[dict]:
+        if self.outcomes:
+            return [o.to_dict() for o in self.outcomes]
+        return json.loads(self.participants) if self.participants else []
+
+class ParticipantOutcome(SQLModel, table=True):
+    """Resultado de un participante en una transacción 2PC (una fila por participante).
+
+    Los índices (participant, estado) permiten consultar y agregar por
+    participante, estado de cada fase y clase de error sin recorrer el log.
+    `created_at` repite el de la transacción para filtrar por rango de fechas.
+    """
+    __table_args__ = (
+        Index('ix_participantoutcome_participant_prepare', 'participant', 'prepare_status'),
+        Index('ix_participantoutcome_participant_commit', 'participant', 'commit_status'),
+        Index('ix_participantoutcome_participant_error', 'participant', 'error_class'),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    tx_id: str = Field(foreign_key='transactionlog.tx_id', index=True)
+    participant: str
+    role: str
+    url: str
+    prepare_status: Optional[str] = None  # READY | ABORT | ERROR | UNREACHABLE
+    commit_status: Optional[str] = None   # COMMITTED | ABORT | ERROR | SKIPPED
+    error: Optional[str] = None
+    error_class: Optional[str] = None  # timeout | connection | circuit_open | rollback | other
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    # to_dict: Mismo formato que el snapshot JSON histórico de participantes.
+    def to_dict(self) -> dict:
+        return {
+            'name': self.participant,
+            'role': self.role,
+            'url': self.url,
+            'prepare_status': self.prepare_status,
+            'commit_status': self.commit_status,
+            'error': self.error,
+        }
+
+class IdempotencyRecord(SQLModel, table=True):
+    """Resultado registrado de una petición /transfer con Idempotency-Key.
+
+    La fila se inserta como IN_PROGRESS antes de iniciar la transferencia (el
+    índice único sobre (scope, key) actúa de lock entre procesos) y pasa a DONE
+    con la respuesta serializada al terminar, o a FAILED (conservando tx_id) si
+    la transferencia falló después de poder contactar a los participantes.
+    """
+    __table_args__ = (
+        Index('ux_idempotencyrecord_scope_key', 'scope', 'key', unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    scope: str  # id del usuario que envió la clave
+    key: str
+    fingerprint: str  # hash del payload; la misma clave con otro payload se rechaza
+    tx_id: str
+    status: str = 'IN_PROGRESS'  # IN_PROGRESS | DONE | FAILED
+    response: Optional[str] = None  # JSON de la respuesta original
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class TransactionStat(SQLModel, table=True):
+    """Contador agregado del log de transacciones (ver tx_stats.py).
+
+    Se actualiza en la misma transacción de BD que escribe o cambia el estado
+    de cada `TransactionLog`, de modo que `/transactions/stats` lee unas pocas
+    filas en vez de recorrer el log.
+      kind: status | bucket | participant | latency.
+      key: estado; '<inicio del bucket>|<estado>'; '<participante>|<métrica>';
+           límite superior en ms del bucket de latencia.
+    """
+    __table_args__ = (
+        Index('ux_transactionstat_kind_key', 'kind', 'key', unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str
+    key: str
+    value: int = 0
 
 class BalanceCache(SQLModel, table=True):
     """Caché de balances para consultas rápidas o fallback.
@@ -1,18 +1,110 @@
 """Abstracciones para ejecutar el protocolo de dos fases (2PC).
 
 Incluye el estado de cada participante y la lógica de PREPARE, COMMIT y ROLLBACK
-con reintentos y manejo de errores básicos.
+(individual y en batch) con reintentos, deadline y manejo de errores básicos.
 """
 
+import asyncio
 import json
+import random
 import time
 import uuid
-from typing import Dict, List
-import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Tuple
 from config import get_settings
+from participant_client import clients
+from health import health_monitor
+import metrics
 
 settings = get_settings()
 
+# Pool compartido para el fan-out de las fases; evita crear hilos por transacción.
+_executor = ThreadPoolExecutor(max_workers=settings.phase_workers, thread_name_prefix='2pc')
+# PREPARE tardíos que siguen en vuelo tras devolver la respuesta; se referencian aquí
+# para que no se recolecten antes de terminar.
+_background: set = set()
+
+# _observe: Registra la latencia de un mensaje en el histograma y en el estado del participante.
+def _observe(name: str, phase: str, started: float, timings: Dict[str, float] | None = None):
+    elapsed = time.perf_counter() - started
+    metrics.phase_seconds.observe(elapsed, participant=name, phase=phase)
+    if timings is not None:
+        timings[f"{phase}_ms"] = round(elapsed * 1000, 2)
+
+# _count_error: Cuenta un error de transporte como timeout o error genérico.
+def _count_error(name: str, phase: str, exc: Exception):
+    counter = metrics.phase_timeouts if metrics.is_timeout(exc) else metrics.phase_errors
+    counter.inc(participant=name, phase=phase)
+
+# _describe: Texto del error de transporte; usa el nombre de la excepción si no trae mensaje
+# (p.ej. los timeouts de httpx) para que quede clasificable.
+def _describe(exc: Exception) -> str:
+    return str(exc) or type(exc).__name__
+
+class ServerError(Exception):
+    """Respuesta 5xx de un participante: cuenta como fallo para reintentos y circuit breaker."""
+
+# _check_response: Lanza ServerError si el participante respondió con un error de servidor;
+# solo las respuestas < 500 se informan como éxito al circuit breaker.
+def _check_response(resp):
+    if resp.status_code >= 500:
+        raise ServerError(f"HTTP {resp.status_code}")
+    return resp
+
+# _status_of: Estado informado por el participante. Sin un `status` en el cuerpo retorna
+# ('ERROR', 'HTTP <código>') para que el resultado quede con error clasificable.
+def _status_of(resp, data: dict) -> Tuple[str, str | None]:
+    status = data.get('status') if isinstance(data, dict) else None
+    if not status:
+        return 'ERROR', f"HTTP {resp.status_code}"
+    return status, None
+
+# error_class: Clasifica el texto de error de un participante para consultas y agregados.
+# Retorna timeout | deadline | connection | circuit_open | rollback | other, o None si no hubo error.
+def error_class(error: str | None) -> str | None:
+    if not error:
+        return None
+    text = error.lower()
+    if text.startswith('rollback_err='):
+        return 'rollback'
+    if text == 'circuit open':
+        return 'circuit_open'
+    if text == 'deadline exceeded':
+        return 'deadline'
+    if 'timeout' in text or 'timed out' in text:
+        return 'timeout'
+    if 'connect' in text or 'refused' in text or 'name or service' in text or 'unreachable' in text:
+        return 'connection'
+    return 'other'
+
+# backoff_delay: Espera antes del reintento número `attempt` (1, 2, ...): jitter completo
+# entre 0 y min(RETRY_MAX_MS, RETRY_BASE_MS * 2^(attempt-1)) para no sincronizar reintentos.
+def backoff_delay(attempt: int) -> float:
+    cap = min(settings.retry_max_ms, settings.retry_base_ms * 2 ** (attempt - 1)) / 1000
+    return random.uniform(0, cap)
+
+class Deadline:
+    """Presupuesto de tiempo de una transacción, medido con reloj monotónico."""
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    # remaining: Segundos que quedan del presupuesto (0 si ya venció).
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    # timeout: Timeout del próximo intento: lo que queda, acotado por REQUEST_TIMEOUT.
+    def timeout(self) -> float:
+        return min(settings.request_timeout, self.remaining())
+
+# _wait_event: Espera hasta `timeout` segundos a que se active el evento; True si se activó.
+async def _wait_event(event: asyncio.Event, timeout: float) -> bool:
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
 class ParticipantState:
     """Estado individual de un participante en una transacción.
 
@@ -22,9 +114,13 @@ class ParticipantState:
         self.name = name
         self.role = role
         self.url = url.rstrip('/')
-        self.prepare_status = None  # READY | ABORT | ERROR | UNREACHABLE
+        self.prepare_status = None  # READY | READ_ONLY | ABORT | ERROR | UNREACHABLE (None en one-phase commit)
         self.commit_status = None   # COMMITTED | ABORT | ERROR | SKIPPED
         self.error: str | None = None
+        # Saldo de la cuenta afectada si el participante lo informa al confirmar (no se serializa).
+        self.balance: float | None = None
+        # Latencia por fase en ms ({'prepare_ms': ..., 'commit_ms': ...}); va a TransactionLog.timings.
+        self.timings: Dict[str, float] = {}
 
     # to_dict: Serializa el estado del participante para logging/almacenamiento.
     def to_dict(self):
@@ -39,72 +135,434 @@ class ParticipantState:
 
 class TwoPhaseCommit:
     """Orquesta una transacción 2PC sobre un conjunto de participantes."""
-    def __init__(self, participants_cfg: List[Dict[str, str]]):
-        self.tx_id = str(uuid.uuid4())
+    def __init__(self, participants_cfg: List[Dict[str, str]], tx_id: str | None = None):
+        self.tx_id = tx_id or str(uuid.uuid4())
         self.participants = [ParticipantState(p['name'], p['role'], p['url']) for p in participants_cfg]
+        # Mensajes 2PC enviados (PREPARE con reintentos, COMMIT, ROLLBACK).
+        self.messages = 0
+        # PREPARE que seguían en vuelo al abortar temprano; un voto READY tardío marca al
+        # participante READY para que la entrega del ABORT le envíe ROLLBACK.
+        self.late: List[asyncio.Task] = []
 
     # _prepare_payload: Construye payload específico por rol para fase PREPARE.
-    def _prepare_payload(self, p: ParticipantState, amount: float, from_account: int, to_account: int):
+    # Con TPC_READ_ONLY (y read_only=True) se avisa al participante que puede votar READ_ONLY.
+    def _prepare_payload(self, p: ParticipantState, amount: float, from_account: int, to_account: int,
+                         read_only: bool = True):
         if p.role == 'debit':
-            return {'tx_id': self.tx_id, 'amount': amount, 'from_account': from_account}
-        if p.role == 'credit':
-            return {'tx_id': self.tx_id, 'amount': amount, 'to_account': to_account}
-        # mirror: replica info completa para potencial sincronización.
-        return {'tx_id': self.tx_id, 'amount': amount, 'from_account': from_account, 'to_account': to_account}
+            payload = {'tx_id': self.tx_id, 'amount': amount, 'from_account': from_account}
+        elif p.role == 'credit':
+            payload = {'tx_id': self.tx_id, 'amount': amount, 'to_account': to_account}
+        else:
+            # mirror: replica info completa para potencial sincronización; transfer: el
+            # participante es dueño de ambas cuentas (ruteo) y aplica débito y crédito.
+            payload = {'tx_id': self.tx_id, 'amount': amount, 'from_account': from_account, 'to_account': to_account}
+        if read_only and settings.tpc_read_only:
+            payload['read_only_ok'] = True
+        return payload
 
-    # _commit_payload: Reutiliza el mismo payload que PREPARE (puede extenderse si difieren).
+    # _commit_payload: Mismo payload que PREPARE sin el aviso de READ_ONLY.
     def _commit_payload(self, p: ParticipantState, amount: float, from_account: int, to_account: int):
-        return self._prepare_payload(p, amount, from_account, to_account)
+        return self._prepare_payload(p, amount, from_account, to_account, read_only=False)
 
-    # phase_prepare: Ejecuta la fase PREPARE contra todos los participantes.
-    # Retorna True si todos responden READY, False si alguno falla/ABORT.
-    def phase_prepare(self, amount: float, from_account: int, to_account: int):
-        for p in self.participants:
-            payload = self._prepare_payload(p, amount, from_account, to_account)
-            for attempt in range(settings.max_retries + 1):
-                try:
-                    resp = requests.post(f"{p.url}/prepare", json=payload, timeout=settings.request_timeout)
-                    data = resp.json()
-                    p.prepare_status = data.get('status', 'ERROR')
-                    break
-                except Exception as e:
-                    p.prepare_status = 'UNREACHABLE'
-                    p.error = str(e)
-                    time.sleep(0.2 * (attempt + 1))
-            if p.prepare_status not in ('READY',):
+    # _send_prepare: Envía PREPARE a un participante con reintentos (asíncrono).
+    # Retorna (status, error) sin modificar el estado; None si se canceló antes de votar.
+    # Cada intento usa lo que queda de `deadline`; agotado el presupuesto vota UNREACHABLE.
+    async def _send_prepare(self, p: ParticipantState, payload: dict, cancel: asyncio.Event, deadline: Deadline):
+        status, error = None, None
+        started = time.perf_counter()
+        sent = False
+        for attempt in range(settings.max_retries + 1):
+            if cancel.is_set():
+                return None, error
+            timeout = deadline.timeout()
+            if timeout <= 0:
+                status, error = 'UNREACHABLE', 'deadline exceeded'
+                break
+            if attempt:
+                metrics.phase_retries.inc(participant=p.name, phase='prepare')
+            self.messages += 1
+            sent = True
+            try:
+                resp = _check_response(await clients.get_async(p.url).post("/prepare", json=payload, timeout=timeout))
+                health_monitor.record(p.url, True)
+                _observe(p.name, 'prepare', started, p.timings)
+                status, bad = _status_of(resp, resp.json())
+                return status, bad or error
+            except Exception as e:
+                status, error = 'UNREACHABLE', _describe(e)
+                _count_error(p.name, 'prepare', e)
+                delay = min(backoff_delay(attempt + 1), deadline.remaining())
+                if attempt < settings.max_retries and await _wait_event(cancel, delay):
+                    return None, error
+        if sent:
+            # Sin ningún intento (presupuesto agotado en la cola) no se culpa al participante.
+            health_monitor.record(p.url, False)
+            _observe(p.name, 'prepare', started, p.timings)
+        return status, error
+
+    # _send_commit: Envía COMMIT a un participante. Retorna (status, error, balance).
+    def _send_commit(self, p: ParticipantState, payload: dict):
+        started = time.perf_counter()
+        try:
+            resp = _check_response(clients.get(p.url).post("/commit", json=payload))
+        except Exception as e:
+            health_monitor.record(p.url, False)
+            _count_error(p.name, 'commit', e)
+            _observe(p.name, 'commit', started, p.timings)
+            return 'ERROR', _describe(e), None
+        health_monitor.record(p.url, True)
+        _observe(p.name, 'commit', started, p.timings)
+        try:
+            data = resp.json()
+            status, error = _status_of(resp, data)
+            return status, error, data.get('balance')
+        except Exception as e:
+            return 'ERROR', _describe(e), None
+
+    # _send_commit_async: Versión asíncrona de _send_commit (timeout opcional del intento).
+    async def _send_commit_async(self, p: ParticipantState, payload: dict, timeout: float | None = None):
+        started = time.perf_counter()
+        try:
+            resp = _check_response(await clients.get_async(p.url).post("/commit", json=payload, timeout=timeout))
+        except Exception as e:
+            health_monitor.record(p.url, False)
+            _count_error(p.name, 'commit', e)
+            _observe(p.name, 'commit', started, p.timings)
+            return 'ERROR', _describe(e), None
+        health_monitor.record(p.url, True)
+        _observe(p.name, 'commit', started, p.timings)
+        try:
+            data = resp.json()
+            status, error = _status_of(resp, data)
+            return status, error, data.get('balance')
+        except Exception as e:
+            return 'ERROR', _describe(e), None
+
+    # _send_rollback: Envía ROLLBACK a un participante. Retorna el error o None.
+    def _send_rollback(self, p: ParticipantState):
+        started = time.perf_counter()
+        try:
+            _check_response(clients.get(p.url).post("/rollback", json={'tx_id': self.tx_id}))
+            health_monitor.record(p.url, True)
+            return None
+        except Exception as e:
+            health_monitor.record(p.url, False)
+            _count_error(p.name, 'rollback', e)
+            return _describe(e)
+        finally:
+            _observe(p.name, 'rollback', started, p.timings)
+
+    # _send_rollback_async: Versión asíncrona de _send_rollback.
+    async def _send_rollback_async(self, p: ParticipantState):
+        started = time.perf_counter()
+        try:
+            _check_response(await clients.get_async(p.url).post("/rollback", json={'tx_id': self.tx_id}))
+            health_monitor.record(p.url, True)
+            return None
+        except Exception as e:
+            health_monitor.record(p.url, False)
+            _count_error(p.name, 'rollback', e)
+            return _describe(e)
+        finally:
+            _observe(p.name, 'rollback', started, p.timings)
+
+    # _compensate_late_prepare: Callback para PREPAREs que seguían en vuelo al abortar.
+    # Si el voto tardío fue READY el participante queda READY: la entrega del ABORT
+    # (redelivery_queue) le envía ROLLBACK con reintentos antes de marcar END.
+    def _compensate_late_prepare(self, p: ParticipantState, task: asyncio.Task):
+        _background.discard(task)
+        if task.cancelled() or task.exception() is not None:
+            return
+        status, _ = task.result()
+        if status == 'READY':
+            p.prepare_status = 'READY'
+
+    # read_only: True si todos los participantes votaron READ_ONLY (no hay fase COMMIT).
+    def read_only(self) -> bool:
+        return all(p.prepare_status == 'READ_ONLY' for p in self.participants)
+
+    # phase_one: One-phase commit con un único participante: COMMIT directo con `one_phase`
+    # y el participante decide solo. Retorna 'COMMITTED', 'ABORTED' si lo rechazó, o
+    # 'PREPARED' si no hubo respuesta válida (desenlace incierto: lo resuelve la reconciliación).
+    async def phase_one(self, amount: float, from_account: int, to_account: int, deadline: Deadline) -> str:
+        p = self.participants[0]
+        if not health_monitor.allow(p.url):
+            p.commit_status, p.error = 'SKIPPED', 'circuit open'
+            return 'ABORTED'
+        if deadline.timeout() <= 0:
+            p.commit_status, p.error = 'SKIPPED', 'deadline exceeded'
+            return 'ABORTED'
+        self.messages += 1
+        payload = {**self._commit_payload(p, amount, from_account, to_account), 'one_phase': True}
+        p.commit_status, error, p.balance = await self._send_commit_async(p, payload, deadline.timeout())
+        if error:
+            p.error = error
+        if p.commit_status == 'COMMITTED':
+            return 'COMMITTED'
+        return 'ABORTED' if p.commit_status == 'ABORT' else 'PREPARED'
+
+    # phase_prepare: Ejecuta la fase PREPARE contra todos los participantes en paralelo.
+    # Retorna True si todos responden READY, False si alguno falla/ABORT. El primer
+    # voto negativo aborta sin esperar los PREPARE pendientes (terminan en segundo
+    # plano y se compensan) y un breaker abierto aborta sin contactar a nadie (ni gastar
+    # la prueba HALF_OPEN de los demás). Los reintentos de cada PREPARE comparten el
+    # presupuesto `deadline` de la transacción.
+    async def phase_prepare(self, amount: float, from_account: int, to_account: int, deadline: Deadline):
+        blocked = set(health_monitor.allow_all([p.url for p in self.participants]))
+        if blocked:
+            for p in self.participants:
+                if p.url in blocked:
+                    p.prepare_status, p.error = 'UNREACHABLE', 'circuit open'
+            return False
+        cancel = asyncio.Event()
+        tasks = {
+            asyncio.ensure_future(self._send_prepare(
+                p, self._prepare_payload(p, amount, from_account, to_account), cancel, deadline
+            )): p
+            for p in self.participants
+        }
+        accepted = ('READY', 'READ_ONLY') if settings.tpc_read_only else ('READY',)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            aborted = False
+            for t in done:
+                p = tasks[t]
+                p.prepare_status, error = t.result()
+                if error:
+                    p.error = error
+                if p.prepare_status not in accepted:
+                    aborted = True
+            if aborted:
                 # Abort temprano si algún participante no está listo.
+                cancel.set()
+                for t in pending:
+                    _background.add(t)
+                    t.add_done_callback(lambda task, p=tasks[t]: self._compensate_late_prepare(p, task))
+                self.late = list(pending)
                 return False
         return True
 
-    # phase_commit: Envía COMMIT a todos los participantes READY.
-    # Si falla alguno, dispara phase_rollback y retorna False.
-    def phase_commit(self, amount: float, from_account: int, to_account: int):
+    # phase_commit: Envía COMMIT en paralelo a todos los participantes READY y reintenta
+    # (hasta REQUEST_RETRIES veces, con backoff) a los que no confirman. La decisión COMMIT
+    # ya está en el log: nunca se envía ROLLBACK. Retorna False si alguno sigue sin
+    # confirmar; la transacción queda en duda y la recuperación o el reconciliador
+    # completan el COMMIT.
+    async def phase_commit(self, amount: float, from_account: int, to_account: int):
+        pending = []
         for p in self.participants:
             if p.prepare_status != 'READY':
                 p.commit_status = 'SKIPPED'
                 continue
-            payload = self._commit_payload(p, amount, from_account, to_account)
-            try:
-                resp = requests.post(f"{p.url}/commit", json=payload, timeout=settings.request_timeout)
-                p.commit_status = resp.json().get('status', 'ERROR')
-            except Exception as e:
-                p.commit_status = 'ERROR'
-                p.error = str(e)
-        failed = [p for p in self.participants if p.commit_status not in ('COMMITTED', 'SKIPPED')]
-        if failed:
-            self.phase_rollback(amount, from_account, to_account)
-            return False
-        return True
+            pending.append(p)
+        for attempt in range(settings.max_retries + 1):
+            if attempt:
+                for p in pending:
+                    metrics.phase_retries.inc(participant=p.name, phase='commit')
+                await asyncio.sleep(backoff_delay(attempt))
+            self.messages += len(pending)
+            results = await asyncio.gather(*(
+                self._send_commit_async(p, self._commit_payload(p, amount, from_account, to_account)) for p in pending
+            ))
+            for p, (status, error, balance) in zip(pending, results):
+                p.commit_status, p.balance = status, balance
+                if error:
+                    p.error = error
+            pending = [p for p in pending if p.commit_status != 'COMMITTED']
+            if not pending:
+                return True
+        return False
 
-    # phase_rollback: Mejor esfuerzo para revertir participantes que estaban READY.
-    def phase_rollback(self, amount: float, from_account: int, to_account: int):
-        for p in self.participants:
-            if p.prepare_status == 'READY':
-                try:
-                    requests.post(f"{p.url}/rollback", json={'tx_id': self.tx_id}, timeout=settings.request_timeout)
-                except Exception as e:
-                    p.error = (p.error or '') + f"; rollback_err={e}" if p.error else f"rollback_err={e}"
+    # phase_rollback: Envía ROLLBACK en paralelo a los participantes que estaban READY.
+    # Retorna True si todos confirmaron.
+    async def phase_rollback(self, amount: float, from_account: int, to_account: int) -> bool:
+        ready = [p for p in self.participants if p.prepare_status == 'READY']
+        self.messages += len(ready)
+        errors = await asyncio.gather(*(self._send_rollback_async(p) for p in ready))
+        for p, e in zip(ready, errors):
+            if e:
+                p.error = (p.error or '') + f"; rollback_err={e}" if p.error else f"rollback_err={e}"
+        return not any(errors)
+
+    # resend_decision: Reenvía una decisión ya registrada (recuperación o reconciliación).
+    # COMMIT se reenvía a los participantes que votaron READY; ABORT se envía a todos
+    # (quien no llegó a preparar simplemente lo ignora). Sin datos de la transferencia
+    # el COMMIT lleva solo el tx_id. Los participantes con el breaker abierto no se
+    # contactan y cuentan como no confirmados. Retorna True si todos confirmaron.
+    def resend_decision(self, decision: str, transfer: Tuple[float, int, int] | None = None):
+        targets = self.participants if decision != 'COMMIT' else [
+            p for p in self.participants if p.prepare_status == 'READY'
+        ]
+        blocked = [p for p in targets if not health_monitor.allow(p.url)]
+        for p in blocked:
+            p.error = 'circuit open'
+        targets = [p for p in targets if p not in blocked]
+        if decision == 'COMMIT':
+            futures = {
+                _executor.submit(
+                    self._send_commit, p, self._commit_payload(p, *transfer) if transfer else {'tx_id': self.tx_id}
+                ): p
+                for p in targets
+            }
+            self.messages += len(futures)
+            for f in wait(futures).done:
+                p = futures[f]
+                p.commit_status, error, p.balance = f.result()
+                if error:
+                    p.error = error
+            return not blocked and all(p.commit_status == 'COMMITTED' for p in futures.values())
+        futures = {_executor.submit(self._send_rollback, p): p for p in targets}
+        self.messages += len(futures)
+        ok = not blocked
+        for f in wait(futures).done:
+            e = f.result()
+            if e:
+                p = futures[f]
+                p.error = f"rollback_err={e}"
+                ok = False
+        return ok
+
+    # _send_status: Consulta a un participante el estado local de la transacción. Una respuesta
+    # no 2xx (p. ej. un banco sin /status) o sin campo status cuenta como UNREACHABLE: así la
+    # transacción sigue en duda en vez de abortarse a ciegas.
+    def _send_status(self, p: ParticipantState):
+        try:
+            resp = clients.get(p.url).get(f"/status/{self.tx_id}")
+            if not 200 <= resp.status_code < 300:
+                return 'UNREACHABLE'
+            return resp.json().get('status') or 'UNREACHABLE'
+        except Exception:
+            return 'UNREACHABLE'
+
+    # query_status: Pregunta en paralelo a cada participante el desenlace real
+    # (PREPARED | COMMITTED | ABORTED | UNKNOWN, o UNREACHABLE si no responde con un estado válido).
+    def query_status(self) -> Dict[str, str]:
+        futures = {_executor.submit(self._send_status, p): p for p in self.participants}
+        return {futures[f].name: f.result() for f in wait(futures).done}
+
+    # votes: Mapa nombre de participante -> voto PREPARE, para el log del coordinador.
+    def votes(self) -> Dict[str, str | None]:
+        return {p.name: p.prepare_status for p in self.participants}
 
     # serialize: Devuelve JSON con lista de estados de participantes.
     def serialize(self):
         return json.dumps([p.to_dict() for p in self.participants])
+
+class BatchTwoPhaseCommit:
+    """Orquesta N transferencias 2PC agrupando sus mensajes por participante.
+
+    Cada transferencia conserva su propio `TwoPhaseCommit` (tx_id y estados),
+    pero cada fase envía un único mensaje por participante con todos los tx_ids
+    (`/prepare/batch`, `/commit/batch`, `/rollback/batch`). Los votos y
+    resultados se evalúan por transferencia.
+    """
+    def __init__(self, participants_cfg: List[Dict[str, str]], transfers: List[Tuple[float, int, int]]):
+        self.transfers = transfers
+        self.items = [TwoPhaseCommit(participants_cfg) for _ in transfers]
+        self.participant_count = len(participants_cfg)
+
+    # _post_batch: Envía un mensaje batch a un participante con reintentos.
+    # Retorna (mapa tx_id -> status, error); el mapa es None si no hubo respuesta.
+    def _post_batch(self, p: ParticipantState, path: str, body: dict, retries: int):
+        error = None
+        phase = path.strip('/').replace('/', '_')
+        started = time.perf_counter()
+        for attempt in range(retries + 1):
+            if attempt:
+                metrics.phase_retries.inc(participant=p.name, phase=phase)
+            try:
+                resp = _check_response(clients.get(p.url).post(path, json=body))
+                health_monitor.record(p.url, True)
+                _observe(p.name, phase, started)
+                results = resp.json().get('results', [])
+                return {r.get('tx_id'): r.get('status', 'ERROR') for r in results}, None
+            except Exception as e:
+                error = _describe(e)
+                _count_error(p.name, phase, e)
+                if attempt < retries:
+                    time.sleep(backoff_delay(attempt + 1))
+        health_monitor.record(p.url, False)
+        _observe(p.name, phase, started)
+        return None, error
+
+    # _fan_out: Ejecuta un mensaje batch por participante en paralelo.
+    # `bodies` mapea índice de participante -> (path, body, reintentos).
+    def _fan_out(self, bodies: Dict[int, Tuple[str, dict, int]]):
+        url_of = self.items[0].participants
+        futures = {
+            _executor.submit(self._post_batch, url_of[i], path, body, retries): i
+            for i, (path, body, retries) in bodies.items()
+        }
+        return {futures[f]: f.result() for f in wait(futures).done}
+
+    # phase_prepare: Un PREPARE por participante con todos los tx_ids.
+    # Retorna lista de bool indicando si cada transferencia quedó READY en todos.
+    # Con algún breaker abierto todo el lote se aborta sin enviar PREPARE. El lote usa el
+    # protocolo estándar: no ofrece READ_ONLY (solo cuenta READY).
+    def phase_prepare(self):
+        blocked = set(health_monitor.allow_all([p.url for p in self.items[0].participants])) if self.items else set()
+        if blocked:
+            for tpc in self.items:
+                for p in tpc.participants:
+                    if p.url in blocked:
+                        p.prepare_status, p.error = 'UNREACHABLE', 'circuit open'
+            return [False] * len(self.items)
+        bodies = {}
+        for i in range(self.participant_count):
+            payloads = [
+                tpc._prepare_payload(tpc.participants[i], *t, read_only=False) for tpc, t in zip(self.items, self.transfers)
+            ]
+            bodies[i] = ('/prepare/batch', {'items': payloads}, settings.max_retries)
+        for i, (votes, error) in self._fan_out(bodies).items():
+            for tpc in self.items:
+                p = tpc.participants[i]
+                if votes is None:
+                    p.prepare_status, p.error = 'UNREACHABLE', error
+                else:
+                    p.prepare_status = votes.get(tpc.tx_id, 'ERROR')
+        return [all(p.prepare_status == 'READY' for p in tpc.participants) for tpc in self.items]
+
+    # phase_commit: Un COMMIT por participante con los tx_ids preparados en todos (con
+    # reintentos). Retorna lista de bool por transferencia (False si no se preparó o si
+    # algún participante no confirmó el COMMIT; en ese caso queda en duda, no se revierte).
+    def phase_commit(self, prepared: List[bool]):
+        bodies = {}
+        for i in range(self.participant_count):
+            payloads = [
+                tpc._commit_payload(tpc.participants[i], *t)
+                for tpc, t, ok in zip(self.items, self.transfers, prepared) if ok
+            ]
+            if payloads:
+                bodies[i] = ('/commit/batch', {'items': payloads}, settings.max_retries)
+        for i, (results, error) in self._fan_out(bodies).items():
+            for tpc, ok in zip(self.items, prepared):
+                if not ok:
+                    continue
+                p = tpc.participants[i]
+                if results is None:
+                    p.commit_status, p.error = 'ERROR', error
+                else:
+                    p.commit_status = results.get(tpc.tx_id, 'ERROR')
+        return [
+            ok and all(p.commit_status in ('COMMITTED', 'SKIPPED') for p in tpc.participants)
+            for tpc, ok in zip(self.items, prepared)
+        ]
+
+    # phase_rollback: Un ROLLBACK por participante con los tx_ids que no quedaron preparados
+    # en todos (decisión ABORT) y en los que dicho participante había votado READY.
+    def phase_rollback(self, prepared: List[bool]):
+        bodies = {}
+        for i in range(self.participant_count):
+            tx_ids = [
+                tpc.tx_id for tpc, ok in zip(self.items, prepared)
+                if not ok and tpc.participants[i].prepare_status == 'READY'
+            ]
+            if tx_ids:
+                bodies[i] = ('/rollback/batch', {'tx_ids': tx_ids}, 0)
+        for i, (_, e) in self._fan_out(bodies).items():
+            if not e:
+                continue
+            for tpc, ok in zip(self.items, prepared):
+                p = tpc.participants[i]
+                if not ok and p.prepare_status == 'READY':
+                    p.error = (p.error or '') + f"; rollback_err={e}" if p.error else f"rollback_err={e}"
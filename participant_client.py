@@ -0,0 +1,145 @@
+"""Capa de clientes HTTP hacia los participantes 2PC.
+
+Mantiene una sesión `requests` con su propio pool de conexiones persistentes
+(keep-alive) por cada URL de participante, evitando abrir una conexión TCP
+nueva en cada PREPARE, COMMIT, ROLLBACK o sondeo de salud.
+
+El camino de `/transfer` usa además un cliente `httpx.AsyncClient` por
+participante (mismo keep-alive, límite propio de conexiones) para esperar las
+respuestas sin ocupar un hilo; los hilos en segundo plano siguen usando `requests`.
+"""
+
+import threading
+import time
+from typing import Dict, List
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from config import get_settings
+
+settings = get_settings()
+
+class ParticipantClient:
+    """Sesión HTTP persistente hacia un único participante.
+
+    Las conexiones ociosas más tiempo que `keepalive` segundos se descartan
+    antes del siguiente uso para no reutilizar sockets ya cerrados por el peer.
+    """
+    def __init__(self, url: str, pool_size: int, pool_block: bool, keepalive: float):
+        self.url = url.rstrip('/')
+        self.keepalive = keepalive
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=pool_block)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._last_used = time.monotonic()
+        self._lock = threading.Lock()
+
+    # _touch: Registra el uso y recicla el pool si estuvo ocioso más del keep-alive.
+    def _touch(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.keepalive > 0 and now - self._last_used > self.keepalive:
+                self.session.close()
+            self._last_used = now
+
+    # post: POST a una ruta del participante reutilizando conexiones del pool.
+    def post(self, path: str, json=None, timeout: float | None = None):
+        self._touch()
+        return self.session.post(f"{self.url}{path}", json=json, timeout=timeout or settings.request_timeout)
+
+    # get: GET a una ruta del participante reutilizando conexiones del pool.
+    def get(self, path: str, timeout: float | None = None):
+        self._touch()
+        return self.session.get(f"{self.url}{path}", timeout=timeout or settings.request_timeout)
+
+    # close: Cierra todas las conexiones del pool.
+    def close(self):
+        self.session.close()
+
+class AsyncParticipantClient:
+    """Cliente HTTP asíncrono con pool persistente hacia un único participante."""
+    def __init__(self, url: str, pool_size: int, keepalive: float):
+        self.url = url.rstrip('/')
+        limits = httpx.Limits(
+            max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=keepalive or None
+        )
+        self.client = httpx.AsyncClient(base_url=self.url, limits=limits, timeout=settings.request_timeout)
+
+    # post: POST asíncrono a una ruta del participante.
+    async def post(self, path: str, json=None, timeout: float | None = None):
+        return await self.client.post(path, json=json, timeout=timeout or settings.request_timeout)
+
+    # get: GET asíncrono a una ruta del participante.
+    async def get(self, path: str, timeout: float | None = None):
+        return await self.client.get(path, timeout=timeout or settings.request_timeout)
+
+    # aclose: Cierra las conexiones del pool.
+    async def aclose(self):
+        await self.client.aclose()
+
+class ParticipantClients:
+    """Registro de clientes HTTP (síncronos y asíncronos) indexado por URL de participante."""
+    def __init__(self):
+        self._clients: Dict[str, ParticipantClient] = {}
+        self._async_clients: Dict[str, AsyncParticipantClient] = {}
+        self._lock = threading.Lock()
+
+    # _build: Crea un cliente con los límites de pool configurados.
+    def _build(self, url: str) -> ParticipantClient:
+        return ParticipantClient(
+            url,
+            pool_size=settings.participant_pool_size,
+            pool_block=settings.participant_pool_block,
+            keepalive=settings.participant_keepalive,
+        )
+
+    # start: Crea un pool por cada participante configurado (llamado en startup).
+    def start(self, participants: List[Dict[str, str]]):
+        with self._lock:
+            for p in participants:
+                url = p['url'].rstrip('/')
+                if url not in self._clients:
+                    self._clients[url] = self._build(url)
+
+    # get: Devuelve el cliente del participante, creándolo si no existía.
+    def get(self, url: str) -> ParticipantClient:
+        url = url.rstrip('/')
+        client = self._clients.get(url)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(url)
+                if client is None:
+                    client = self._clients[url] = self._build(url)
+        return client
+
+    # get_async: Devuelve el cliente asíncrono del participante, creándolo si no existía.
+    # Debe usarse desde el event loop de la aplicación.
+    def get_async(self, url: str) -> AsyncParticipantClient:
+        url = url.rstrip('/')
+        client = self._async_clients.get(url)
+        if client is None:
+            with self._lock:
+                client = self._async_clients.get(url)
+                if client is None:
+                    client = self._async_clients[url] = AsyncParticipantClient(
+                        url, pool_size=settings.participant_async_pool_size, keepalive=settings.participant_keepalive
+                    )
+        return client
+
+    # close: Cierra todos los pools síncronos (llamado en shutdown).
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+    # aclose: Cierra todos los pools asíncronos (llamado en shutdown, dentro del event loop).
+    async def aclose(self):
+        with self._lock:
+            async_clients, self._async_clients = list(self._async_clients.values()), {}
+        for client in async_clients:
+            await client.aclose()
+
+# Instancia compartida por el coordinador y los endpoints.
+clients = ParticipantClients()
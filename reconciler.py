@@ -0,0 +1,73 @@
+"""Reconciliador en segundo plano.
+
+Ejecuta `TransactionService.reconcile_stuck` cada `RECONCILE_INTERVAL_SEC`
+segundos en un hilo propio y conserva métricas de cada pasada (duración,
+candidatas procesadas, resueltas y backlog restante).
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+from config import get_settings
+from transaction import TransactionService
+
+settings = get_settings()
+
+class Reconciler:
+    """Hilo periódico de reconciliación con estadísticas por pasada."""
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._run_lock = threading.Lock()
+        self.passes = 0
+        self.last_pass: Dict = {}
+
+    # start: Inicia el hilo si el intervalo es positivo.
+    def start(self):
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='reconciler', daemon=True)
+        self._thread.start()
+
+    # stop: Detiene el hilo esperando a que termine la pasada en curso.
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    # run_once: Ejecuta una pasada (también usada por /admin/reconcile).
+    # Las pasadas no se solapan: una llamada concurrente espera a la anterior.
+    def run_once(self, age_minutes: Optional[int] = None) -> Dict:
+        with self._run_lock:
+            started = time.perf_counter()
+            actions = TransactionService.reconcile_stuck(age_minutes)
+            duration = time.perf_counter() - started
+            resolved = sum(1 for a in actions if a['action'] != 'IN_DOUBT')
+            self.passes += 1
+            self.last_pass = {
+                'finished_at': time.time(),
+                'duration_ms': round(duration * 1000, 2),
+                'examined': len(actions),
+                'resolved': resolved,
+                'in_doubt': len(actions) - resolved,
+                'backlog': TransactionService.reconcile_backlog(age_minutes),
+            }
+            return {'actions': actions, **self.last_pass}
+
+    # stats: Resumen de la última pasada.
+    def stats(self) -> Dict:
+        return {'interval_sec': self.interval, 'passes': self.passes, 'last_pass': self.last_pass}
+
+    # _loop: Espera el intervalo y ejecuta pasadas hasta que se pida detener.
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.last_pass = {'finished_at': time.time(), 'error': str(e)}
+
+# Instancia compartida; se inicia en el startup de la aplicación.
+reconciler = Reconciler(settings.reconcile_interval)
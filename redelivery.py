@@ -0,0 +1,182 @@
+"""Entrega asíncrona de decisiones 2PC ya registradas.
+
+Con `DECISION_DELIVERY=async` el coordinador responde al cliente en cuanto la
+decisión (COMMIT o ABORT) queda en el log write-ahead; el envío de COMMIT o
+ROLLBACK a los participantes READY pasa a esta cola:
+  - Cada decisión es una tarea del event loop; `REDELIVERY_CONCURRENCY` limita
+    cuántos mensajes están en vuelo a la vez (el cupo se toma por intento, no
+    durante las esperas entre reintentos).
+  - Un participante que no confirma se reintenta con backoff exponencial con
+    jitter (`backoff_delay`) hasta `REDELIVERY_MAX_ATTEMPTS` intentos; con su
+    circuit breaker abierto el intento se consume sin enviar.
+  - Al confirmar todos se actualizan las filas de `ParticipantOutcome`, la
+    caché de balances y se marca END en el log del coordinador.
+  - Si alguno agota los intentos la decisión queda sin END: un COMMIT se
+    registra como PREPARED y `reconcile_stuck` lo completa desde el log; un
+    ABORT lo reenvía el reconciliador al vencer RECONCILE_AGE_MIN.
+  - Si la fila de `TransactionLog` no pudo insertarse la decisión se entrega
+    igual (los participantes liberan sus locks) pero sin END, para que el
+    reconciliador o `recover` creen la fila.
+
+Si el proceso se detiene antes, la decisión sigue sin END en el log y
+`TransactionService.recover` la reenvía en el siguiente arranque.
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import select
+from config import get_settings
+from database import DBSession
+from models import TransactionLog, ParticipantOutcome
+from participant import TwoPhaseCommit, ParticipantState, backoff_delay, error_class
+from coordinator_log import coordinator_log
+from balance_cache import balance_store
+from tx_stats import tx_stats
+from health import health_monitor
+import metrics
+
+settings = get_settings()
+
+# record_outcomes: Copia commit_status y error de los participantes que recibieron la decisión
+# a sus filas de ParticipantOutcome (y opcionalmente el estado de la transacción) en la sesión `s`.
+def record_outcomes(s, tpc: TwoPhaseCommit, status: str | None = None):
+    states = {p.name: p for p in tpc.participants}
+    for row in s.exec(select(ParticipantOutcome).where(ParticipantOutcome.tx_id == tpc.tx_id)).all():
+        p = states.get(row.participant)
+        if p is None or p.commit_status is None:
+            continue
+        row.commit_status, row.error, row.error_class = p.commit_status, p.error, error_class(p.error)
+        s.add(row)
+    log = s.exec(select(TransactionLog).where(TransactionLog.tx_id == tpc.tx_id)).first()
+    if log is not None:
+        if status:
+            log.status = status
+        log.updated_at = datetime.utcnow()
+        s.add(log)
+
+class RedeliveryQueue:
+    """Reenvía COMMIT/ROLLBACK en segundo plano hasta que cada participante confirma."""
+    def __init__(self, concurrency: int, max_attempts: int):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # tx_id -> tarea de entrega en curso
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+
+    # submit: Encola la entrega de `decision` ('COMMIT' o 'ABORT') a los participantes READY.
+    # Con logged=False la transacción no tiene fila en TransactionLog: se entrega sin marcar END.
+    def submit(self, tpc: TwoPhaseCommit, decision: str, transfer: Tuple[float, int, int], protocol: str,
+               logged: bool = True):
+        task = asyncio.ensure_future(self._deliver(tpc, decision, transfer, protocol, logged))
+        self._tasks[tpc.tx_id] = task
+        metrics.redelivery_pending.inc()
+        task.add_done_callback(lambda _t, tx_id=tpc.tx_id: self._done(tx_id))
+        return task
+
+    # stats: Entregas pendientes, terminadas, cedidas al reconciliador y reintentos para /health.
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self._tasks), "delivered": self.delivered, "failed": self.failed,
+                "retries": self.retries}
+
+    # in_progress: Indica si la decisión de `tx_id` todavía se está entregando.
+    def in_progress(self, tx_id: str) -> bool:
+        return tx_id in self._tasks
+
+    # task: Tarea de entrega en curso de `tx_id` (None si ya terminó o no hubo entrega).
+    def task(self, tx_id: str) -> Optional[asyncio.Task]:
+        return self._tasks.get(tx_id)
+
+    # stop: Espera hasta `timeout` segundos las entregas en curso y cancela el resto
+    # (quedan sin END en el log del coordinador y se reenvían al arrancar).
+    async def stop(self, timeout: float = 5.0):
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    # _done: Saca la entrega de la tabla de pendientes.
+    def _done(self, tx_id: str):
+        self._tasks.pop(tx_id, None)
+        metrics.redelivery_pending.dec()
+
+    # _deliver: Envía la decisión a cada participante READY en paralelo y registra el resultado.
+    # Si alguno no confirma se deja sin END para el reconciliador (un COMMIT queda PREPARED).
+    async def _deliver(self, tpc: TwoPhaseCommit, decision: str, transfer: Tuple[float, int, int], protocol: str,
+                       logged: bool = True):
+        started = time.perf_counter()
+        sent_before = tpc.messages
+        if decision == 'ABORT' and tpc.late:
+            # PREPARE tardíos: un voto READY deja al participante READY y también recibe ROLLBACK.
+            await asyncio.gather(*tpc.late, return_exceptions=True)
+        ready = [p for p in tpc.participants if p.prepare_status == 'READY']
+        acked = await asyncio.gather(*(self._until_acked(tpc, p, decision, transfer) for p in ready))
+        metrics.messages_total.inc(tpc.messages - sent_before, protocol=protocol)
+        metrics.decision_delivery_seconds.observe(time.perf_counter() - started, decision=decision)
+        if not all(acked):
+            self.failed += 1
+            if decision == 'COMMIT' and logged:
+                await run_in_threadpool(self._record, tpc, 'PREPARED')
+            return
+        if not logged:
+            self.delivered += 1
+            return
+        if decision == 'COMMIT':
+            balance_store.learn_from_transfer(tpc.participants, transfer[1], transfer[2])
+            await run_in_threadpool(self._record, tpc)
+        coordinator_log.end(tpc.tx_id)
+        self.delivered += 1
+
+    # _until_acked: Reintenta COMMIT o ROLLBACK a un participante hasta que confirma o agota
+    # `max_attempts`. Retorna True si confirmó.
+    async def _until_acked(self, tpc: TwoPhaseCommit, p: ParticipantState, decision: str,
+                           transfer: Tuple[float, int, int]) -> bool:
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self.retries += 1
+                metrics.phase_retries.inc(participant=p.name, phase='commit' if decision == 'COMMIT' else 'rollback')
+                await asyncio.sleep(backoff_delay(attempt))
+            if not health_monitor.allow(p.url):
+                p.error = p.error or 'circuit open'
+                continue
+            async with self._semaphore:
+                tpc.messages += 1
+                if decision == 'COMMIT':
+                    status, error, balance = await tpc._send_commit_async(p, tpc._commit_payload(p, *transfer))
+                    if status == 'COMMITTED':
+                        p.commit_status, p.balance, p.error = status, balance, None
+                        return True
+                    p.error = error or f"commit status {status}"
+                else:
+                    error = await tpc._send_rollback_async(p)
+                    if error is None:
+                        return True
+                    p.error = f"rollback_err={error}"
+        if decision == 'COMMIT':
+            p.commit_status = 'ERROR'
+        return False
+
+    # _record: Persiste el resultado de la entrega en ParticipantOutcome y, si se indica,
+    # el nuevo estado de la transacción (se ejecuta en el threadpool).
+    @staticmethod
+    def _record(tpc: TwoPhaseCommit, status: Optional[str] = None):
+        with DBSession() as s:
+            log = s.exec(select(TransactionLog).where(TransactionLog.tx_id == tpc.tx_id)).first()
+            old_status = log.status if log is not None else None
+            record_outcomes(s, tpc, status)
+            if log is not None and status:
+                tx_stats.status_changed(s, log, old_status)
+            with metrics.db_commit_seconds.time(operation='redelivery'):
+                s.commit()
+
+# Instancia compartida por /transfer.
+redelivery_queue = RedeliveryQueue(settings.redelivery_concurrency, settings.redelivery_max_attempts)
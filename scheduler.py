@@ -0,0 +1,145 @@
+"""Planificador de transferencias por cuenta con control de admisión.
+
+Se ubica delante de `TransactionService.start_transfer`:
+  - Transferencias que tocan la misma cuenta (origen o destino) se encolan en
+    orden FIFO detrás de la que está en curso, en vez de chocar en PREPARE y
+    abortar. Los locks se toman en orden de cuenta para no interbloquearse.
+  - Las transferencias sin cuentas en común corren en paralelo, hasta
+    `max_in_flight` a la vez.
+  - Con `hold` las cuentas siguen tomadas después de responder, hasta que
+    termina lo que devuelve (p. ej. la entrega asíncrona del COMMIT), para que
+    la siguiente transferencia no choque con los locks de PREPARE que los
+    participantes aún conservan.
+  - La admisión es acotada: con `max_in_flight + max_queue` transferencias
+    admitidas, o `max_per_account` esperando por una misma cuenta, se rechaza
+    con `SchedulerSaturated` (429 + Retry-After estimado).
+
+Todo el estado vive en el event loop de la aplicación (sin hilos).
+"""
+
+import asyncio
+import math
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar
+from config import get_settings
+import metrics
+
+settings = get_settings()
+T = TypeVar('T')
+
+class SchedulerSaturated(Exception):
+    """No hay lugar en la cola de admisión (global o de la cuenta)."""
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AccountScheduler:
+    """Serializa transferencias por cuenta y limita las que están en vuelo."""
+    def __init__(self, max_in_flight: int, max_queue: int, max_per_account: int):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_per_account = max_per_account
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        # cuenta -> transferencias admitidas que la usan (en curso o esperando)
+        self._holders: Dict[int, int] = {}
+        self._admitted = 0
+        self._running = 0
+        self._held = 0  # transferencias ya respondidas que conservan sus cuentas
+        self._service_time = 0.0  # media móvil de la duración de una transferencia (s)
+        self.rejected = 0
+        self.completed = 0
+        self._wait_total = 0.0
+
+    # submit: Espera turno para las cuentas y ejecuta `factory()`. Si `hold(resultado)` devuelve
+    # un awaitable, las cuentas quedan tomadas hasta que termine (el resultado se retorna sin esperarlo).
+    async def submit(self, accounts: Iterable[int], factory: Callable[[], Awaitable[T]],
+                     hold: Optional[Callable[[T], Optional[Awaitable]]] = None) -> T:
+        keys = sorted(set(accounts))
+        if self._admitted >= self.max_in_flight + self.max_queue:
+            self._reject('queue full')
+        if any(self._holders.get(k, 0) >= self.max_per_account for k in keys):
+            self._reject('account busy')
+        self._admitted += 1
+        for k in keys:
+            self._holders[k] = self._holders.get(k, 0) + 1
+        self._update_gauges()
+        enqueued = time.perf_counter()
+        acquired = []
+        pending = None
+        try:
+            for k in keys:
+                lock = self._locks.setdefault(k, asyncio.Lock())
+                await lock.acquire()
+                acquired.append(lock)
+            async with self._semaphore:
+                waited = time.perf_counter() - enqueued
+                metrics.scheduler_wait_seconds.observe(waited)
+                self._wait_total += waited
+                self._running += 1
+                self._update_gauges()
+                started = time.perf_counter()
+                try:
+                    result = await factory()
+                    pending = hold(result) if hold else None
+                    return result
+                finally:
+                    self._running -= 1
+                    self.completed += 1
+                    elapsed = time.perf_counter() - started
+                    self._service_time = elapsed if not self._service_time else 0.9 * self._service_time + 0.1 * elapsed
+        finally:
+            self._admitted -= 1
+            if pending is None:
+                self._release(keys, acquired)
+            else:
+                self._held += 1
+                asyncio.ensure_future(pending).add_done_callback(
+                    lambda _f: self._release(keys, acquired, held=True)
+                )
+                self._update_gauges()
+
+    # stats: Estado de la cola para /health.
+    def stats(self) -> Dict[str, float]:
+        return {
+            "admitted": self._admitted,
+            "running": self._running,
+            "queued": self._admitted - self._running,
+            "accounts_busy": len(self._holders),
+            "held": self._held,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self._wait_total / self.completed * 1000, 2) if self.completed else 0.0,
+            "avg_service_ms": round(self._service_time * 1000, 2),
+        }
+
+    # _release: Libera los locks de cuenta tomados por una transferencia.
+    def _release(self, keys: List[int], acquired: List[asyncio.Lock], held: bool = False):
+        for lock in reversed(acquired):
+            lock.release()
+        if held:
+            self._held -= 1
+        for k in keys:
+            self._holders[k] -= 1
+            if not self._holders[k]:
+                # Nadie la usa ni la espera: se descarta el lock.
+                del self._holders[k]
+                self._locks.pop(k, None)
+        self._update_gauges()
+
+    # _reject: Cuenta el rechazo y lanza SchedulerSaturated con un Retry-After estimado.
+    def _reject(self, reason: str):
+        self.rejected += 1
+        metrics.scheduler_rejected_total.inc(reason=reason)
+        queued = self._admitted - self._running
+        retry_after = max(1, math.ceil(queued * self._service_time / max(1, self.max_in_flight)))
+        raise SchedulerSaturated(reason, retry_after)
+
+    # _update_gauges: Publica profundidad de cola y transferencias en ejecución.
+    def _update_gauges(self):
+        metrics.scheduler_queue_depth.set(self._admitted - self._running)
+        metrics.scheduler_running.set(self._running)
+        metrics.scheduler_accounts_busy.set(len(self._holders))
+
+# Instancia compartida por /transfer.
+scheduler = AccountScheduler(settings.scheduler_max_in_flight, settings.scheduler_max_queue, settings.scheduler_max_per_account)
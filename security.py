@@ -1,9 +1,20 @@
 """Funciones de seguridad: hashing de contraseñas y manejo de JWT.
 
 Se utiliza bcrypt vía passlib para almacenar contraseñas y PyJWT para tokens.
+Incluye además una caché en memoria de tokens ya verificados para evitar
+consultar la base de datos en cada petición autenticada, y un pool de procesos
+acotado donde se ejecuta bcrypt fuera de los hilos que atienden peticiones.
 """
 
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
 from passlib.context import CryptContext
 import jwt
 from config import get_settings
@@ -33,3 +44,168 @@ def decode_token(token: str):
         return jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
     except jwt.PyJWTError:
         return None
+
+class Principal:
+    """Identidad autenticada mínima (id, username, rol) servida desde la caché."""
+    def __init__(self, id: Optional[int], username: str, role: str):
+        self.id = id
+        self.username = username
+        self.role = role
+
+class PrincipalCache:
+    """Caché LRU acotada con TTL de tokens verificados -> Principal.
+
+    Cada entrada expira a los `ttl` segundos o al `exp` del JWT, lo que ocurra
+    primero. Lleva contadores de aciertos/fallos para verificar su efecto.
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # get: Devuelve el Principal cacheado para el token o None si falta/expiró.
+    def get(self, token: str) -> Optional[Principal]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    # put: Guarda el Principal hasta min(ahora + ttl, exp del token).
+    def put(self, token: str, principal: Principal, exp: Optional[float]):
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        with self._lock:
+            self._entries[token] = (principal, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # invalidate_user: Elimina todas las entradas de un username (p.ej. tras registrarlo).
+    def invalidate_user(self, username: str):
+        with self._lock:
+            stale = [t for t, (p, _) in self._entries.items() if p.username == username]
+            for t in stale:
+                del self._entries[t]
+
+    # stats: Contadores de aciertos/fallos y tamaño actual.
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+# Caché compartida usada por la dependencia de autenticación.
+principal_cache = PrincipalCache(settings.auth_cache_size, settings.auth_cache_ttl)
+
+class PasswordPoolBusy(Exception):
+    """El pool de hashing está saturado (o se está recreando); la petición debe rechazarse."""
+
+class PasswordHasherPool:
+    """Pool de procesos acotado para bcrypt (hash y verificación).
+
+    Admite como máximo `workers + max_pending` operaciones simultáneas; por
+    encima de esa capacidad rechaza de inmediato con `PasswordPoolBusy` en
+    lugar de encolar. Mide latencia y concurrencia de forma independiente al
+    tráfico de transacciones. Si un proceso trabajador muere el executor queda
+    roto para siempre (`BrokenProcessPool`): se reemplaza por uno nuevo y la
+    petición afectada se rechaza con `PasswordPoolBusy`.
+    """
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.capacity = workers + max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    # start: Crea los procesos trabajadores (spawn para no heredar hilos del servidor).
+    def start(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    # _restart: Reemplaza un executor roto; si otra petición ya lo reemplazó no hace nada.
+    def _restart(self, broken: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+            self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.start()
+
+    # shutdown: Detiene los procesos trabajadores.
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # _run: Ejecuta fn en el pool respetando la capacidad y registrando métricas.
+    async def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordPoolBusy()
+        started = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            executor = self.start()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                self._restart(executor)
+                raise PasswordPoolBusy()
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+            self._slots.release()
+
+    # hash: Versión asíncrona de hash_password ejecutada en el pool.
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    # verify: Versión asíncrona de verify_password ejecutada en el pool.
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await self._run(verify_password, password, password_hash)
+
+    # stats: Concurrencia, rechazos y latencia media/máxima en milisegundos.
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            avg = self.total_seconds / self.completed if self.completed else 0.0
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "restarts": self.restarts,
+                "avg_ms": round(avg * 1000, 2),
+                "max_ms": round(self.max_seconds * 1000, 2),
+            }
+
+# Pool compartido para /auth/login y /auth/register.
+password_pool = PasswordHasherPool(settings.password_workers, settings.password_max_pending)
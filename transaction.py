@@ -1,67 +1,537 @@
 """Servicio de alto nivel para operaciones sobre transacciones 2PC."""
 
-from typing import Optional
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, func, or_
 from sqlmodel import select
-from models import TransactionLog
+from models import TransactionLog, ParticipantOutcome
 from database import DBSession
-from participant import TwoPhaseCommit
+from participant import TwoPhaseCommit, BatchTwoPhaseCommit, Deadline, error_class
+from coordinator_log import coordinator_log
+from redelivery import redelivery_queue, record_outcomes
+from tx_stats import tx_stats
+from balance_cache import balance_store
+import metrics
 from config import get_settings
 from datetime import datetime, timedelta
 
 settings = get_settings()
 
+# _ms: Convierte segundos a milisegundos redondeados.
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+# _timings_json: Desglose de tiempos de una transacción para TransactionLog.timings (None si está desactivado).
+def _timings_json(phases: Dict[str, float], tpc: TwoPhaseCommit) -> Optional[str]:
+    if not settings.tx_timings:
+        return None
+    return json.dumps({**phases, 'participants': {p.name: p.timings for p in tpc.participants}})
+
+# _outcomes: Filas de ParticipantOutcome a partir del estado de cada participante (dicts de to_dict()).
+def _outcomes(tx_id: str, states: List[dict], created_at: Optional[datetime] = None) -> List[ParticipantOutcome]:
+    created_at = created_at or datetime.utcnow()
+    return [
+        ParticipantOutcome(
+            tx_id=tx_id, participant=p['name'], role=p['role'], url=p['url'],
+            prepare_status=p.get('prepare_status'), commit_status=p.get('commit_status'),
+            error=p.get('error'), error_class=error_class(p.get('error')), created_at=created_at,
+        )
+        for p in states
+    ]
+
+# _new_log: TransactionLog con una fila de ParticipantOutcome por participante.
+def _new_log(tpc: TwoPhaseCommit, status: str, timings: Optional[str] = None) -> TransactionLog:
+    log = TransactionLog(tx_id=tpc.tx_id, status=status, timings=timings)
+    log.outcomes = _outcomes(tpc.tx_id, [p.to_dict() for p in tpc.participants], log.created_at)
+    return log
+
 class TransactionService:
     """Agrupa lógica de inicio, consulta y reconciliación de transacciones."""
     @staticmethod
-    def start_transfer(amount: float, from_account: int, to_account: int):
-        """Inicia una transferencia 2PC.
+    async def start_transfer(amount: float, from_account: int, to_account: int, tx_id: Optional[str] = None,
+                             deadline: Optional[Deadline] = None):
+        """Inicia una transferencia 2PC (corrutina).
 
-        Ejecuta fase PREPARE y si todos READY continúa con COMMIT. Registra
-        el resultado (COMMITTED o ABORTED) en el log.
+        Ejecuta PREPARE en los participantes que la tabla de ruteo asigna a las
+        cuentas y, si todos votan a favor, COMMIT; la decisión se escribe en el
+        log del coordinador antes de enviarla. Registra el resultado en el log.
+        `tx_id` fija el identificador (Idempotency-Key) y `deadline` el
+        presupuesto de tiempo (por defecto TX_DEADLINE_MS).
         """
-        tpc = TwoPhaseCommit(settings.participants)
-        prepared_ok = tpc.phase_prepare(amount, from_account, to_account)
-        status = 'PREPARED' if prepared_ok else 'ABORTED'
-        if prepared_ok:
-            committed_ok = tpc.phase_commit(amount, from_account, to_account)
-            status = 'COMMITTED' if committed_ok else 'ABORTED'
-        with DBSession() as s:
-            log = TransactionLog(tx_id=tpc.tx_id, status=status, participants=tpc.serialize())
+        cfg = settings.current_routing().route(from_account, to_account)
+        tpc = TwoPhaseCommit(cfg, tx_id=tx_id)
+        transfer = (amount, from_account, to_account)
+        presumed_abort = settings.tpc_presumed_abort
+        deadline = deadline or Deadline(settings.tx_deadline)
+        deferred = None  # decisión a entregar en segundo plano (DECISION_DELIVERY=async)
+        forced = 0
+        with metrics.in_flight.track(mode='single'):
+            t0 = time.perf_counter()
+            if settings.tpc_one_phase and len(tpc.participants) == 1:
+                protocol = '1pc'
+                status = await tpc.phase_one(*transfer, deadline)
+                t4 = time.perf_counter()
+                phases = {'commit_ms': _ms(t4 - t0)}
+            else:
+                protocol = '2pc-pa' if presumed_abort else '2pc'
+                await coordinator_log.begin_async(tpc.tx_id, cfg, transfer, force=not presumed_abort)
+                t1 = time.perf_counter()
+                prepared_ok = await tpc.phase_prepare(*transfer, deadline)
+                t2 = time.perf_counter()
+                read_only = prepared_ok and tpc.read_only()
+                if not read_only and (prepared_ok or not presumed_abort):
+                    await coordinator_log.decide_async(tpc.tx_id, tpc.votes(), 'COMMIT' if prepared_ok else 'ABORT')
+                    forced += 1
+                    metrics.wal_append_seconds.observe(time.perf_counter() - t2, record='decision')
+                t3 = time.perf_counter()
+                if not prepared_ok:
+                    status = 'ABORTED'
+                    if settings.decision_delivery == 'async' or presumed_abort:
+                        # Presumed abort no espera los ROLLBACK, pero la cola los reintenta y
+                        # marca END solo cuando todos confirman.
+                        deferred = 'ABORT'
+                    elif not await tpc.phase_rollback(*transfer) or tpc.late:
+                        # ROLLBACK sin confirmar o PREPARE aún en vuelo: la cola los completa
+                        # con reintentos y marca END solo cuando todos confirman.
+                        deferred = 'ABORT'
+                elif read_only:
+                    status = 'COMMITTED'
+                elif settings.decision_delivery == 'async':
+                    status, deferred = 'COMMITTED', 'COMMIT'
+                    for p in tpc.participants:
+                        p.commit_status = 'PENDING' if p.prepare_status == 'READY' else 'SKIPPED'
+                else:
+                    status = 'COMMITTED' if await tpc.phase_commit(*transfer) else 'PREPARED'
+                t4 = time.perf_counter()
+                if not presumed_abort:
+                    forced += 1
+                    metrics.wal_append_seconds.observe(t1 - t0, record='begin')
+                phases = {
+                    'wal_begin_ms': _ms(t1 - t0),
+                    'prepare_ms': _ms(t2 - t1),
+                    'wal_decision_ms': _ms(t3 - t2),
+                    ('commit_ms' if prepared_ok else 'rollback_ms'): _ms(t4 - t3),
+                }
+            if status == 'COMMITTED' and deferred is None:
+                balance_store.learn_from_transfer(tpc.participants, from_account, to_account)
+            timings = _timings_json({
+                **phases,
+                'total_ms': _ms(t4 - t0),
+                'protocol': protocol,
+                'messages': tpc.messages,
+                'forced_log_writes': forced,
+            }, tpc)
+            log = _new_log(tpc, status, timings)
+            try:
+                log = await run_in_threadpool(TransactionService._insert_log, log, _ms(t4 - t0))
+            except Exception:
+                if deferred:
+                    # Se entrega igual para liberar los locks de PREPARE; sin fila no se marca
+                    # END y el reconciliador (o recover) la registra desde el log del coordinador.
+                    redelivery_queue.submit(tpc, deferred, transfer, protocol, logged=False)
+                raise
+            if deferred:
+                # END lo marca la cola al confirmar todos los participantes.
+                redelivery_queue.submit(tpc, deferred, transfer, protocol)
+            elif protocol != '1pc' and status != 'PREPARED':
+                coordinator_log.end(tpc.tx_id)
+        metrics.messages_total.inc(tpc.messages, protocol=protocol)
+        metrics.forced_log_writes_total.inc(forced, protocol=protocol)
+        metrics.transactions_total.inc(status=status)
+        metrics.transaction_seconds.observe(time.perf_counter() - t0, mode='single')
+        return log
+
+    @staticmethod
+    def _insert_log(log: TransactionLog, latency_ms: Optional[float] = None) -> TransactionLog:
+        """Inserta una fila de TransactionLog junto con sus ParticipantOutcome y actualiza los
+        agregados de /transactions/stats en un solo commit."""
+        with DBSession(expire_on_commit=False) as s:
             s.add(log)
-            s.commit()
-            s.refresh(log)
+            tx_stats.record(s, log, latency_ms)
+            with metrics.db_commit_seconds.time(operation='transfer'):
+                s.commit()
         return log
 
+    @staticmethod
+    def start_batch(transfers: List[Tuple[float, int, int]]) -> List[TransactionLog]:
+        """Inicia N transferencias 2PC agrupadas en mensajes batch por participante.
+
+        Cada transferencia obtiene su propio tx_id, voto y resultado. Todas las
+        filas de `TransactionLog` y `ParticipantOutcome` se insertan en una
+        única transacción de BD. Con tabla de ruteo las transferencias se
+        agrupan por conjunto de participantes y cada grupo es un lote propio
+        (uno tras otro); una cuenta sin dueño rechaza el lote completo con
+        `RoutingError` antes de contactar a nadie.
+        """
+        routing = settings.current_routing()
+        groups: Dict[str, Tuple[List[Dict[str, str]], List[int]]] = {}
+        for i, (_, from_account, to_account) in enumerate(transfers):
+            cfg = routing.route(from_account, to_account)
+            groups.setdefault(json.dumps(cfg, sort_keys=True), (cfg, []))[1].append(i)
+        logs: List[Optional[TransactionLog]] = [None] * len(transfers)
+        with metrics.in_flight.track(len(transfers), mode='batch'):
+            t0 = time.perf_counter()
+            for cfg, indexes in groups.values():
+                for i, log in zip(indexes, TransactionService._run_batch(cfg, [transfers[i] for i in indexes])):
+                    logs[i] = log
+            with DBSession(expire_on_commit=False) as s:
+                s.add_all(logs)
+                tx_stats.record_many(s, logs)
+                with metrics.db_commit_seconds.time(operation='batch'):
+                    s.commit()
+            # Las que quedaron PREPARED (COMMIT sin confirmar) siguen abiertas en el log.
+            coordinator_log.end_many([log.tx_id for log in logs if log.status != 'PREPARED'])
+        balance_store.invalidate(list({a for t, log in zip(transfers, logs) if log.status == 'COMMITTED' for a in t[1:]}))
+        for log in logs:
+            metrics.transactions_total.inc(status=log.status)
+        metrics.transaction_seconds.observe(time.perf_counter() - t0, mode='batch')
+        return logs
+
+    @staticmethod
+    def _run_batch(cfg: List[Dict[str, str]], transfers: List[Tuple[float, int, int]]) -> List[TransactionLog]:
+        """Ejecuta las fases de un lote cuyas transferencias comparten participantes.
+
+        Retorna las filas de `TransactionLog` sin insertar, en el orden de `transfers`.
+        """
+        batch = BatchTwoPhaseCommit(cfg, transfers)
+        t0 = time.perf_counter()
+        with metrics.wal_append_seconds.time(record='begin'):
+            coordinator_log.begin_many([(tpc.tx_id, cfg, t) for tpc, t in zip(batch.items, transfers)])
+        t1 = time.perf_counter()
+        prepared = batch.phase_prepare()
+        t2 = time.perf_counter()
+        with metrics.wal_append_seconds.time(record='decision'):
+            coordinator_log.decide_many([
+                (tpc.tx_id, tpc.votes(), 'COMMIT' if ok else 'ABORT') for tpc, ok in zip(batch.items, prepared)
+            ])
+        t3 = time.perf_counter()
+        committed = batch.phase_commit(prepared) if any(prepared) else prepared
+        t4 = time.perf_counter()
+        batch.phase_rollback(prepared)
+        t5 = time.perf_counter()
+        # Las fases son compartidas por todo el lote: mismo desglose en cada fila.
+        phases = {
+            'batch_size': len(transfers),
+            'wal_begin_ms': _ms(t1 - t0),
+            'prepare_ms': _ms(t2 - t1),
+            'wal_decision_ms': _ms(t3 - t2),
+            'commit_ms': _ms(t4 - t3),
+            'rollback_ms': _ms(t5 - t4),
+            'total_ms': _ms(t5 - t0),
+        }
+        return [
+            _new_log(tpc, 'COMMITTED' if done else ('PREPARED' if ok else 'ABORTED'), _timings_json(phases, tpc))
+            for tpc, ok, done in zip(batch.items, prepared, committed)
+        ]
+
+    @staticmethod
+    def recover():
+        """Reanuda transacciones que el log del coordinador dejó sin terminar.
+
+        Reenvía COMMIT si la decisión registrada fue COMMIT; en cualquier otro
+        caso (ABORT o sin decisión) se presume abort y se envía ROLLBACK. Las
+        que obtienen confirmación se marcan END y su fila de `TransactionLog`
+        se crea o actualiza; un COMMIT no confirmado queda PREPARED y se
+        reintenta en el siguiente arranque o reconciliación.
+
+        Las entradas se reenvían en paralelo (PHASE_WORKERS a la vez) en un pool
+        propio, porque `_replay` usa el pool de fases para cada participante. Los
+        participantes con el breaker abierto se omiten y su entrada queda para
+        la reconciliación.
+        """
+        entries = coordinator_log.unfinished()
+        if not entries:
+            return []
+        with ThreadPoolExecutor(max_workers=settings.phase_workers, thread_name_prefix='recover') as pool:
+            return list(pool.map(TransactionService._replay, entries))
+
+    @staticmethod
+    def _replay(entry: dict) -> dict:
+        """Reenvía la decisión de una entrada sin END del log del coordinador.
+
+        Crea o actualiza su fila de `TransactionLog` (puede faltar si la
+        inserción falló tras registrar la decisión) y marca END si todos
+        confirman.
+        """
+        begin = entry['begin']
+        decision = entry['decision'] if entry['decision'] == 'COMMIT' else 'ABORT'
+        tpc = TwoPhaseCommit(begin['participants'], tx_id=entry['tx_id'])
+        for p in tpc.participants:
+            p.prepare_status = entry['votes'].get(p.name)
+        acked = tpc.resend_decision(decision, tuple(begin['transfer']))
+        status = 'ABORTED' if decision == 'ABORT' else ('COMMITTED' if acked else 'PREPARED')
+        with DBSession() as s:
+            log = s.exec(select(TransactionLog).where(TransactionLog.tx_id == tpc.tx_id)).first()
+            if log is None:
+                log = _new_log(tpc, status)
+                s.add(log)
+                tx_stats.record(s, log)
+            else:
+                # Puede ser una entrega asíncrona interrumpida (participantes PENDING).
+                old_status = log.status
+                record_outcomes(s, tpc, status)
+                tx_stats.status_changed(s, log, old_status)
+            with metrics.db_commit_seconds.time(operation='recover'):
+                s.commit()
+        if acked:
+            coordinator_log.end(tpc.tx_id)
+        return {'tx_id': tpc.tx_id, 'action': decision, 'acknowledged': acked}
+
     @staticmethod
     def get_transaction(tx_id: str) -> Optional[TransactionLog]:
         """Recupera una transacción por su tx_id o None si no existe."""
-        with DBSession() as s:
+        with DBSession(readonly=True) as s:
             statement = select(TransactionLog).where(TransactionLog.tx_id == tx_id)
             result = s.exec(statement).first()
             return result
 
     @staticmethod
-    def reconcile_stuck(age_minutes: int = 5):
-        """Marca como ABORTED transacciones PREPARED que exceden el umbral de edad.
+    def _resolve_in_doubt(log: TransactionLog, wal_entry: Optional[dict]) -> Optional[str]:
+        """Determina y aplica el desenlace real de una transacción PREPARED.
+
+        Si el log del coordinador registró COMMIT se reenvía COMMIT. En otro
+        caso se consulta a los participantes: si alguno ya confirmó se completa
+        el COMMIT en los demás; si todos responden y ninguno confirmó se envía
+        ROLLBACK. Retorna 'COMMITTED', 'ABORTED' o None si sigue en duda.
+        """
+        cfg = log.participant_states()
+        tpc = TwoPhaseCommit(cfg, tx_id=log.tx_id)
+        transfer = tuple(wal_entry['begin']['transfer']) if wal_entry else None
+        if wal_entry and wal_entry['decision'] == 'COMMIT':
+            for p in tpc.participants:
+                p.prepare_status = wal_entry['votes'].get(p.name)
+            decision = 'COMMIT'
+        else:
+            outcomes = tpc.query_status()
+            for p in tpc.participants:
+                p.prepare_status = 'READY' if outcomes.get(p.name) == 'PREPARED' else None
+            if any(o == 'COMMITTED' for o in outcomes.values()):
+                decision = 'COMMIT'
+            elif any(o == 'UNREACHABLE' for o in outcomes.values()):
+                return None
+            else:
+                decision = 'ABORT'
+        if not tpc.resend_decision(decision, transfer):
+            return None
+        return 'COMMITTED' if decision == 'COMMIT' else 'ABORTED'
+
+    @staticmethod
+    def reconcile_stuck(age_minutes: Optional[int] = None, batch_size: Optional[int] = None,
+                        max_batches: Optional[int] = None):
+        """Resuelve transacciones PREPARED que exceden el umbral de edad.
 
-        Proporciona una acción de limpieza para transacciones estancadas.
+        Recorre solo las candidatas vencidas con una consulta por rango sobre el
+        índice (status, created_at), en lotes acotados y con cursor, de modo que
+        las que siguen en duda no bloquean el avance. Cada lote se actualiza en
+        una sola transacción de BD. También reenvía la decisión de las entradas
+        vencidas que siguen sin END en el log del coordinador (`_replay`).
         """
+        age_minutes = settings.reconcile_age_minutes if age_minutes is None else age_minutes
+        batch_size = batch_size or settings.reconcile_batch_size
+        max_batches = max_batches or settings.reconcile_max_batches
         cutoff = datetime.utcnow() - timedelta(minutes=age_minutes)
-        with DBSession() as s:
-            statement = select(TransactionLog).where(TransactionLog.status == 'PREPARED')
-            stuck = s.exec(statement).all()
-            actions = []
-            for log in stuck:
-                if log.created_at < cutoff:
-                    log.status = 'ABORTED'
-                    log.updated_at = datetime.utcnow()
-                    actions.append({'tx_id': log.tx_id, 'action': 'ABORTED'})
-            s.commit()
+        wal_entries = {e['tx_id']: e for e in coordinator_log.unfinished()}
+        actions = []
+        cursor = None
+        for _ in range(max_batches):
+            statement = select(TransactionLog).where(
+                TransactionLog.status == 'PREPARED', TransactionLog.created_at < cutoff
+            )
+            if cursor:
+                statement = statement.where(or_(
+                    TransactionLog.created_at > cursor[0],
+                    and_(TransactionLog.created_at == cursor[0], TransactionLog.id > cursor[1]),
+                ))
+            statement = statement.order_by(TransactionLog.created_at, TransactionLog.id).limit(batch_size)
+            with DBSession(readonly=True) as s:
+                candidates = s.exec(statement).all()
+            if not candidates:
+                break
+            cursor = (candidates[-1].created_at, candidates[-1].id)
+            resolved, ended = {}, []
+            for log in candidates:
+                outcome = TransactionService._resolve_in_doubt(log, wal_entries.get(log.tx_id))
+                actions.append({'tx_id': log.tx_id, 'action': outcome or 'IN_DOUBT'})
+                if outcome:
+                    resolved[log.id] = outcome
+                    if log.tx_id in wal_entries:
+                        ended.append(log.tx_id)
+            if resolved:
+                now = datetime.utcnow()
+                with DBSession() as s:
+                    for log in s.exec(select(TransactionLog).where(TransactionLog.id.in_(resolved))).all():
+                        old_status = log.status
+                        log.status = resolved[log.id]
+                        log.updated_at = now
+                        s.add(log)
+                        tx_stats.status_changed(s, log, old_status)
+                    with metrics.db_commit_seconds.time(operation='reconcile'):
+                        s.commit()
+                if ended:
+                    coordinator_log.end_many(ended)
+            if len(candidates) < batch_size:
+                break
+        done = {a['tx_id'] for a in actions}
+        pending = {tx_id: e for tx_id, e in wal_entries.items() if tx_id not in done}
+        actions.extend(TransactionService._replay_stale(pending, cutoff, batch_size * max_batches))
         return actions
 
     @staticmethod
-    def list_transactions(limit: int = 50):
-        """Lista transacciones recientes limitadas por 'limit'."""
-        with DBSession() as s:
-            statement = select(TransactionLog).order_by(TransactionLog.id.desc()).limit(limit)
+    def _replay_stale(wal_entries: Dict[str, dict], cutoff: datetime, limit: int) -> List[dict]:
+        """Reenvía (`_replay`) las entradas sin END del log del coordinador anteriores a `cutoff`.
+
+        Cubre entregas asíncronas que agotaron REDELIVERY_MAX_ATTEMPTS, decisiones
+        cuya fila de `TransactionLog` no llegó a insertarse y ROLLBACK perdidos.
+        """
+        cutoff_ts = (cutoff - datetime(1970, 1, 1)).total_seconds()
+        actions = []
+        for entry in wal_entries.values():
+            if len(actions) >= limit:
+                break
+            if entry['begin']['ts'] >= cutoff_ts or redelivery_queue.in_progress(entry['tx_id']):
+                continue
+            result = TransactionService._replay(entry)
+            outcome = 'COMMITTED' if result['action'] == 'COMMIT' else 'ABORTED'
+            actions.append({'tx_id': result['tx_id'], 'action': outcome if result['acknowledged'] else 'IN_DOUBT'})
+        return actions
+
+    @staticmethod
+    def reconcile_backlog(age_minutes: Optional[int] = None) -> int:
+        """Cuenta transacciones PREPARED vencidas pendientes de reconciliar (consulta indexada)."""
+        age_minutes = settings.reconcile_age_minutes if age_minutes is None else age_minutes
+        cutoff = datetime.utcnow() - timedelta(minutes=age_minutes)
+        with DBSession(readonly=True) as s:
+            statement = select(func.count()).select_from(TransactionLog).where(
+                TransactionLog.status == 'PREPARED', TransactionLog.created_at < cutoff
+            )
+            return s.exec(statement).one()
+
+    @staticmethod
+    def _filtered(statement, status: Optional[str], since: Optional[datetime], until: Optional[datetime]):
+        """Aplica filtros opcionales de estado y rango de created_at [since, until)."""
+        if status:
+            statement = statement.where(TransactionLog.status == status)
+        if since:
+            statement = statement.where(TransactionLog.created_at >= since)
+        if until:
+            statement = statement.where(TransactionLog.created_at < until)
+        return statement
+
+    @staticmethod
+    def list_transactions(limit: int = 50, cursor: Optional[int] = None, status: Optional[str] = None,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None):
+        """Lista transacciones de la más reciente a la más antigua, paginando por id.
+
+        `cursor` es el id de la última fila de la página anterior; se devuelven
+        filas con id menor (paginación keyset, sin OFFSET). Solo se leen las
+        columnas del listado, no el snapshot de participantes.
+        """
+        columns = (TransactionLog.id, TransactionLog.tx_id, TransactionLog.status, TransactionLog.created_at)
+        statement = TransactionService._filtered(select(*columns), status, since, until)
+        if cursor is not None:
+            statement = statement.where(TransactionLog.id < cursor)
+        statement = statement.order_by(TransactionLog.id.desc()).limit(limit)
+        with DBSession(readonly=True) as s:
+            return s.exec(statement).all()
+
+    @staticmethod
+    def list_outcomes(limit: int = 50, cursor: Optional[int] = None, participant: Optional[str] = None,
+                      prepare_status: Optional[str] = None, commit_status: Optional[str] = None,
+                      error_class: Optional[str] = None, since: Optional[datetime] = None,
+                      until: Optional[datetime] = None) -> List[ParticipantOutcome]:
+        """Lista resultados de participantes (más recientes primero) filtrando por
+        participante, estado de cada fase, clase de error y rango de fechas.
+
+        Pagina por id igual que `list_transactions`; los filtros por
+        participante usan los índices (participant, estado).
+        """
+        statement = select(ParticipantOutcome)
+        for column, value in ((ParticipantOutcome.participant, participant),
+                              (ParticipantOutcome.prepare_status, prepare_status),
+                              (ParticipantOutcome.commit_status, commit_status),
+                              (ParticipantOutcome.error_class, error_class)):
+            if value:
+                statement = statement.where(column == value)
+        if since:
+            statement = statement.where(ParticipantOutcome.created_at >= since)
+        if until:
+            statement = statement.where(ParticipantOutcome.created_at < until)
+        if cursor is not None:
+            statement = statement.where(ParticipantOutcome.id < cursor)
+        statement = statement.order_by(ParticipantOutcome.id.desc()).limit(limit)
+        with DBSession(readonly=True) as s:
             return s.exec(statement).all()
+
+    @staticmethod
+    def outcome_stats(participant: Optional[str] = None, since: Optional[datetime] = None,
+                      until: Optional[datetime] = None) -> Dict[str, dict]:
+        """Agrega resultados por participante: total y conteos por estado de
+        PREPARE, estado de COMMIT y clase de error (un solo GROUP BY en BD).
+        """
+        columns = (ParticipantOutcome.participant, ParticipantOutcome.prepare_status,
+                   ParticipantOutcome.commit_status, ParticipantOutcome.error_class)
+        statement = select(*columns, func.count()).group_by(*columns)
+        if participant:
+            statement = statement.where(ParticipantOutcome.participant == participant)
+        if since:
+            statement = statement.where(ParticipantOutcome.created_at >= since)
+        if until:
+            statement = statement.where(ParticipantOutcome.created_at < until)
+        with DBSession(readonly=True) as s:
+            rows = s.exec(statement).all()
+        stats: Dict[str, dict] = {}
+        for name, prepare, commit, err, count in rows:
+            entry = stats.setdefault(name, {'total': 0, 'prepare_status': {}, 'commit_status': {}, 'error_class': {}})
+            entry['total'] += count
+            for key, value in (('prepare_status', prepare), ('commit_status', commit), ('error_class', err)):
+                if value is not None:
+                    entry[key][value] = entry[key].get(value, 0) + count
+        return stats
+
+    @staticmethod
+    def migrate_participants(chunk_size: int = 500) -> int:
+        """Pasa el JSON `participants` de filas antiguas a ParticipantOutcome.
+
+        Procesa por bloques de `chunk_size`; cada bloque inserta sus filas y
+        vacía la columna JSON en la misma transacción, así que puede
+        interrumpirse y reanudarse. Retorna cuántas transacciones migró.
+        """
+        migrated = 0
+        while True:
+            statement = select(TransactionLog).where(TransactionLog.participants != '').order_by(TransactionLog.id).limit(chunk_size)
+            with DBSession() as s:
+                rows = s.exec(statement).all()
+                if not rows:
+                    return migrated
+                for log in rows:
+                    if not log.outcomes:
+                        s.add_all(_outcomes(log.tx_id, json.loads(log.participants), log.created_at))
+                    log.participants = ''
+                    s.add(log)
+                with metrics.db_commit_seconds.time(operation='migrate'):
+                    s.commit()
+            migrated += len(rows)
+
+    @staticmethod
+    def iter_transactions(chunk_size: int, status: Optional[str] = None,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None):
+        """Genera todas las transacciones que cumplen los filtros en orden de id.
+
+        Lee por bloques de `chunk_size` con keyset sobre id y una sesión corta
+        por bloque, de modo que la memoria es constante sin importar el total.
+        """
+        last_id = 0
+        while True:
+            statement = TransactionService._filtered(select(TransactionLog), status, since, until)
+            statement = statement.where(TransactionLog.id > last_id).order_by(TransactionLog.id).limit(chunk_size)
+            with DBSession(readonly=True) as s:
+                rows = s.exec(statement).all()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1].id
+            if len(rows) < chunk_size:
+                return
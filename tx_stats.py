@@ -0,0 +1,297 @@
+"""Agregados incrementales del log de transacciones para `/transactions/stats`.
+
+Cada escritura de `TransactionLog` (`start_transfer`, `start_batch`,
+`recover`, `reconcile_stuck`) actualiza, en la misma transacción de BD, una
+fila de `TransactionStat` por cada contador afectado:
+  - status: transacciones por estado.
+  - bucket: transacciones por bucket de `STATS_BUCKET_SEC` (según created_at) y estado.
+  - participant: transacciones, abortadas y votos en contra por participante.
+  - latency: histograma de la duración total con límites fijos (LATENCY_BOUNDS_MS).
+
+La consulta lee solo esas filas (un rango del índice (kind, key) para los
+buckets), así que su costo no depende del tamaño del log. `rebuild` recalcula
+todo desde `TransactionLog` leyendo una instantánea fuera del lock de escritura;
+también se ejecuta al arrancar si la tabla de agregados está vacía y el log no.
+
+Uso (desde la raíz del proyecto):
+  python -m tx_stats --rebuild [--chunk-size 1000]
+"""
+
+import argparse
+import json
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, insert, or_, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlmodel import select
+from config import get_settings
+from database import DBSession
+from models import TransactionLog, TransactionStat
+import metrics
+
+settings = get_settings()
+
+# Límites superiores (ms) de los buckets de latencia; el último bucket es +Inf.
+LATENCY_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+_EPOCH = datetime(1970, 1, 1)
+# Margen sobre el inicio de `rebuild` para las filas a revisar al reemplazar: updated_at
+# se asigna antes del commit, así que un cambio confirmado tras la instantánea puede
+# tener un updated_at algo anterior a ella.
+_REBUILD_SLACK = timedelta(seconds=60)
+
+# _bucket_start: Inicio del bucket de throughput que contiene `ts` (UTC sin zona).
+def _bucket_start(ts: datetime) -> datetime:
+    width = settings.stats_bucket_sec
+    seconds = int((ts - _EPOCH).total_seconds()) // width * width
+    return _EPOCH + timedelta(seconds=seconds)
+
+# _bucket_key: Clave del bucket de throughput: '<inicio ISO>|<estado>' (ordenable como texto).
+def _bucket_key(ts: datetime, status: str) -> str:
+    return f"{_bucket_start(ts):%Y-%m-%dT%H:%M:%S}|{status}"
+
+# _latency_key: Límite superior del bucket de latencia que contiene `ms`.
+def _latency_key(ms: float) -> str:
+    for bound in LATENCY_BOUNDS_MS:
+        if ms <= bound:
+            return str(bound)
+    return '+Inf'
+
+# _voted_against: Indica si el participante votó en contra o no respondió (PREPARE o one-phase).
+def _voted_against(state: dict) -> bool:
+    if state.get('prepare_status') in ('ABORT', 'ERROR', 'UNREACHABLE'):
+        return True
+    return state.get('prepare_status') is None and state.get('commit_status') == 'ABORT'
+
+# _total_ms: Duración total registrada en TransactionLog.timings (None si no hay desglose).
+def _total_ms(log: TransactionLog) -> Optional[float]:
+    if not log.timings:
+        return None
+    return json.loads(log.timings).get('total_ms')
+
+# _begin_snapshot: Fija una única instantánea de lectura para el resto de la sesión `s`.
+# pysqlite no abre transacción para SELECT (cada consulta vería datos distintos), así que
+# en SQLite se emite BEGIN; en los demás motores se usa REPEATABLE READ.
+def _begin_snapshot(s):
+    if s.get_bind().dialect.name == 'sqlite':
+        s.connection().exec_driver_sql('BEGIN')
+    else:
+        s.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+
+# _percentile: Percentil `q` interpolando dentro del bucket (como histogram_quantile).
+def _percentile(counts: List[int], q: float) -> Optional[float]:
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative, lower = 0, 0.0
+    for bound, count in zip(LATENCY_BOUNDS_MS + (None,), counts):
+        if count and cumulative + count >= rank:
+            if bound is None:
+                return float(lower)
+            return round(lower + (bound - lower) * (rank - cumulative) / count, 2)
+        cumulative += count
+        lower = bound if bound is not None else lower
+    return float(lower)
+
+class TransactionStats:
+    """Mantiene y consulta los contadores de TransactionStat."""
+
+    # record: Suma una transacción nueva a los agregados (dentro de la sesión que la inserta).
+    # `latency_ms` tiene prioridad sobre el total_ms de `timings`.
+    def record(self, s, log: TransactionLog, latency_ms: Optional[float] = None):
+        if latency_ms is None:
+            latency_ms = _total_ms(log)
+        self._apply(s, self._deltas(log, log.status, 1, latency_ms))
+
+    # record_many: Suma varias transacciones nuevas con una sola actualización de contadores
+    # (latencia tomada de `timings`).
+    def record_many(self, s, logs: List[TransactionLog]):
+        deltas: Dict[Tuple[str, str], int] = {}
+        for log in logs:
+            for key, value in self._deltas(log, log.status, 1, _total_ms(log)).items():
+                deltas[key] = deltas.get(key, 0) + value
+        self._apply(s, deltas)
+
+    # status_changed: Mueve una transacción existente de `old_status` a su estado actual.
+    def status_changed(self, s, log: TransactionLog, old_status: str):
+        if old_status == log.status:
+            return
+        deltas = self._deltas(log, old_status, -1)
+        for key, value in self._deltas(log, log.status, 1).items():
+            deltas[key] = deltas.get(key, 0) + value
+        self._apply(s, deltas)
+
+    # snapshot: Conteos por estado, throughput de los últimos `buckets` buckets, tasa de
+    # aborto por participante y percentiles de latencia. Lee un número acotado de filas.
+    def snapshot(self, buckets: int = 60) -> Dict:
+        now = _bucket_start(datetime.utcnow())
+        width = settings.stats_bucket_sec
+        first = now - timedelta(seconds=width * (buckets - 1))
+        with DBSession(readonly=True) as s:
+            fixed = s.exec(select(TransactionStat).where(
+                TransactionStat.kind.in_(('status', 'participant', 'latency'))
+            )).all()
+            ranged = s.exec(select(TransactionStat).where(
+                TransactionStat.kind == 'bucket', TransactionStat.key >= f"{first:%Y-%m-%dT%H:%M:%S}|"
+            )).all()
+        by_status: Dict[str, int] = {}
+        participants: Dict[str, Dict[str, float]] = {}
+        latency: Dict[str, int] = {}
+        for row in fixed:
+            if row.kind == 'status':
+                if row.value:
+                    by_status[row.key] = row.value
+            elif row.kind == 'participant':
+                name, counter = row.key.rsplit('|', 1)
+                participants.setdefault(name, {'transactions': 0, 'aborted': 0, 'negative_votes': 0})[counter] = row.value
+            else:
+                latency[row.key] = row.value
+        for entry in participants.values():
+            entry['abort_rate'] = round(entry['aborted'] / entry['transactions'], 4) if entry['transactions'] else 0.0
+        series = {first + timedelta(seconds=width * i): {} for i in range(buckets)}
+        for row in ranged:
+            start, status = row.key.split('|', 1)
+            counts = series.get(datetime.fromisoformat(start))
+            if counts is not None and row.value:
+                counts[status] = row.value
+        counts = [latency.get(str(b), 0) for b in LATENCY_BOUNDS_MS] + [latency.get('+Inf', 0)]
+        return {
+            "status": by_status,
+            "total": sum(by_status.values()),
+            "throughput": {
+                "bucket_sec": width,
+                "buckets": [
+                    {"start": start, "total": sum(c.values()), "per_sec": round(sum(c.values()) / width, 3), "status": c}
+                    for start, c in series.items()
+                ],
+            },
+            "participants": participants,
+            "latency_ms": {
+                "count": sum(counts),
+                "p50": _percentile(counts, 0.5),
+                "p90": _percentile(counts, 0.9),
+                "p99": _percentile(counts, 0.99),
+                "buckets": dict(zip([str(b) for b in LATENCY_BOUNDS_MS] + ['+Inf'], counts)),
+            },
+        }
+
+    # rebuild: Recalcula todos los agregados desde TransactionLog. El recorrido se hace por
+    # lotes sobre una instantánea de lectura, sin el lock de escritura; después una
+    # transacción de escritura corta corrige las filas creadas o modificadas desde la
+    # instantánea (resta su versión vieja y suma la actual) y reemplaza los contadores.
+    # Retorna cuántas transacciones recorrió.
+    def rebuild(self, chunk_size: int = 1000) -> int:
+        totals: Dict[Tuple[str, str], int] = {}
+        scanned, cursor = 0, 0
+        since = datetime.utcnow() - _REBUILD_SLACK
+        with DBSession(readonly=True) as snapshot:
+            _begin_snapshot(snapshot)
+            while True:
+                rows = snapshot.exec(select(TransactionLog).where(TransactionLog.id > cursor)
+                                     .order_by(TransactionLog.id).limit(chunk_size)).all()
+                if not rows:
+                    break
+                self._add(totals, rows, 1)
+                scanned += len(rows)
+                cursor = rows[-1].id
+                snapshot.expunge_all()
+            with DBSession() as s:
+                # Se borra primero para tomar el lock de escritura antes de buscar los cambios.
+                s.exec(delete(TransactionStat))
+                changed = s.exec(select(TransactionLog).where(
+                    or_(TransactionLog.id > cursor, TransactionLog.updated_at >= since)
+                )).all()
+                for start in range(0, len(changed), chunk_size):
+                    ids = [log.id for log in changed[start:start + chunk_size]]
+                    self._add(totals, snapshot.exec(select(TransactionLog).where(TransactionLog.id.in_(ids))).all(), -1)
+                self._add(totals, changed, 1)
+                s.add_all(TransactionStat(kind=kind, key=key, value=value)
+                          for (kind, key), value in totals.items() if value)
+                with metrics.db_commit_seconds.time(operation='stats_rebuild'):
+                    s.commit()
+        return scanned
+
+    # ensure_built: Reconstruye si hay transacciones pero aún no hay agregados (primer arranque).
+    def ensure_built(self) -> bool:
+        with DBSession(readonly=True) as s:
+            if s.exec(select(TransactionStat.id).limit(1)).first() is not None:
+                return False
+            if s.exec(select(TransactionLog.id).limit(1)).first() is None:
+                return False
+        self.rebuild()
+        return True
+
+    # _add: Acumula en `totals` los contadores de `logs` con signo `sign`.
+    def _add(self, totals: Dict[Tuple[str, str], int], logs: List[TransactionLog], sign: int):
+        for log in logs:
+            for key, value in self._deltas(log, log.status, sign, _total_ms(log)).items():
+                totals[key] = totals.get(key, 0) + value
+
+    # _deltas: Incrementos que aporta `log` con estado `status` (signo +1 o -1).
+    @staticmethod
+    def _deltas(log: TransactionLog, status: str, sign: int,
+                latency_ms: Optional[float] = None) -> Dict[Tuple[str, str], int]:
+        deltas: Dict[Tuple[str, str], int] = {}
+
+        def add(kind: str, key: str):
+            deltas[(kind, key)] = deltas.get((kind, key), 0) + sign
+
+        add('status', status)
+        add('bucket', _bucket_key(log.created_at, status))
+        for p in log.participant_states():
+            add('participant', f"{p['name']}|transactions")
+            if status == 'ABORTED':
+                add('participant', f"{p['name']}|aborted")
+            if _voted_against(p):
+                add('participant', f"{p['name']}|negative_votes")
+        if latency_ms is not None:
+            add('latency', _latency_key(latency_ms))
+        return deltas
+
+    # _apply: Suma los incrementos con un upsert del dialecto (ON CONFLICT en SQLite/PostgreSQL,
+    # ON DUPLICATE KEY en MySQL): crea las filas que faltan y suma sobre las existentes sin
+    # leerlas antes, así que dos procesos que crean el mismo contador no chocan en el índice
+    # único. En otros motores hace UPDATE y luego INSERT de las claves que no existían.
+    @staticmethod
+    def _apply(s, deltas: Dict[Tuple[str, str], int]):
+        rows = [{'kind': kind, 'key': key, 'value': value} for (kind, key), value in deltas.items() if value]
+        if not rows:
+            return
+        dialect = s.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            statement = (sqlite if dialect == 'sqlite' else postgresql).insert(TransactionStat).values(rows)
+            s.exec(statement.on_conflict_do_update(
+                index_elements=['kind', 'key'],
+                set_={'value': TransactionStat.value + statement.excluded.value},
+            ))
+        elif dialect in ('mysql', 'mariadb'):
+            statement = mysql.insert(TransactionStat).values(rows)
+            s.exec(statement.on_duplicate_key_update(value=TransactionStat.value + statement.inserted.value))
+        else:
+            missing = []
+            for row in rows:
+                result = s.exec(update(TransactionStat).where(
+                    TransactionStat.kind == row['kind'], TransactionStat.key == row['key']
+                ).values(value=TransactionStat.value + row['value']))
+                if not result.rowcount:
+                    missing.append(row)
+            if missing:
+                s.exec(insert(TransactionStat).values(missing))
+
+# Instancia compartida por TransactionService y los endpoints.
+tx_stats = TransactionStats()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rebuild', action='store_true', help='Recalcula los agregados desde TransactionLog')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--buckets', type=int, default=60, help='Buckets de throughput a mostrar')
+    args = parser.parse_args()
+    from database import init_db
+    init_db()
+    if args.rebuild:
+        print(json.dumps({'rebuilt_from': tx_stats.rebuild(args.chunk_size)}))
+    print(json.dumps(tx_stats.snapshot(args.buckets), default=str, indent=2))
+
+if __name__ == '__main__':
+    main()